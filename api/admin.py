@@ -471,6 +471,11 @@ class CronJobAdmin(admin.ModelAdmin):
     list_filter = ('status', 'name')
 
 
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_success_at', 'next_due_at', 'locked_until')
+    readonly_fields = ('last_success_at', 'last_error')
+
+
 class EmergencyOperationsDatasetAdmin(admin.ModelAdmin):
     search_fields = ('file_name', 'raw_file_name', 'appeal_number',)
     list_display = ('file_name', 'raw_file_name', 'raw_file_url', 'appeal_number', 'is_validated',)
@@ -904,5 +909,6 @@ admin.site.register(models.EmergencyOperationsPeopleReached, EmergencyOperations
 admin.site.register(models.EmergencyOperationsFR, EmergencyOperationsFRAdmin)
 admin.site.register(models.EmergencyOperationsEA, EmergencyOperationsEAAdmin)
 admin.site.register(models.CronJob, CronJobAdmin)
+admin.site.register(models.ScheduledJob, ScheduledJobAdmin)
 admin.site.site_url = 'https://' + os.environ.get('FRONTEND_URL')
 admin.widgets.RelatedFieldWidgetWrapper.template_name = 'related_widget_wrapper.html'
@@ -0,0 +1,212 @@
+import json
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist, FieldError, ValidationError
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import TruncMonth, TruncYear
+from django.utils import timezone
+
+from .models import VisibilityChoices
+from .rollups import ROLLUP_SOURCES, get_location_fields, get_source_model
+
+# One aggregate requested from the batch endpoint
+AggregateSpec = namedtuple('AggregateSpec', ('id', 'model_type', 'unit', 'group_by', 'sums', 'filters', 'start_date'))
+
+GROUP_BY_DIMENSIONS = ('country', 'region', 'dtype')
+# Rows the (anonymous) batch endpoint may count, by model type
+PUBLIC_FILTERS = {
+    'fieldreport': {'visibility': VisibilityChoices.PUBLIC},
+}
+UNITS = {
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+SUMMABLE_FIELDS = ('IntegerField', 'BigIntegerField', 'PositiveIntegerField', 'SmallIntegerField', 'DecimalField', 'FloatField')
+
+
+def parse_spec(raw):
+    """AggregateSpec of a request body item, raises ValueError if it is not valid"""
+    if not isinstance(raw, dict) or not raw.get('id'):
+        raise ValueError('Each spec must be an object with an `id`')
+    spec_id = str(raw['id'])
+    model_type = raw.get('model_type')
+    if model_type not in ROLLUP_SOURCES:
+        raise ValueError('%s: `model_type` must be one of %s' % (spec_id, ', '.join(ROLLUP_SOURCES)))
+    model = get_source_model(ROLLUP_SOURCES[model_type])
+
+    unit = raw.get('unit')
+    if unit is not None and unit not in UNITS:
+        raise ValueError('%s: `unit` must be `month` or `year`' % spec_id)
+
+    group_by = raw.get('group_by') or []
+    if not isinstance(group_by, list) or set(group_by) - set(GROUP_BY_DIMENSIONS):
+        raise ValueError('%s: `group_by` must be a list of %s' % (spec_id, ', '.join(GROUP_BY_DIMENSIONS)))
+
+    sums = raw.get('sums') or {}
+    if not isinstance(sums, dict):
+        raise ValueError('%s: `sums` must map output names to fields' % spec_id)
+    for name, field in sums.items():
+        try:
+            internal_type = model._meta.get_field(field).get_internal_type()
+        except (FieldDoesNotExist, TypeError):
+            internal_type = None
+        if internal_type not in SUMMABLE_FIELDS or name in ('count', 'timespan') + GROUP_BY_DIMENSIONS:
+            raise ValueError('%s: can not sum `%s` as `%s`' % (spec_id, field, name))
+
+    filters = raw.get('filters') or {}
+    if not isinstance(filters, dict):
+        raise ValueError('%s: `filters` must be an object' % spec_id)
+    filters = dict(get_filter(model, key, spec_id, value) for key, value in filters.items())
+
+    start_date = raw.get('start_date')
+    if start_date is not None:
+        try:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            raise ValueError('%s: `start_date` must be YYYY-MM-DD format' % spec_id)
+
+    return AggregateSpec(
+        spec_id, model_type, unit, tuple(OrderedDict.fromkeys(group_by)), sums, filters, start_date)
+
+
+def get_filter(model, key, spec_id, value):
+    """
+    The (lookup, value) of a filter, on a local field of the model or a
+    dimension, with at most one lookup type and no relation traversed; raises
+    ValueError otherwise
+    """
+    name, _, lookup = key.partition('__')
+    if name in ('country', 'region'):
+        name = get_dimension_field(model, name)
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = None
+    allowed = field is not None and field.model is model and (
+        field.concrete or name in (get_dimension_field(model, 'country'), get_dimension_field(model, 'region'))
+    )
+    if not allowed or (lookup and ('__' in lookup or field.get_lookup(lookup) is None)):
+        raise ValueError('%s: can not filter by `%s`' % (spec_id, key))
+    return ('%s__%s' % (name, lookup) if lookup else name), value
+
+
+def get_dimension_field(model, dimension):
+    if dimension == 'dtype':
+        return 'dtype'
+    country_field, region_field, many_to_many = get_location_fields(model)
+    return country_field if dimension == 'country' else region_field
+
+
+def get_statement_key(spec):
+    """Specs with the same key read the same rows and share one statement"""
+    model = get_source_model(ROLLUP_SOURCES[spec.model_type])
+    joins = frozenset(
+        dimension for dimension in spec.group_by
+        if model._meta.get_field(get_dimension_field(model, dimension)).many_to_many
+    )
+    return (spec.model_type, json.dumps(spec.filters, sort_keys=True), spec.start_date, joins)
+
+
+def get_spec_columns(spec):
+    return (('_unit_%s' % spec.unit,) if spec.unit else ()) + tuple('_by_%s' % dimension for dimension in spec.group_by)
+
+
+def run_statement(specs):
+    """Results of specs sharing a statement key, as {spec id: [row, ...]}"""
+    first = specs[0]
+    source = ROLLUP_SOURCES[first.model_type]
+    model = get_source_model(source)
+
+    queryset = model.objects.filter(**PUBLIC_FILTERS.get(first.model_type, {})).filter(**first.filters)
+    if first.start_date is not None:
+        queryset = queryset.filter(**{'%s__gte' % source.date_field: first.start_date})
+
+    columns = OrderedDict()
+    for spec in specs:
+        if spec.unit:
+            columns['_unit_%s' % spec.unit] = UNITS[spec.unit](source.date_field, tzinfo=timezone.utc)
+        for dimension in spec.group_by:
+            columns['_by_%s' % dimension] = F(get_dimension_field(model, dimension))
+    measures = OrderedDict()
+    for spec in specs:
+        for field in spec.sums.values():
+            measures['_sum_%s' % field] = F(field)
+
+    try:
+        subquery, params = queryset.values(_row=F('id'), **columns, **measures).query.sql_with_params()
+    except EmptyResultSet:
+        return {spec.id: [] for spec in specs}
+
+    quote = connection.ops.quote_name
+    column_names = list(columns)
+    grouping_sets = list(OrderedDict.fromkeys(get_spec_columns(spec) for spec in specs))
+    select = [quote(name) for name in column_names]
+    if column_names:
+        select.append('GROUPING(%s)' % ', '.join(quote(name) for name in column_names))
+    select.append('COUNT(*)')
+    select.extend('SUM(%s)' % quote(name) for name in measures)
+    sql = 'SELECT %s FROM (%s) AS aggregate_rows GROUP BY GROUPING SETS (%s)' % (
+        ', '.join(select),
+        subquery,
+        ', '.join('(%s)' % ', '.join(quote(name) for name in grouping_set) for grouping_set in grouping_sets),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    # GROUPING() has a bit set, from the left, for each column a row is not grouped by
+    results = {spec.id: [] for spec in specs}
+    for spec in specs:
+        grouped = set(get_spec_columns(spec))
+        mask = sum(
+            1 << (len(column_names) - 1 - index) for index, name in enumerate(column_names) if name not in grouped
+        )
+        offset = len(column_names) + (1 if column_names else 0)
+        for row in rows:
+            if column_names and row[len(column_names)] != mask:
+                continue
+            values = dict(zip(column_names, row))
+            item = OrderedDict()
+            if spec.unit:
+                timespan = values['_unit_%s' % spec.unit]
+                if timespan is not None and timezone.is_naive(timespan):
+                    timespan = timezone.make_aware(timespan, timezone.utc)
+                item['timespan'] = timespan
+            for dimension in spec.group_by:
+                item[dimension] = values['_by_%s' % dimension]
+            item['count'] = row[offset]
+            sums = dict(zip(measures, row[offset + 1:]))
+            for name, field in spec.sums.items():
+                item[name] = sums['_sum_%s' % field]
+            results[spec.id].append(item)
+        sort_keys = ('timespan',) + spec.group_by
+        results[spec.id].sort(key=lambda item: [(item[key] is None, item[key]) for key in sort_keys if key in item])
+    return results
+
+
+def run_aggregate_specs(raw_specs):
+    """
+    Runs a batch of aggregate specs. Specs over the same model, filters and
+    many-to-many joins are compiled into a single GROUPING SETS statement, so
+    the table is scanned once for all of them. Raises ValueError for an invalid
+    batch.
+    """
+    if not isinstance(raw_specs, list) or not raw_specs:
+        raise ValueError('`specs` must be a non-empty list')
+    specs = [parse_spec(raw) for raw in raw_specs]
+    if len(set(spec.id for spec in specs)) != len(specs):
+        raise ValueError('Spec ids must be unique')
+
+    statements = OrderedDict()
+    for spec in specs:
+        statements.setdefault(get_statement_key(spec), []).append(spec)
+
+    results = {}
+    for statement_specs in statements.values():
+        try:
+            results.update(run_statement(statement_specs))
+        except (FieldError, FieldDoesNotExist, ValidationError, ValueError, TypeError) as e:
+            raise ValueError('Invalid filters: %s' % e)
+    return results
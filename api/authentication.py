@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# What is kept per token key. The user itself is read by pk on every request,
+# so a deactivated user is refused and no stale row is ever saved back.
+TokenEntry = namedtuple('TokenEntry', (
+    'user_id',
+    'token_created',
+    'expires',
+))
+
+
+class TokenCache():
+    """
+    Per-process LRU of token key -> TokenEntry, bounded to `max_size` entries
+    which are dropped `timeout` seconds after being read from the database.
+    Tokens changed in this process are invalidated right away by api.triggers;
+    other processes pick the change up when the entry expires, so a deleted
+    token keeps authenticating there for up to TOKEN_CACHE_TIMEOUT seconds.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT)
+
+
+def load_token_entry(key):
+    """Cached entry of the token `key`, read from the database on a miss. None if there is no such token."""
+    entry = token_cache.get(key)
+    if entry is not None:
+        return entry
+    token = Token.objects.filter(key=key).values('user_id', 'created').first()
+    if token is None:
+        return None
+    entry = TokenEntry(
+        user_id=token['user_id'],
+        token_created=token['created'],
+        expires=time.monotonic() + token_cache.timeout,
+    )
+    token_cache.set(key, entry)
+    return entry
+
+
+def get_token_user(key):
+    """User owning the token `key` (active or not), or None if there is no such token."""
+    entry = load_token_entry(key)
+    if entry is None:
+        return None
+    return User.objects.filter(pk=entry.user_id).first()
+
+
+def invalidate_token(key):
+    token_cache.invalidate(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication served from the per-process token cache, so an
+    authenticated request only reads the user, by primary key.
+    """
+
+    def authenticate_credentials(self, key):
+        entry = load_token_entry(key)
+        if entry is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user = User.objects.filter(pk=entry.user_id).first()
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token = Token(key=key, user=user, created=entry.token_created)
+        return (user, token)
@@ -0,0 +1,238 @@
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Max
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers, quote_etag
+from django.utils.http import http_date, parse_etags
+from rest_framework.response import Response
+
+from .permission_scope import get_user_scope
+
+VERSION_KEY = 'model-version:%s'
+# Models whose changes bump their version counter (see api.triggers); the cached
+# viewsets, api.reference_data and api.typeahead can only depend on these
+VERSIONED_MODELS = (
+    'api.Action',
+    'api.Appeal',
+    'api.Country',
+    'api.CountryContact',
+    'api.CountryLink',
+    'api.DisasterType',
+    'api.District',
+    'api.Event',
+    'api.EventContact',
+    'api.FieldReport',
+    'api.FieldReportContact',
+    'api.KeyFigure',
+    'api.Region',
+    'api.RegionContact',
+    'api.RegionLink',
+)
+
+
+def _seed():
+    # Seeding with the clock means a flushed cache never reuses an old version
+    return int(time.time() * 1000)
+
+
+def get_model_versions(models):
+    """Current version counter of each model, as a tuple ordered by model label."""
+    labels = sorted(model._meta.label_lower for model in models)
+    keys = [VERSION_KEY % label for label in labels]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _seed(), None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_model_version(model):
+    bump_version(VERSION_KEY % model._meta.label_lower)
+
+
+def check_cache_models(viewset):
+    """Raises ImproperlyConfigured if `viewset` depends on a model without a version counter"""
+    unversioned = set(viewset.cache_models) - set(VERSIONED_MODELS)
+    if unversioned:
+        raise ImproperlyConfigured('%s: %s must be in api.cache.VERSIONED_MODELS' % (
+            viewset.__name__, ', '.join(sorted(unversioned))))
+
+
+def get_cache_models(viewset):
+    return set(apps.get_model(label) for label in viewset.cache_models)
+
+
+def is_shared_cache():
+    """
+    Whether the default cache is shared by the processes, as needed for the
+    version counters bumped by the management commands to reach the web workers
+    """
+    return settings.CACHES['default']['BACKEND'] not in settings.PROCESS_LOCAL_CACHE_BACKENDS
+
+
+def get_version(key):
+    """Current value of a version counter other than a model's"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _seed(), None)
+
+
+def get_visibility_tier(user):
+    if not user.is_authenticated:
+        return 'public'
+    if get_user_scope(user).is_ifrc:
+        return 'ifrc'
+    return 'membership'
+
+
+class CachedResponseMixin():
+    """
+    Caches rendered JSON list/detail responses of read-only viewsets.
+
+    The key covers the full path with query string, the authentication class,
+    the visibility tier and the version counter of every model in
+    `cache_models`, so any change to those models invalidates it.
+    `cache_models` lists the labels of every model the serializers read, all
+    in VERSIONED_MODELS, and `cached_actions` the actions served from the cache.
+    """
+    cache_models = ()
+    cached_actions = ('list', 'retrieve',)
+    cache_timeout = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        check_cache_models(cls)
+
+    def get_response_cache_key(self, request):
+        if request.method != 'GET' or getattr(request.accepted_renderer, 'format', None) != 'json':
+            return None
+        authenticator = request.successful_authenticator
+        parts = [
+            self.__class__.__name__,
+            self.action or '',
+            request.get_full_path(),
+            authenticator.__class__.__name__ if authenticator else '',
+            get_visibility_tier(request.user),
+            str(get_model_versions(get_cache_models(self.__class__))),
+        ]
+        return 'response:%s' % hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request) if self.action in self.cached_actions else None
+        if key is None:
+            return handler(request, *args, **kwargs)
+
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.cache_timeout or settings.RESPONSE_CACHE_TIMEOUT
+
+            def store(rendered):
+                cache.set(key, (rendered.content, rendered['Content-Type']), timeout)
+            response.add_post_render_callback(store)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+
+class ConditionalGetMixin():
+    """
+    Answers conditional GETs (If-None-Match) with 304 before anything is
+    serialized.
+
+    The list validator is the latest `last_modified_field` plus the row count of
+    the filtered queryset, so edits, additions and deletions all change it.
+    Changes to nested models are covered by their version counters, which only
+    a shared cache carries across processes; with a process-local one the ETag
+    also expires every RESPONSE_CACHE_TIMEOUT seconds. If-Modified-Since is
+    ignored, a date can't reflect deletions or changes to nested models.
+    `cache_models` lists the labels of the models the serializers read, as for
+    CachedResponseMixin.
+    """
+    cache_models = ()
+    last_modified_field = 'updated_at'
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        check_cache_models(cls)
+
+    def get_related_versions(self):
+        model = self.get_queryset().model
+        versions = get_model_versions(get_cache_models(self.__class__) - {model})
+        if not is_shared_cache():
+            # Other processes can't bump the counters of a process-local cache
+            versions += (int(time.time() // settings.RESPONSE_CACHE_TIMEOUT),)
+        return versions
+
+    def get_etag(self, request, last_modified, count):
+        parts = [
+            self.__class__.__name__,
+            request.get_full_path(),
+            getattr(request, 'accepted_media_type', ''),
+            get_visibility_tier(request.user),
+            last_modified.isoformat() if last_modified else '',
+            str(count),
+            str(self.get_related_versions()),
+        ]
+        return quote_etag(hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest())
+
+    def is_not_modified(self, request, etag):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return False
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    def conditional_response(self, handler, request, validators, *args, **kwargs):
+        etag = self.get_etag(request, *validators)
+        last_modified = validators[0]
+        if self.is_not_modified(request, etag):
+            response = HttpResponseNotModified()
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        patch_vary_headers(response, ('Authorization', 'Accept'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        validators = self.filter_queryset(self.get_queryset()).aggregate(
+            last_modified=Max(self.last_modified_field),
+            count=Count('id', distinct=True),
+        )
+        return self.conditional_response(
+            super().list, request, (validators['last_modified'], validators['count']), *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+
+        def serialize(request, *args, **kwargs):
+            return Response(self.get_serializer(instance).data)
+        return self.conditional_response(
+            serialize, request, (getattr(instance, self.last_modified_field), instance.pk), *args, **kwargs)
@@ -1,7 +1,6 @@
 from rest_framework.status import HTTP_201_CREATED, HTTP_200_OK
 from rest_framework.generics import GenericAPIView, CreateAPIView, UpdateAPIView
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets
 from rest_framework.decorators import action
@@ -11,7 +10,14 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
 from .event_sources import SOURCES
+from . import reference_data
+from .authentication import CachedTokenAuthentication
 from .exceptions import BadRequest
+from .cache import CachedResponseMixin, ConditionalGetMixin
+from .pagination import KeysetLimitOffsetPagination
+from .prefetch import PrefetchPlannerMixin
+from .streaming import StreamingCSVMixin
+from .values import ValuesListMixin, format_text
 from .view_filters import ListFilter
 from .visibility_class import ReadOnlyVisibilityViewset
 from deployments.models import Personnel
@@ -85,7 +91,7 @@ from .serializers import (
 from .logger import logger
 
 
-class EventDeploymentsViewset(viewsets.ReadOnlyModelViewSet):
+class EventDeploymentsViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = ListEventDeploymentsSerializer
 
     def get_queryset(self):
@@ -99,12 +105,14 @@ class EventDeploymentsViewset(viewsets.ReadOnlyModelViewSet):
             ).values('id', 'type', 'deployments')
 
 
-class DisasterTypeViewset(viewsets.ReadOnlyModelViewSet):
+class DisasterTypeViewset(CachedResponseMixin, StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = DisasterType.objects.all()
+    cache_models = ('api.DisasterType',)
     serializer_class = DisasterTypeSerializer
 
-class RegionViewset(viewsets.ReadOnlyModelViewSet):
+class RegionViewset(CachedResponseMixin, StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Region.objects.all()
+    cache_models = ('api.Region', 'api.RegionContact', 'api.RegionLink',)
     def get_serializer_class(self):
         if self.action == 'list':
             return RegionSerializer
@@ -116,9 +124,10 @@ class CountryFilter(filters.FilterSet):
         model = Country
         fields = ('region',)
 
-class CountryViewset(viewsets.ReadOnlyModelViewSet):
+class CountryViewset(CachedResponseMixin, StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Country.objects.all()
     filter_class = CountryFilter
+    cache_models = ('api.Country', 'api.CountryContact', 'api.CountryLink',)
 
     def get_object(self):
         pk = self.kwargs['pk']
@@ -126,11 +135,9 @@ class CountryViewset(viewsets.ReadOnlyModelViewSet):
             return Country.objects.get(pk=int(pk))
         except ValueError:
             # NOTE: If pk is not integer try searching for name or iso
-            country = Country.objects.filter(
-                models.Q(name__iexact=str(pk)) | models.Q(iso__iexact=str(pk))
-            )
-            if country.exists():
-                return country.first()
+            country = reference_data.countries.lookup('name', pk) or reference_data.countries.lookup('iso', pk)
+            if country is not None:
+                return Country.objects.get(pk=country.pk)
             raise Country.DoesNotExist(
                 'Country matching query does not exist.'
             )
@@ -161,11 +168,12 @@ class RegionKeyFigureFilter(filters.FilterSet):
         model = RegionKeyFigure
         fields = ('region',)
 
-class RegionKeyFigureViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+class RegionKeyFigureViewset(ValuesListMixin, ReadOnlyVisibilityViewset):
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = RegionKeyFigureSerializer
     filter_class = RegionKeyFigureFilter
     visibility_model_class = RegionKeyFigure
+    values_projection = ('region', 'figure', 'deck', 'source', 'visibility', 'id',)
 
 class CountryKeyFigureFilter(filters.FilterSet):
     country = filters.NumberFilter(field_name='country', lookup_expr='exact')
@@ -173,11 +181,12 @@ class CountryKeyFigureFilter(filters.FilterSet):
         model = CountryKeyFigure
         fields = ('country',)
 
-class CountryKeyFigureViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+class CountryKeyFigureViewset(ValuesListMixin, ReadOnlyVisibilityViewset):
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = CountryKeyFigureSerializer
     filter_class = CountryKeyFigureFilter
     visibility_model_class = CountryKeyFigure
+    values_projection = ('country', 'figure', 'deck', 'source', 'visibility', 'id',)
 
 class RegionSnippetFilter(filters.FilterSet):
     region = filters.NumberFilter(field_name='region', lookup_expr='exact')
@@ -185,11 +194,12 @@ class RegionSnippetFilter(filters.FilterSet):
         model = RegionSnippet
         fields = ('region',)
 
-class RegionSnippetViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+class RegionSnippetViewset(ValuesListMixin, ReadOnlyVisibilityViewset):
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = RegionSnippetSerializer
     filter_class = RegionSnippetFilter
     visibility_model_class = RegionSnippet
+    values_projection = ('region', 'snippet', 'image', 'visibility', 'id',)
 
 class CountrySnippetFilter(filters.FilterSet):
     country = filters.NumberFilter(field_name='country', lookup_expr='exact')
@@ -197,11 +207,12 @@ class CountrySnippetFilter(filters.FilterSet):
         model = CountrySnippet
         fields = ('country',)
 
-class CountrySnippetViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+class CountrySnippetViewset(ValuesListMixin, ReadOnlyVisibilityViewset):
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = CountrySnippetSerializer
     filter_class = CountrySnippetFilter
     visibility_model_class = CountrySnippet
+    values_projection = ('country', 'snippet', 'image', 'visibility', 'id',)
 
 class DistrictFilter(filters.FilterSet):
     class Meta:
@@ -209,9 +220,12 @@ class DistrictFilter(filters.FilterSet):
         fields = ('country',)
 
 
-class DistrictViewset(viewsets.ReadOnlyModelViewSet):
+class DistrictViewset(CachedResponseMixin, StreamingCSVMixin, ValuesListMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = District.objects.all()
     filter_class = DistrictFilter
+    cache_models = ('api.District', 'api.Country',)
+    # Same output as MiniDistrictSerializer
+    values_projection = ('name', 'code', 'country_iso', 'country_name', 'id', 'is_enclave',)
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -235,11 +249,20 @@ class EventFilter(filters.FilterSet):
         }
 
 
-class EventViewset(viewsets.ReadOnlyModelViewSet):
+class EventViewset(ConditionalGetMixin, CachedResponseMixin, StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     ordering_fields = (
         'disaster_start_date', 'created_at', 'name', 'summary', 'num_affected', 'glide', 'ifrc_severity_level',
     )
     filter_class = EventFilter
+    pagination_class = KeysetLimitOffsetPagination
+    cursor_ordering_fields = ('disaster_start_date', 'created_at',)
+    cursor_default_ordering = '-disaster_start_date'
+    # Only the minimal list is served from the response cache
+    cached_actions = ('mini_events',)
+    cache_models = (
+        'api.Event', 'api.Appeal', 'api.Country', 'api.DisasterType', 'api.District', 'api.EventContact',
+        'api.FieldReport', 'api.FieldReportContact', 'api.KeyFigure',
+    )
 
     def get_queryset(self):
         if self.action == 'mini_events':
@@ -265,13 +288,14 @@ class EventSnippetFilter(filters.FilterSet):
         model = Snippet
         fields = ('event',)
 
-class EventSnippetViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+class EventSnippetViewset(ValuesListMixin, ReadOnlyVisibilityViewset):
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = SnippetSerializer
     filter_class = EventSnippetFilter
     visibility_model_class = Snippet
+    values_projection = ('event', 'snippet', 'image', 'visibility', 'position', 'id',)
 
-class SituationReportTypeViewset(viewsets.ReadOnlyModelViewSet):
+class SituationReportTypeViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = SituationReportType.objects.all()
     serializer_class = SituationReportTypeSerializer
     ordering_fields = ('type',)
@@ -287,10 +311,13 @@ class SituationReportFilter(filters.FilterSet):
         }
 
 class SituationReportViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     serializer_class = SituationReportSerializer
     ordering_fields = ('created_at', 'name',)
     filter_class = SituationReportFilter
+    pagination_class = KeysetLimitOffsetPagination
+    cursor_ordering_fields = ('created_at',)
+    cursor_default_ordering = '-created_at'
     visibility_model_class = SituationReport
 
 class AppealFilter(filters.FilterSet):
@@ -308,36 +335,33 @@ class AppealFilter(filters.FilterSet):
             'end_date': ('exact', 'gt', 'gte', 'lt', 'lte'),
         }
 
-class AppealViewset(viewsets.ReadOnlyModelViewSet):
+class AppealViewset(ConditionalGetMixin, StreamingCSVMixin, ValuesListMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Appeal.objects.all()
     serializer_class = AppealSerializer
+    last_modified_field = 'modified_at'
     ordering_fields = ('start_date', 'end_date', 'name', 'aid', 'dtype', 'num_beneficiaries', 'amount_requested', 'amount_funded', 'status', 'atype', 'event',)
     filter_class = AppealFilter
-
-    def remove_unconfirmed_event(self, obj):
-        if obj['needs_confirmation']:
-            obj['event'] = None
-        return obj
-
-    def remove_unconfirmed_events(self, objs):
-        return [self.remove_unconfirmed_event(obj) for obj in objs]
-
-    # Overwrite retrieve, list to exclude the event if it requires confirmation
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(self.remove_unconfirmed_events(serializer.data))
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(self.remove_unconfirmed_events(serializer.data))
-
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(self.remove_unconfirmed_event(serializer.data))
+    pagination_class = KeysetLimitOffsetPagination
+    cursor_ordering_fields = ('start_date', 'end_date',)
+    cursor_default_ordering = '-start_date'
+    # Same output as AppealSerializer
+    values_projection = (
+        'aid', 'name',
+        ('dtype', ('name', 'summary', 'id',)),
+        'atype', 'status', 'code', 'sector', 'num_beneficiaries', 'amount_requested', 'amount_funded',
+        'start_date', 'end_date', 'created_at', 'modified_at', 'event', 'needs_confirmation',
+        ('country', ('name', 'iso', 'society_name', 'id', 'record_type',)),
+        ('region', ('name', 'id', ('region_name', 'name', format_text),)),
+        'id',
+    )
+    values_expressions = {
+        # Exclude the event if it requires confirmation
+        'event': models.Case(
+            models.When(needs_confirmation=True, then=models.Value(None)),
+            default=models.F('event'),
+            output_field=models.IntegerField(),
+        ),
+    }
 
 class AppealDocumentFilter(filters.FilterSet):
     appeal = filters.NumberFilter(field_name='appeal', lookup_expr='exact')
@@ -349,23 +373,27 @@ class AppealDocumentFilter(filters.FilterSet):
             'created_at': ('exact', 'gt', 'gte', 'lt', 'lte'),
         }
 
-class AppealDocumentViewset(viewsets.ReadOnlyModelViewSet):
+class AppealDocumentViewset(StreamingCSVMixin, ValuesListMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = AppealDocument.objects.all()
     serializer_class = AppealDocumentSerializer
     ordering_fields = ('created_at', 'name',)
     filter_class = AppealDocumentFilter
+    values_projection = ('created_at', 'name', 'document', 'document_url', 'appeal', 'id',)
+    pagination_class = KeysetLimitOffsetPagination
+    cursor_ordering_fields = ('created_at',)
+    cursor_default_ordering = '-created_at'
 
-class ProfileViewset(viewsets.ModelViewSet):
+class ProfileViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ModelViewSet):
     serializer_class = ProfileSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     def get_queryset(self):
         return Profile.objects.filter(user=self.request.user)
 
 
-class UserViewset(viewsets.ModelViewSet):
+class UserViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ModelViewSet):
     serializer_class = UserSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -395,8 +423,8 @@ class FieldReportFilter(filters.FilterSet):
             'updated_at': ('exact', 'gt', 'gte', 'lt', 'lte'),
         }
 
-class FieldReportViewset(ReadOnlyVisibilityViewset):
-    authentication_classes = (TokenAuthentication,)
+class FieldReportViewset(ConditionalGetMixin, ReadOnlyVisibilityViewset):
+    authentication_classes = (CachedTokenAuthentication,)
     visibility_model_class = FieldReport
     def get_serializer_class(self):
         if self.action == 'list':
@@ -406,13 +434,17 @@ class FieldReportViewset(ReadOnlyVisibilityViewset):
 
     ordering_fields = ('summary', 'event', 'dtype', 'created_at', 'updated_at')
     filter_class = FieldReportFilter
+    pagination_class = KeysetLimitOffsetPagination
+    cursor_ordering_fields = ('created_at', 'updated_at',)
+    cursor_default_ordering = '-created_at'
 
-class ActionViewset(viewsets.ReadOnlyModelViewSet):
+class ActionViewset(CachedResponseMixin, StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Action.objects.all()
+    cache_models = ('api.Action',)
     serializer_class = ActionSerializer
 
 class GenericFieldReportView(GenericAPIView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = FieldReport.objects.all()
 
@@ -559,7 +591,7 @@ class GenericFieldReportView(GenericAPIView):
             )
 
 class CreateFieldReport(CreateAPIView, GenericFieldReportView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = FieldReport.objects.all()
     serializer_class = CreateFieldReportSerializer
@@ -620,7 +652,7 @@ class CreateFieldReport(CreateAPIView, GenericFieldReportView):
         return Response({'id': fieldreport.id}, status=HTTP_201_CREATED)
 
 class UpdateFieldReport(UpdateAPIView, GenericFieldReportView):
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = FieldReport.objects.all()
     serializer_class = CreateFieldReportSerializer
@@ -3,7 +3,17 @@ from elasticsearch import Elasticsearch
 
 host = os.environ.get('ES_HOST')
 if host is not None:
-    ES_CLIENT = Elasticsearch([host])
+    # A bounded pool and short timeouts, so a slow cluster does not hold every worker
+    ES_CLIENT = Elasticsearch(
+        [host],
+        maxsize=int(os.environ.get('ES_MAX_CONNECTIONS', 10)),
+        timeout=float(os.environ.get('ES_TIMEOUT', 5)),
+        max_retries=int(os.environ.get('ES_MAX_RETRIES', 1)),
+        retry_on_timeout=False,
+    )
 else:
     print('Warning: No elasticsearch host found, will not index elasticsearch')
     ES_CLIENT = None
+
+# Timeout of the bulk requests of the indexing commands
+ES_BULK_TIMEOUT = float(os.environ.get('ES_BULK_TIMEOUT', 60))
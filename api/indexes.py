@@ -52,4 +52,5 @@ GenericSetting = {
     }
 }
 
+# Alias of the current page_all_<timestamp> index, moved by index_elasticsearch once a new one is built
 ES_PAGE_NAME = 'page_all'
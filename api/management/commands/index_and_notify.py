@@ -1,28 +1,31 @@
 from datetime import datetime, timezone, timedelta
-from django.db.models import Q, F, ExpressionWrapper, DurationField, Sum
+from django.db import transaction
+from django.db.models import Q
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.template.loader import render_to_string
-from elasticsearch.helpers import bulk
-from api.indexes import ES_PAGE_NAME
-from api.esconnection import ES_CLIENT
-from api.models import Country, Appeal, Event, FieldReport, ActionsTaken, CronJob, CronJobStatus
+from api import reference_data
+from api.summaries import compute_totals, get_summary
+from api.models import Appeal, Event, FieldReport, ChangeOperation, CronJob, CronJobStatus
 from api.logger import logger
+from api.outbox import consume_changes, prune_changes
+from api.scheduler import Schedule, run_job
+from api.search import index_changes, invalidate_search_cache
 from notifications.models import RecordType, SubscriptionType, Subscription, SurgeAlert
 from notifications.hello import get_hello
+from notifications.ledger import group_unsent, prune_sent, record_sent
 from notifications.notification import send_notification
-from deployments.models import PersonnelDeployment, ERU, Personnel
+from notifications.routing import SubscriptionRouter
+from deployments.models import PersonnelDeployment, Personnel
 from main.frontend import frontend_url
 import html
 
-time_interval  = timedelta(minutes = 5)
-time_interva2  = timedelta(   days = 1) # to check: the change was not between time_interval and time_interva2, so that the user don't receive email more frequent than a day.
+time_interva2  = timedelta(   days = 1) # to check: the change was not within the last day, so that the user don't receive email more frequent than a day.
 time_interva7  = timedelta(   days = 7) # for digest mode
-basetime       = int(10314) # weekday - hour - min for digest timing (5 minutes once a week, Monday dawn)
-daily_retro    = int(654) # hour - min for daily retropective email timing (5 minutes a day) | Should not contain a leading 0!
+digest_schedule = Schedule(timedelta(days=7), timedelta(hours=3, minutes=14)) # once a week, Monday dawn (UTC)
+retro_schedule  = Schedule(timedelta(days=1), timedelta(hours=6, minutes=54)) # daily retrospective email
 max_length     = 860 # after this length (at the first space) we cut the sent content
-events_sent_to = {} # to document sent events before re-sending them via specific following
 template_types = {
     99: 'design/generic_notification.html',
     RecordType.FIELD_REPORT: 'design/field_report.html',
@@ -33,20 +36,8 @@ template_types = {
 
 class Command(BaseCommand):
     help = 'Index and send notifications about new/changed records'
-
-    # Digest mode duration is 5 minutes once a week
-    def is_digest_mode(self):
-        today = datetime.utcnow().replace(tzinfo=timezone.utc)
-        weekdayhourmin = int(today.strftime('%w%H%M'))
-        return basetime <= weekdayhourmin and weekdayhourmin < basetime + 5
-
-    def is_retro_mode(self):
-        today = datetime.utcnow().replace(tzinfo=timezone.utc)
-        hourmin = int(today.strftime('%H%M'))
-        return daily_retro <= hourmin and hourmin < daily_retro + 5
-
-    def get_time_threshold(self):
-        return datetime.utcnow().replace(tzinfo=timezone.utc) - time_interval
+    router = None
+    weekly_digest = None
 
     def get_time_threshold2(self):
         return datetime.utcnow().replace(tzinfo=timezone.utc) - time_interva2
@@ -56,32 +47,38 @@ class Command(BaseCommand):
 
     def gather_country_and_region(self, records):
         # Appeals only, since these have a single country/region
-        countries = []
-        regions = []
+        countries = set()
+        regions = set()
         for record in records:
-            if record.country is not None:
-                countries.append('c%s' % record.country.id)
-                if record.country.region is not None:
-                    regions.append('r%s' % record.country.region.id)
-        countries = list(set(countries))
-        regions = list(set(regions))
-        return countries, regions
+            if record.country_id is not None:
+                countries.add('c%s' % record.country_id)
+                country = reference_data.countries.get(record.country_id)
+                if country is not None and country.region_id is not None:
+                    regions.add('r%s' % country.region_id)
+        return list(countries), list(regions)
 
 
     def gather_countries_and_regions(self, records):
         # Applies to emergencies and field reports, which have a
-        # many-to-many relationship to countries and regions
-        countries = []
+        # many-to-many relationship to countries and regions (prefetched)
+        countries = set()
         for record in records:
-            if record.countries is not None:
-                countries += [country.id for country in record.countries.all()]
-        countries = list(set(countries))
-        qs = Country.objects.filter(pk__in=countries)
-        regions = ['r%s' % country.region.id for country in qs if country.region is not None]
+            countries.update(country.id for country in record.countries.all())
+        regions = [
+            'r%s' % country.region_id for country in map(reference_data.countries.get, countries)
+            if country is not None and country.region_id is not None
+        ]
         countries = ['c%s' % id for id in countries]
         return countries, regions
 
 
+    def get_router(self):
+        # Subscriptions are read once per run, whatever the number of record types notified
+        if self.router is None:
+            self.router = SubscriptionRouter()
+        return self.router
+
+
     def gather_subscribers(self, records, rtype, stype):
         # Correction for the new notification types:
         if  rtype == RecordType.EVENT or rtype == RecordType.FIELD_REPORT:
@@ -94,33 +91,27 @@ class Command(BaseCommand):
             rtype_of_subscr = rtype
 
         # Gather the email addresses of users who should be notified
-        if self.is_digest_mode():
-            subscribers = User.objects.filter(subscription__rtype=RecordType.WEEKLY_DIGEST, \
-                                          is_active=True).values('email')
-            # In digest mode we do not care about other circumstances, just get every subscriber's email.
-            emails = [subscriber['email'] for subscriber in subscribers]
-            return emails
+        router = self.get_router()
+        if rtype == RecordType.WEEKLY_DIGEST:
+            # For the digest we do not care about other circumstances, just get every subscriber's email.
+            return sorted(router.get_type_emails(RecordType.WEEKLY_DIGEST))
         else:
         # Start with any users subscribed directly to this record type.
-            subscribers = User.objects.filter(subscription__rtype=rtype_of_subscr, \
-                                          subscription__stype=stype, is_active=True).values('email')
+            emails = router.get_type_emails(rtype_of_subscr, stype)
 
         # For FOLLOWED_EVENTs and DEPLOYMENTs we do not collect other generic (d*, country, region) subscriptions, just one. This part is not called.
         if rtype_of_subscr != RecordType.FOLLOWED_EVENT and \
            rtype_of_subscr != RecordType.SURGE_ALERT and \
            rtype_of_subscr != RecordType.SURGE_DEPLOYMENT_MESSAGES:
-            dtypes = list(set(['d%s' % record.dtype.id for record in records if record.dtype is not None]))
+            dtypes = list(set(['d%s' % record.dtype_id for record in records if record.dtype_id is not None]))
 
             if (rtype_of_subscr == RecordType.NEW_OPERATIONS):
                 countries, regions = self.gather_country_and_region(records)
             else:
                 countries, regions = self.gather_countries_and_regions(records)
 
-            lookups = dtypes + countries + regions
-            if len(lookups):
-                subscribers = (subscribers | User.objects.filter(subscription__lookup_id__in=lookups, is_active=True).values('email')).distinct()
-        emails = [subscriber['email'] for subscriber in subscribers]
-        return emails
+            emails |= router.get_lookup_emails(dtypes + countries + regions)
+        return sorted(emails)
 
 
     def get_template(self, rtype=99):
@@ -211,31 +202,22 @@ class Command(BaseCommand):
             display += 's'
         return display
 
-    def get_weekly_digest_data(self, field):
-        today = datetime.utcnow().replace(tzinfo=timezone.utc)
+    def get_weekly_digest_data(self, summary, field):
         if field == 'dref':
-            return Appeal.objects.filter(end_date__gt=today, atype=0).count()
+            return summary.active_drefs
         elif field == 'ea':
-            return Appeal.objects.filter(end_date__gt=today, atype=1).count()
+            return summary.active_appeals
         elif field == 'fund':
-            amount_req = (
-                Appeal.objects
-                    .filter(Q(end_date__gt=today, atype=1) | Q(end_date__gt=today, atype=2))
-                    .aggregate(Sum('amount_requested'))['amount_requested__sum'] or 0
-            )
-            amount_fund = (
-                Appeal.objects
-                    .filter(Q(end_date__gt=today, atype=1) | Q(end_date__gt=today, atype=2))
-                    .aggregate(Sum('amount_funded'))['amount_funded__sum'] or 0
-            )
+            amount_req = summary.active_appeal_amount_requested
+            amount_fund = summary.active_appeal_amount_funded
             percent = float(round(amount_fund / amount_req, 3) * 100) if amount_req != 0 else 0
             return percent
         elif field == 'budget':
-            amount = Appeal.objects.filter(end_date__gt=today).aggregate(Sum('amount_requested'))['amount_requested__sum'] or 0
+            amount = summary.active_amount_requested
             rounded_amount = round(amount / 1000000, 2)
             return rounded_amount
         elif field == 'pop':
-            people = Appeal.objects.filter(end_date__gt=today).aggregate(Sum('num_beneficiaries'))['num_beneficiaries__sum'] or 0
+            people = summary.active_num_beneficiaries
             rounded_people = round(people / 1000000, 2)
             return rounded_people
     
@@ -244,9 +226,10 @@ class Command(BaseCommand):
         ops = Appeal.objects.filter(created_at__gte=dig_time).order_by('-created_at')
         ret_ops = []
         for op in ops:
+            country = reference_data.countries.get(op.country_id) if op.country_id else None
             op_to_add = {
                 'op_event_id': op.event_id,
-                'op_country': Country.objects.values_list('name', flat=True).get(id=op.country_id) if op.country_id else '',
+                'op_country': country.name if country is not None else '',
                 'op_name': op.name,
                 'op_created_at': op.created_at,
                 'op_funding': float(op.amount_requested),
@@ -276,11 +259,13 @@ class Command(BaseCommand):
         #         ret_data.append(alert_to_add)
 
         # Surge Deployments
-        personnel_list = Personnel.objects.filter(start_date__gte=dig_time).order_by('start_date')
+        personnel_list = Personnel.objects \
+            .filter(start_date__gte=dig_time) \
+            .select_related('deployment__event_deployed_to') \
+            .order_by('start_date')
         for pers in personnel_list:
-            deployment = PersonnelDeployment.objects.get(id=pers.deployment_id)
-            event = Event.objects.get(id=deployment.event_deployed_to_id) if deployment.event_deployed_to_id != None else None
-            country_from = Country.objects.get(id=pers.country_from_id) if pers.country_from_id != None else None
+            event = pers.deployment.event_deployed_to
+            country_from = reference_data.countries.get(pers.country_from_id) if pers.country_from_id != None else None
             dep_to_add = {
                 'operation': event.name if event else '',
                 'event_url': '{}/emergencies/{}#overview'.format(frontend_url, event.id) if event else frontend_url,
@@ -297,11 +282,13 @@ class Command(BaseCommand):
 
     def get_weekly_digest_highlights(self):
         dig_time = self.get_time_threshold_digest()
-        events = Event.objects.filter(is_featured=True, updated_at__gte=dig_time).order_by('-updated_at')
+        events = list(Event.objects.filter(is_featured=True, updated_at__gte=dig_time).order_by('-updated_at'))
+        totals = compute_totals('event', [ev.id for ev in events])
         ret_highlights = []
         for ev in events:
-            amount_requested = Appeal.objects.filter(event_id=ev.id).aggregate(Sum('amount_requested'))['amount_requested__sum'] or '--'
-            amount_funded = Appeal.objects.filter(event_id=ev.id).aggregate(Sum('amount_funded'))['amount_funded__sum'] or '--'
+            summary = totals[ev.id]
+            amount_requested = summary['amount_requested'] or '--'
+            amount_funded = summary['amount_funded'] or '--'
             coverage = '--'
             
             if amount_funded != '--' and amount_requested != '--':
@@ -311,30 +298,27 @@ class Command(BaseCommand):
                 'hl_id': ev.id,
                 'hl_name': ev.name,
                 'hl_last_update': ev.updated_at,
-                'hl_people': Appeal.objects.filter(event_id=ev.id).aggregate(Sum('num_beneficiaries'))['num_beneficiaries__sum'] or '--',
+                'hl_people': summary['num_beneficiaries'] or '--',
                 'hl_funding': amount_requested,
-                'hl_deployed_eru': ERU.objects.filter(event_id=ev.id).aggregate(Sum('units'))['units__sum'] or '--',
-                'hl_deployed_sp': PersonnelDeployment.objects.filter(event_deployed_to_id=ev.id).count(),
+                'hl_deployed_eru': summary['eru_units'] or '--',
+                'hl_deployed_sp': summary['personnel_deployments'],
                 'hl_coverage': coverage,
             }
             ret_highlights.append(data_to_add)
         return ret_highlights
 
-    def get_actions_taken(self, frid):
+    def get_actions_taken(self, field_report):
+        """Reads the prefetched actions_taken__actions of the field report"""
         ret_actions_taken = {
             'NTLS': [],
             'PNS': [],
             'FDRN': [],
         }
-        actions_taken = ActionsTaken.objects.filter(field_report_id=frid)
-        for at in actions_taken:
+        for at in field_report.actions_taken.all():
             action_to_add = {
                 'action_summary': at.summary,
-                'actions': [],
+                'actions': list(at.actions.all()),
             }
-            if at.actions.all():
-                for act in at.actions.all():
-                    action_to_add['actions'].append(act)
             if at.organization == 'NTLS':
                 ret_actions_taken['NTLS'].append(action_to_add)
             elif at.organization == 'PNS':
@@ -346,17 +330,42 @@ class Command(BaseCommand):
     def get_weekly_latest_frs(self):
         dig_time = self.get_time_threshold_digest()
         ret_fr_list = []
-        fr_list = list(FieldReport.objects.filter(created_at__gte=dig_time).order_by('-created_at'))
+        fr_list = FieldReport.objects \
+            .filter(created_at__gte=dig_time) \
+            .prefetch_related('countries') \
+            .order_by('-created_at')
         for fr in fr_list:
+            countries = fr.countries.all()
             fr_data = {
                 'id': fr.id,
-                'country': fr.countries.all()[0].name if fr.countries else None,
+                'country': countries[0].name if countries else None,
                 'summary': fr.summary,
                 'created_at': fr.created_at,
             }
             ret_fr_list.append(fr_data)
         return ret_fr_list
 
+    def build_weekly_digest(self):
+        """The weekly digest, read with the same number of queries whatever the number of records"""
+        summary = get_summary('global')
+        return {
+            'active_dref': self.get_weekly_digest_data(summary, 'dref'),
+            'active_ea': self.get_weekly_digest_data(summary, 'ea'),
+            'funding_coverage': self.get_weekly_digest_data(summary, 'fund'),
+            'budget': self.get_weekly_digest_data(summary, 'budget'),
+            'population': self.get_weekly_digest_data(summary, 'pop'),
+            'highlighted_ops': self.get_weekly_digest_highlights(),
+            'latest_ops': self.get_weekly_digest_latest_ops(),
+            'latest_deployments': self.get_weekly_digest_latest_deployments(),
+            'latest_field_reports': self.get_weekly_latest_frs(),
+        }
+
+    def get_weekly_digest(self):
+        """Built once per run, all the recipients share it"""
+        if self.weekly_digest is None:
+            self.weekly_digest = self.build_weekly_digest()
+        return self.weekly_digest
+
     def get_fieldreport_keyfigures(self, num_list):
         is_none = all(num == None for num in num_list)
         if is_none:
@@ -389,7 +398,7 @@ class Command(BaseCommand):
                     # 'volunteers': record.num_volunteers or '--',
                     # 'expat_delegates': record.num_expats_delegates or '--',
                 },
-                'actions_taken': self.get_actions_taken(record.id),
+                'actions_taken': self.get_actions_taken(record),
                 'actions_others': record.actions_others,
                 'gov_assistance': 'Yes' if record.request_assistance else 'No',
                 'ns_assistance': 'Yes' if record.ns_request_assistance else 'No',
@@ -423,18 +432,7 @@ class Command(BaseCommand):
                 'field_reports': list(FieldReport.objects.filter(event_id=record.event_id)) if record.event_id != None else None,
             }
         elif rtype == RecordType.WEEKLY_DIGEST:
-            dig_time = self.get_time_threshold_digest()
-            rec_obj = {
-                'active_dref': self.get_weekly_digest_data('dref'),
-                'active_ea': self.get_weekly_digest_data('ea'),
-                'funding_coverage': self.get_weekly_digest_data('fund'),
-                'budget': self.get_weekly_digest_data('budget'),
-                'population': self.get_weekly_digest_data('pop'),
-                'highlighted_ops': self.get_weekly_digest_highlights(),
-                'latest_ops': self.get_weekly_digest_latest_ops(),
-                'latest_deployments': self.get_weekly_digest_latest_deployments(),
-                'latest_field_reports': self.get_weekly_latest_frs(),
-            }
+            rec_obj = self.get_weekly_digest()
         else: # The default (old) template
             rec_obj = {
                 'resource_uri': self.get_resource_uri(record, rtype),
@@ -445,7 +443,7 @@ class Command(BaseCommand):
         return rec_obj
 
 
-    def notify(self, records, rtype, stype, uid=None):
+    def notify(self, records, rtype, stype, uid=None, is_retro=False):
         record_count = 0
         if records:
             record_count = records.count()
@@ -463,7 +461,25 @@ class Command(BaseCommand):
                 return
             else:
                 emails = list(usr.values_list('email', flat=True))  # Only one email in this case
-        
+            if not emails[0]:
+                logger.info('Silent about the one-by-one subscribed records – user %s has no email address' % uid)
+                return
+
+        # Only notify about the records the recipients were not notified about, by a previous or an overlapping run
+        keys = self.get_ledger_keys(records, rtype)
+        groups = group_unsent(rtype, keys, emails)
+        if not groups:
+            logger.info('Silent about the %s – recipients already notified' % rtype.name)
+            return
+        is_staff = True if uid is None else usr.values_list('is_staff', flat=True)[0]
+        for unsent_keys, emails in groups:
+            group_records, group_count = records, record_count
+            if rtype != RecordType.WEEKLY_DIGEST and len(unsent_keys) < len(keys):
+                group_records = records.filter(pk__in=[record_id for record_id, _ in unsent_keys])
+                group_count = len(unsent_keys)
+            self.send_records(group_records, group_count, rtype, stype, emails, unsent_keys, uid, is_staff, is_retro)
+
+    def send_records(self, records, record_count, rtype, stype, emails, keys, uid, is_staff, is_retro):
         # Only serialize the first 10 records
         record_entries = []
         if rtype == RecordType.WEEKLY_DIGEST:
@@ -473,9 +489,6 @@ class Command(BaseCommand):
             for record in entries:
                 record_entries.append(self.construct_template_record(rtype, record))
 
-        if uid is not None:
-            is_staff = usr.values_list('is_staff', flat=True)[0]
-        
         if rtype == RecordType.WEEKLY_DIGEST:
             record_type = 'weekly digest'
         else:
@@ -504,7 +517,7 @@ class Command(BaseCommand):
                 record_type,
             )
 
-        if self.is_retro_mode():
+        if is_retro:
             subject += ' [daily followup]'
         
         template_path = self.get_template()
@@ -515,7 +528,7 @@ class Command(BaseCommand):
             'hello': get_hello(),
             'count': record_count,
             'records': record_entries,
-            'is_staff': True if uid is None else is_staff, # TODO: fork the sending to "is_staff / not ~" groups
+            'is_staff': is_staff, # TODO: fork the sending to "is_staff / not ~" groups
             'subject': subject,
         })
         recipients = emails
@@ -524,77 +537,31 @@ class Command(BaseCommand):
             if record_count == 1:
                 subject += ': ' + record_entries[0]['title'] # On purpose after rendering – the subject changes only, not email body
 
-            # For new (email-documented :10) events we store data to events_sent_to{ event_id: recipients }
-            if stype == SubscriptionType.EDIT: # Recently we do not allow EDIT substription
-                for e in list(records.values('id'))[:10]:
-                    i = e['id']
-                    if i not in events_sent_to:
-                        events_sent_to[i] = []
-                    email_list_to_add = list(set(events_sent_to[i] + recipients))
-                    if email_list_to_add:
-                        events_sent_to[i] = list(filter(None, email_list_to_add)) # filter to skip empty elements
-
             plural = '' if len(emails) == 1 else 's' # record_type has its possible plural thanks to get_record_display()
             logger.info('Notifying %s subscriber%s about %s %s %s' % (len(emails), plural, record_count, adj, record_type))
-            send_notification(subject, recipients, html, True if rtype == RecordType.FOLLOWED_EVENT else False)
         else:
-            if len(recipients):
-                # check if email is not in events_sent_to{event_id: recipients}
-                if not emails:
-                    logger.info('Silent about the one-by-one subscribed %s – user %s has not set email address' % (record_type, uid))
-                # Recently we do not allow EDIT (modif.) subscription, so it is irrelevant recently (do not check the 1+ events in loop) :
-                elif (records[0].id not in events_sent_to) or (emails[0] not in events_sent_to[records[0].id]):
-                    logger.info('Notifying %s subscriber about %s one-by-one subscribed %s' % (len(emails), record_count, record_type))
-                    send_notification(subject, recipients, html, True if rtype == RecordType.FOLLOWED_EVENT else False)
-                else:
-                    logger.info('Silent about a one-by-one subscribed %s – user already notified via generic subscription' % (record_type))
-
+            logger.info('Notifying %s subscriber about %s one-by-one subscribed %s' % (len(emails), record_count, record_type))
 
-    def index_new_records(self, records):
-        self.bulk([self.convert_for_bulk(record, create=True) for record in list(records)])
-
-
-    def index_updated_records(self, records):
-        self.bulk([self.convert_for_bulk(record, create=False) for record in list(records)])
+        with transaction.atomic():
+            if send_notification(subject, recipients, html, True if rtype == RecordType.FOLLOWED_EVENT else False):
+                record_sent(rtype, keys, recipients)
 
+    def get_ledger_keys(self, records, rtype):
+        """The (record id, record version) a notification is about, see notifications.ledger"""
+        if rtype == RecordType.WEEKLY_DIGEST:
+            return [(int(datetime.utcnow().strftime('%G%V')), 'digest')]
+        if rtype == RecordType.FOLLOWED_EVENT:
+            # A followed event is notified again once changed
+            return [(pk, updated_at.isoformat()) for pk, updated_at in records.values_list('id', 'updated_at')]
+        return [(pk, 'new') for pk in records.values_list('id', flat=True)]
 
-    def convert_for_bulk(self, record, create):
-        data = record.indexing()
-        metadata = {
-            '_op_type': 'create' if create else 'update',
-            '_index': ES_PAGE_NAME,
-            '_type': 'page',
-            '_id': record.es_id()
-        }
-        if (create):
-            metadata.update(**data)
-        else:
-            metadata['doc'] = data
-        return metadata
-
-
-    def bulk(self, actions):
-        try:
-            created, errors = bulk(client=ES_CLIENT , actions=actions)
-            if len(errors):
-                logger.error('Produced the following errors:')
-                logger.error('[%s]' % ', '.join(map(str, errors)))
-        except Exception as e:
-            logger.error('Could not index records')
-            logger.error('%s...' % str(e)[:512])
-
-
-    # Remove items in a queryset where updated_at == created_at.
-    # This leaves us with only ones that have been modified.
-    def filter_just_created(self, queryset):
-        if queryset.first() is None:
-            return []
-        if hasattr(queryset.first(), 'modified_at') and queryset.first().modified_at is not None:
-            return [record for record in queryset if (
-                record.modified_at.replace(microsecond=0) == record.created_at.replace(microsecond=0))]
-        else:
-            return [record for record in queryset if (
-                record.updated_at.replace(microsecond=0) == record.created_at.replace(microsecond=0))]
+    def index_changes(self, changes):
+        # Connection errors are raised, for the batch to be retried
+        errors = index_changes(changes)
+        invalidate_search_cache()
+        if len(errors):
+            logger.error('Produced the following errors:')
+            logger.error('[%s]' % ', '.join(map(str, errors)))
 
 
     def check_ingest_issues(self, having_ingest_issue):
@@ -608,53 +575,43 @@ class Command(BaseCommand):
             logger.info('Ingest issue occured, e.g. by ' + ingestor_name + ', via CronJob log record id: ' + str(ingest_issue_id) + ', notification sent to IM team')
 
 
-    def handle(self, *args, **options):
-        if self.is_digest_mode():
-            t = self.get_time_threshold_digest() # in digest mode (1ce a week, for new_entities only) we use a bigger interval
-        else:
-            t = self.get_time_threshold()
-        t2 = self.get_time_threshold2()
+    def notify_followed_events(self, condition, is_retro=False):
+        followed_eventparams = Subscription.objects.filter(event_id__isnull=False)
+        users_of_followed_events = followed_eventparams.values_list('user_id', flat=True).distinct()
+        for usr in users_of_followed_events: # looping in user_ids of specific FOLLOWED_EVENT subscriptions (8)
+            eventlist = followed_eventparams.filter(user_id=usr).values_list('event_id', flat=True).distinct()
+            cond3 = Q(pk__in=eventlist) # getting their events as a condition
+            followed_events = Event.objects.filter(condition & cond3)
+            if len(followed_events): # usr - unique (we loop one-by-one), followed_events - more
+                self.notify(followed_events, RecordType.FOLLOWED_EVENT, SubscriptionType.NEW, usr, is_retro)
 
-        cond1 = Q(created_at__gte=t)
-        condU = Q(updated_at__gte=t)
-        condR = Q(real_data_update__gte=t) # instead of modified at
+    def process_changes(self):
+        t2 = self.get_time_threshold2()
         cond2 = ~Q(previous_update__gte=t2) # we negate (~) this, so we want: no previous_update in the last day. So: send once a day!
         condF = Q(auto_generated_source='New field report') # We exclude those events that were generated from field reports, to avoid 2x notif.
-        condE = Q(status=CronJobStatus.ERRONEOUS)
-
-        # In this section we check if there was 2 FOLLOWED_EVENT modifications in the last 24 hours (for which there was no duplicated email sent, but now will be one).
-        if self.is_retro_mode():
-            condU = Q(updated_at__gte=t2)
-            cond2 = Q(previous_update__gte=t2) # not negated. We collect those, who had 2 changes in the last 1 day.
-            followed_eventparams = Subscription.objects.filter(event_id__isnull=False)
-            users_of_followed_events = followed_eventparams.values_list('user_id', flat=True).distinct()
-            for usr in users_of_followed_events: # looping in user_ids of specific FOLLOWED_EVENT subscriptions (8)
-                eventlist = followed_eventparams.filter(user_id=usr).values_list('event_id', flat=True).distinct()
-                cond3 = Q(pk__in=eventlist) # getting their events as a condition
-                followed_events = Event.objects.filter(condU & cond2 & cond3)
-                if len(followed_events): # usr - unique (we loop one-by-one), followed_events - more
-                    self.notify(followed_events, RecordType.FOLLOWED_EVENT, SubscriptionType.NEW, usr)
-        else:
-            # ".annotate(diff...)" - To check if a record was newly created, we check if `created_at` and `updated_at` are within one minute of each other, since those values can be off by some miliseconds upon insertion.
-            new_reports = FieldReport.objects.filter(cond1)
-            updated_reports = FieldReport.objects.annotate(
-                diff = ExpressionWrapper(F('updated_at') - F('created_at'), output_field=DurationField())
-            ).filter(condU & cond2 & Q(diff__gt=timedelta(minutes=1)))
-
-            new_appeals = Appeal.objects.filter(cond1)
-            updated_appeals = Appeal.objects.annotate(
-                diff = ExpressionWrapper(F('real_data_update') - F('created_at'), output_field=DurationField())
-            ).filter(condR & cond2 & Q(diff__gt=timedelta(minutes=1)))
-
-            new_events = Event.objects.filter(cond1).exclude(condF)
-            updated_events = Event.objects.annotate(
-                diff = ExpressionWrapper(F('updated_at') - F('created_at'), output_field=DurationField())
-            ).filter(condU & cond2 & Q(diff__gt=timedelta(minutes=1)))
 
-            new_surgealerts = SurgeAlert.objects.filter(cond1)
-
-            new_pers_deployments = PersonnelDeployment.objects.filter(cond1) # CHECK: Best instantiation of Deployment Messages? Frontend appearance?!?
-            # No need for indexing for personnel deployments
+        with consume_changes('index_and_notify') as changes:
+            if changes is None:
+                logger.info('The changes are being processed by another run')
+                return
+            logger.info('Processing %s changes' % len(changes))
+
+            # Indexed first: if the search index is unreachable the batch is left to the next run, unnotified
+            self.index_changes(changes)
+
+            new_reports = FieldReport.objects \
+                .filter(pk__in=changes.get_ids(FieldReport, ChangeOperation.CREATE)) \
+                .prefetch_related('countries', 'actions_taken__actions')
+            new_appeals = Appeal.objects.filter(pk__in=changes.get_ids(Appeal, ChangeOperation.CREATE))
+            new_events = Event.objects \
+                .filter(pk__in=changes.get_ids(Event, ChangeOperation.CREATE)) \
+                .exclude(condF) \
+                .prefetch_related('countries')
+            new_surgealerts = SurgeAlert.objects.filter(pk__in=changes.get_ids(SurgeAlert, ChangeOperation.CREATE))
+            new_pers_deployments = PersonnelDeployment.objects.filter(
+                pk__in=changes.get_ids(PersonnelDeployment, ChangeOperation.CREATE)
+            ) # CHECK: Best instantiation of Deployment Messages? Frontend appearance?!?
+            changed_events = Q(pk__in=changes.get_ids(Event, ChangeOperation.CREATE, ChangeOperation.UPDATE))
 
             # Approaching End of Mission ? new_approanching_end = PersonnelDeployment.objects.filter(end-date is close?)
             # No need for indexing for Approaching End of Mission
@@ -662,49 +619,40 @@ class Command(BaseCommand):
             # PER Due Dates ? new_per_due_date_warnings = User.objects.filter(PER admins of countries/regions, for whom the setting/per_due_date is in 1 week)
             # No need for indexing for PER Due Dates
 
-            followed_eventparams = Subscription.objects.filter(event_id__isnull=False)
-            ## followed_events = Event.objects.filter(updated_at__gte=t, pk__in=[x.event_id for x in followed_eventparams])
+            self.notify(new_reports, RecordType.FIELD_REPORT, SubscriptionType.NEW)
+
+            self.notify(new_appeals, RecordType.APPEAL, SubscriptionType.NEW)
+
+            self.notify(new_events, RecordType.EVENT, SubscriptionType.NEW)
+
+            self.notify(new_surgealerts, RecordType.SURGE_ALERT, SubscriptionType.NEW)
+
+            self.notify(new_pers_deployments, RecordType.SURGE_DEPLOYMENT_MESSAGES, SubscriptionType.NEW)
 
-            # Merge Weekly Digest into one mail instead of separate ones
-            if self.is_digest_mode():
+            self.notify_followed_events(changed_events & cond2)
+        prune_changes()
+        prune_sent()
+
+    def handle(self, *args, **options):
+        self.process_changes()
+
+        # Merge Weekly Digest into one mail instead of separate ones
+        with run_job('weekly-digest', digest_schedule, time_interva7) as window:
+            if window is not None:
                 self.notify(None, RecordType.WEEKLY_DIGEST, SubscriptionType.NEW)
-            else:
-                self.notify(new_reports, RecordType.FIELD_REPORT, SubscriptionType.NEW)
-                #self.notify(updated_reports, RecordType.FIELD_REPORT, SubscriptionType.EDIT)
-
-                self.notify(new_appeals, RecordType.APPEAL, SubscriptionType.NEW)
-                #self.notify(updated_appeals, RecordType.APPEAL, SubscriptionType.EDIT)
-
-                self.notify(new_events, RecordType.EVENT, SubscriptionType.NEW)
-                #self.notify(updated_events, RecordType.EVENT, SubscriptionType.EDIT)
-
-                self.notify(new_surgealerts, RecordType.SURGE_ALERT, SubscriptionType.NEW)
-
-                self.notify(new_pers_deployments, RecordType.SURGE_DEPLOYMENT_MESSAGES, SubscriptionType.NEW)
-
-            users_of_followed_events = followed_eventparams.values_list('user_id', flat=True).distinct()
-            for usr in users_of_followed_events: # looping in user_ids of specific FOLLOWED_EVENT subscriptions (8)
-                eventlist = followed_eventparams.filter(user_id=usr).values_list('event_id', flat=True).distinct()
-                cond3 = Q(pk__in=eventlist) # getting their events as a condition
-                followed_events = Event.objects.filter(condU & cond2 & cond3)
-                if len(followed_events): # usr - unique (we loop one-by-one), followed_events - more
-                    self.notify(followed_events, RecordType.FOLLOWED_EVENT, SubscriptionType.NEW, usr)
-
-            logger.info('Indexing %s updated field reports' % updated_reports.count())
-            self.index_updated_records(self.filter_just_created(updated_reports))
-            logger.info('Indexing %s updated appeals' % updated_appeals.count())
-            self.index_updated_records(self.filter_just_created(updated_appeals))
-            logger.info('Indexing %s updated events' % updated_events.count())
-            self.index_updated_records(self.filter_just_created(updated_events))
-
-            logger.info('Indexing %s new field reports' % new_reports.count())
-            self.index_new_records(new_reports)
-            logger.info('Indexing %s new appeals' % new_appeals.count())
-            self.index_new_records(new_appeals)
-            logger.info('Indexing %s new events' % new_events.count())
-            self.index_new_records(new_events)
-
-            # CronJob feedback of smtp server working is in: notifications/notification.py
-            having_ingest_issue = CronJob.objects.filter(cond1 & condE)
-            self.check_ingest_issues(having_ingest_issue)
-            logger.info('API monitoring. Ingest issues are checked.')
+
+        # In this section we check if there was 2 FOLLOWED_EVENT modifications in the last 24 hours (for which there was no duplicated email sent, but now will be one).
+        with run_job('daily-retro', retro_schedule, time_interva2) as window:
+            if window is not None:
+                condU = Q(updated_at__gt=window.start, updated_at__lte=window.end)
+                # not negated. We collect those, who had 2 changes in the last 1 day.
+                cond2 = Q(previous_update__gte=self.get_time_threshold2())
+                self.notify_followed_events(condU & cond2, is_retro=True)
+
+        # CronJob feedback of smtp server working is in: notifications/notification.py
+        with run_job('ingest-issues', max_window=time_interva2) as window:
+            if window is not None:
+                having_ingest_issue = CronJob.objects.filter(
+                    created_at__gt=window.start, created_at__lte=window.end, status=CronJobStatus.ERRONEOUS)
+                self.check_ingest_issues(having_ingest_issue)
+                logger.info('API monitoring. Ingest issues are checked.')
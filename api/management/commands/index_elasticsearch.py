@@ -1,66 +1,128 @@
-from django.core.management.base import BaseCommand
+import time
+from collections import OrderedDict, namedtuple
 
-from elasticsearch.client import IndicesClient
-from elasticsearch.helpers import bulk
-from elasticsearch import Elasticsearch
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
 
-from api.esconnection import ES_CLIENT
-from api.indexes import GenericMapping, GenericSetting, ES_PAGE_NAME
-from api.models import Region, Country, Event, Appeal, FieldReport
+from api.models import Region, Country, Event, Appeal, FieldReport, ChangeEvent
 from api.logger import logger
+from api.outbox import ChangeSet
+from api.search import get_search_backend, index_changes, invalidate_search_cache
+
+# A model pushed to the index, with the relations its indexing() reads
+IndexedModel = namedtuple('IndexedModel', ('model', 'label', 'select_related', 'prefetch_related'))
+
+INDEXED_MODELS = OrderedDict((
+    ('region', IndexedModel(Region, 'regions', (), ())),
+    ('country', IndexedModel(Country, 'countries', (), ())),
+    ('event', IndexedModel(Event, 'events', (), ('countries',))),
+    ('appeal', IndexedModel(Appeal, 'appeals', ('event', 'country'), ())),
+    ('fieldreport', IndexedModel(FieldReport, 'field reports', (), ('countries',))),
+))
+
+PROGRESS_INTERVAL = 10000
+MAX_LOGGED_ERRORS = 20
+
 
 class Command(BaseCommand):
-    help = 'Create a new elasticsearch index and bulk-index existing objects'
+    help = 'Rebuild the search index (Elasticsearch or Postgres, see SEARCH_BACKEND) from the existing objects'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models',
+            nargs='*',
+            help='Models to index (%s). By default all of them are indexed into a new index' %
+                 ', '.join(INDEXED_MODELS),
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help='Documents per bulk request')
+        parser.add_argument('--threads', type=int, default=1, help='Bulk requests sent in parallel')
+        parser.add_argument('--keep', type=int, default=1, help='Previous index versions kept after a full run')
 
     def handle(self, *args, **options):
-        logger.info('Recreating indices')
-        self.recreate_index(ES_PAGE_NAME, GenericMapping, GenericSetting)
-
-        logger.info('Indexing regions')
-        self.push_table_to_index(model=Region)
-
-        logger.info('Indexing countries')
-        self.push_table_to_index(model=Country)
-
-        logger.info('Indexing events')
-        self.push_table_to_index(model=Event)
-
-        logger.info('Indexing appeals')
-        self.push_table_to_index(model=Appeal)
-
-        logger.info('Indexing field reports')
-        self.push_table_to_index(model=FieldReport)
-
-    def recreate_index(self, index_name, index_mapping, index_setting):
-        indices_client = IndicesClient(client=ES_CLIENT)
-        if indices_client.exists(index_name):
-            indices_client.delete(index=index_name)
-        indices_client.create(index=index_name,
-                              body=index_setting)
-        indices_client.put_mapping(doc_type='page',
-                                   index=index_name,
-                                   body=index_mapping)
-
-
-    def push_table_to_index(self, model):
-        query = model.objects.all()
-        data = [
-            self.convert_for_bulk(s) for s in list(query)
-        ]
-        created, errors = bulk(client=ES_CLIENT, actions=data)
-        logger.info('Created %s records' % created)
+        names = options['models'] or list(INDEXED_MODELS)
+        unknown = set(names) - set(INDEXED_MODELS)
+        if unknown:
+            logger.error('Unknown models %s' % ', '.join(sorted(unknown)))
+            return
+
+        backend = get_search_backend()
+        if options['models']:
+            # A partial run overwrites its documents in the index being searched
+            for name in names:
+                self.push_table_to_index(
+                    backend, INDEXED_MODELS[name], None, options['chunk_size'], options['threads'])
+            invalidate_search_cache()
+            return
+
+        # A full run builds a new index, searches keep reading the previous one until it is complete
+        logger.info('Rebuilding the %s search index' % settings.SEARCH_BACKEND)
+        # index_and_notify keeps writing the changes made meanwhile to the previous index
+        last_change_id = ChangeEvent.objects.aggregate(last=Max('id'))['last'] or 0
+        target = backend.begin_rebuild()
+        try:
+            for name in names:
+                self.push_table_to_index(
+                    backend, INDEXED_MODELS[name], target, options['chunk_size'], options['threads'])
+            last_change_id = self.replay_changes(target, last_change_id)
+            backend.finish_rebuild(target, options['keep'])
+        except Exception:
+            logger.error('Indexing failed, keeping the current index')
+            backend.abort_rebuild(target)
+            raise
+        # Those made while replaying went to the previous index too
+        self.replay_changes(None, last_change_id)
+        invalidate_search_cache()
+
+    def replay_changes(self, target, after_id):
+        """Applies the outbox changes after `after_id` to `target`, returns the last change id"""
+        events = list(ChangeEvent.objects.filter(id__gt=after_id).order_by('id'))
+        if not events:
+            return after_id
+        logger.info('Replaying %s changes made during the rebuild' % len(events))
+        errors = index_changes(ChangeSet(events), target)
+        if len(errors):
+            logger.error('%s changes produced errors, the first ones:' % len(errors))
+            logger.error('[%s]' % ', '.join(map(str, errors[:MAX_LOGGED_ERRORS])))
+        return events[-1].id
+
+    def iter_records(self, indexed, chunk_size):
+        """
+        The records of the model by primary key ranges, so only a chunk is held
+        in memory at once and its relations are fetched with one query per chunk
+        (QuerySet.iterator() ignores prefetch_related)
+        """
+        queryset = indexed.model.objects \
+            .select_related(*indexed.select_related) \
+            .prefetch_related(*indexed.prefetch_related) \
+            .order_by('pk')
+        last_pk = None
+        while True:
+            chunk = queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset
+            records = list(chunk[:chunk_size])
+            if not records:
+                return
+            yield from records
+            last_pk = records[-1].pk
+
+    def push_table_to_index(self, backend, indexed, target, chunk_size=500, threads=1):
+        logger.info('Indexing %s' % indexed.label)
+        results = backend.index_records(self.iter_records(indexed, chunk_size), target, chunk_size, threads)
+
+        start = time.monotonic()
+        indexed_count, errors = 0, []
+        for ok, item in results:
+            if ok:
+                indexed_count += 1
+            else:
+                errors.append(item)
+            done = indexed_count + len(errors)
+            if done % PROGRESS_INTERVAL == 0:
+                logger.info('%s %s sent (%.0f/s)' % (done, indexed.label, done / (time.monotonic() - start)))
+
+        elapsed = time.monotonic() - start
+        logger.info('Indexed %s %s in %.1fs (%.0f/s)' % (
+            indexed_count, indexed.label, elapsed, (indexed_count + len(errors)) / elapsed if elapsed else 0))
         if len(errors):
-            logger.error('Produced the following errors:')
-            logger.error('[%s]' % ', '.join(map(str, errors)))
-
-
-    def convert_for_bulk(self, model_object):
-        data = model_object.indexing()
-        metadata = {
-            '_op_type': 'create',
-            '_index': ES_PAGE_NAME,
-            '_type': 'page',
-            '_id': model_object.es_id(),
-        }
-        data.update(**metadata)
-        return data
+            logger.error('%s %s produced errors, the first ones:' % (len(errors), indexed.label))
+            logger.error('[%s]' % ', '.join(map(str, errors[:MAX_LOGGED_ERRORS])))
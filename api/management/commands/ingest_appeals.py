@@ -4,7 +4,8 @@ import requests
 import json
 from datetime import datetime, timezone, timedelta
 from django.core.management.base import BaseCommand
-from api.models import AppealType, AppealStatus, Appeal, Region, Country, DisasterType, Event, CronJob, CronJobStatus
+from api.models import AppealType, AppealStatus, Appeal, DisasterType, Event, CronJob, CronJobStatus
+from api import reference_data
 from api.fixtures.dtype_map import DISASTER_TYPE_MAPPING
 from api.logger import logger
 
@@ -132,7 +133,9 @@ class Command(BaseCommand):
             disaster_name = list(DISASTER_TYPE_MAPPING.values())[idx]
         else:
             disaster_name = 'Other'
-        dtype = DisasterType.objects.get(name=disaster_name)
+        dtype = reference_data.disaster_types.lookup('name', disaster_name)
+        if dtype is None:
+            raise DisasterType.DoesNotExist('DisasterType matching query does not exist.')
         return dtype
 
     def parse_country(self, iso_code, country_name):
@@ -140,15 +143,11 @@ class Command(BaseCommand):
             iso_code = region2country[iso_code]
 
         if len(iso_code) == 2:
-            country = Country.objects.filter(iso=iso_code.lower())
+            country = reference_data.countries.lookup('iso', iso_code)
         else:
-            country = Country.objects.filter(name=country_name)
+            country = reference_data.countries.lookup('name', country_name)
 
-        if country.count() == 0:
-            country = None
-            #print(iso_code + ' ' + country_name) # Debug: for the "orphan" iso_codes
-        else:
-            country = country.first()
+        #if country is None: print(iso_code + ' ' + country_name) # Debug: for the "orphan" iso_codes
         return country
 
     def parse_appeal_record(self, r, **options):
@@ -166,14 +165,14 @@ class Command(BaseCommand):
 
         # get the region mapping, using the country if possible
         if country is not None and country.region is not None:
-            region = Region.objects.get(pk=country.region.pk)
+            region = country.region
         else:
             regions = {'africa': 0, 'americas': 1, 'asia pacific': 2, 'europe': 3, 'middle east and north africa': 4}
             region_name = r['OSR_name'].lower().strip()
             if not region_name in regions:
                 region = None
             else:
-                region = Region.objects.get(name=regions[region_name])
+                region = reference_data.regions.lookup('name', regions[region_name])
 
         # get the most recent appeal detail, using the appeal start date
         # if there is more than one detail, the start date should be the *earliest
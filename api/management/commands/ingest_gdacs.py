@@ -3,7 +3,8 @@ import datetime as dt
 from encoder import XML2Dict
 from dateutil.parser import parse
 from django.core.management.base import BaseCommand
-from api.models import Country, Event, GDACSEvent, CronJob, CronJobStatus
+from api.models import Event, GDACSEvent, CronJob, CronJobStatus
+from api import reference_data
 from api.event_sources import SOURCES
 from api.logger import logger
 
@@ -66,8 +67,8 @@ class Command(BaseCommand):
                 if created:
                     added += 1
                     for c in data['country_text'].split(','):
-                        country = Country.objects.filter(name=c.strip())
-                        if country.count() == 1:
+                        country = reference_data.countries.filter('name', c)
+                        if len(country) == 1:
                             gdacsevent.countries.add(country[0])
 
                     title_elements = ['GDACS %s:' % alert_level]
@@ -3,7 +3,8 @@ import datetime as dt
 from encoder import XML2Dict
 from dateutil.parser import parse
 from django.core.management.base import BaseCommand
-from api.models import Country, Region, Event, CronJob, CronJobStatus
+from api.models import Region, Event, CronJob, CronJobStatus
+from api import reference_data
 from api.event_sources import SOURCES
 from api.logger import logger
 
@@ -178,18 +179,18 @@ class Command(BaseCommand):
                 added += 1
 
                 # add country
-                country_found = Country.objects.filter(name=country.strip())
-                if country_found.count() >= 1:
+                country_found = reference_data.countries.filter('name', country)
+                if len(country_found) >= 1:
                     event.countries.add(country_found[0])
                 else:
                     country_word_list = country.split()  # list of country words
-                    country_found = Country.objects.filter(name=country_word_list[-1].strip()) # Search only the last word, like "Republic of Panama" > "Panama"
-                    if country_found.count() >= 1:
+                    country_found = reference_data.countries.filter('name', country_word_list[-1]) # Search only the last word, like "Republic of Panama" > "Panama"
+                    if len(country_found) >= 1:
                         event.countries.add(country_found[0])
 
                 # add region
                 # print(country)
-                if (region is None) and (country_found.count() > 0) and (country != 'CountryNotFoundInCategory'):
+                if (region is None) and (len(country_found) > 0) and (country != 'CountryNotFoundInCategory'):
                     region = country_found[0].region_id
                 if region is not None:
                     event.regions.add(region)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from api.logger import logger
+from api.models import AggregateRollup
+from api.rollups import ROLLUP_SOURCES, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the rollups served by /api/v1/aggregate/ from the appeal, event, field report and heop records'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'model_types',
+            nargs='*',
+            help='Model types to rebuild (%s), all by default' % ', '.join(ROLLUP_SOURCES),
+        )
+        parser.add_argument(
+            '--if-empty',
+            action='store_true',
+            help='Only rebuild the model types which have no rollup rows yet, e.g. on a new database',
+        )
+
+    def handle(self, *args, **options):
+        model_types = options['model_types'] or list(ROLLUP_SOURCES)
+        for model_type in model_types:
+            if model_type not in ROLLUP_SOURCES:
+                logger.error('Unknown model type %s' % model_type)
+                continue
+            if options['if_empty'] and AggregateRollup.objects.filter(model_type=model_type).exists():
+                continue
+            logger.info('Rebuilt %s rollup rows of %s' % (rebuild_rollups(model_type), model_type))
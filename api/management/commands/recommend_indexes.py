@@ -0,0 +1,175 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, models, transaction
+from django.db.migrations import AddIndex, Migration
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.utils import timezone
+from api.models import CapturedQuery
+
+# `column <operator>` in the Filter of a plan node, optionally qualified by the table
+COMPARISON = re.compile(r'(?:\b\w+\.)?"?(\w+)"?\s*(IS NOT NULL|IS NULL|>=|<=|<>|=|>|<)')
+BOOLEAN = re.compile(r'\((NOT )?(?:\w+\.)?"?(\w+)"?\)')
+MAX_INDEX_FIELDS = 3
+# Explained in place of the parameters, of which only the types are recorded (see api.query_capture)
+PLACEHOLDER_VALUES = {
+    'bool': True,
+    'int': 0,
+    'float': 0.0,
+    'numeric': Decimal(0),
+    'datetime': timezone.now(),
+    'date': date.today(),
+    'list': [],
+    'null': None,
+    'str': '',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs EXPLAIN on the slowest statements recorded by QueryCaptureMiddleware '
+        'and proposes a migration of the composite/partial indexes they lack'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Number of statements to look at, by total time')
+        parser.add_argument('--min-calls', type=int, default=1, help='Ignore statements called less often')
+        parser.add_argument('--write', action='store_true', help='Write the migrations instead of printing them')
+        parser.add_argument('--reset', action='store_true', help='Forget the recorded statements afterwards')
+
+    def explain(self, captured):
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                params = [PLACEHOLDER_VALUES[param_type] for param_type in json.loads(captured.sample_params)]
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + captured.sample_sql, params)
+                plan = cursor.fetchone()[0]
+        except (DatabaseError, KeyError, ValueError, TypeError) as e:
+            self.stderr.write('Could not explain %s: %s' % (captured.fingerprint, e))
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']
+
+    def iter_seq_scans(self, node, sort_keys=()):
+        """(table, filter, sort keys) of the sequential scans of a plan"""
+        if node.get('Node Type') == 'Sort':
+            sort_keys = tuple(node.get('Sort Key', ()))
+        if node.get('Node Type') == 'Seq Scan':
+            yield node['Relation Name'], node.get('Filter', ''), sort_keys
+        for child in node.get('Plans', ()):
+            yield from self.iter_seq_scans(child, sort_keys)
+
+    def get_indexed_prefixes(self, model):
+        """Field name tuples the existing indexes of the model start with"""
+        meta = model._meta
+        prefixes = set()
+        for field in meta.concrete_fields:
+            if field.primary_key or field.unique or field.db_index:
+                prefixes.add((field.name,))
+        for fields in list(meta.index_together) + list(meta.unique_together):
+            prefixes.update(tuple(fields[:length]) for length in range(1, len(fields) + 1))
+        for index in meta.indexes:
+            fields = [name.lstrip('-') for name in index.fields]
+            prefixes.update(tuple(fields[:length]) for length in range(1, len(fields) + 1))
+        return prefixes
+
+    def propose_index(self, model, filter_text, sort_keys):
+        columns = {field.column: field for field in model._meta.concrete_fields}
+        equality, ranges, conditions = [], [], []
+        for column, operator in COMPARISON.findall(filter_text):
+            field = columns.get(column)
+            if field is None:
+                continue
+            if operator == '=':
+                equality.append(field.name)
+            elif operator in ('IS NULL', 'IS NOT NULL'):
+                conditions.append(models.Q(**{'%s__isnull' % field.name: operator == 'IS NULL'}))
+            elif operator != '<>':
+                ranges.append(field.name)
+        for negated, column in BOOLEAN.findall(filter_text):
+            field = columns.get(column)
+            if isinstance(field, models.BooleanField):
+                conditions.append(models.Q(**{field.name: not negated}))
+        for key in sort_keys:
+            column = key.split()[0].split('.')[-1].strip('"')
+            if column in columns:
+                ranges.append(columns[column].name)
+
+        fields = list(OrderedDict.fromkeys(sorted(set(equality)) + ranges))[:MAX_INDEX_FIELDS]
+        if not fields or tuple(fields) in self.get_indexed_prefixes(model):
+            return None
+
+        condition = None
+        for part in conditions:
+            condition = part if condition is None else condition & part
+        base = models.Index(fields=fields)
+        base.set_name_with_model(model)
+        # The generated name ends with a hash of the fields, make it cover the condition too
+        digest = hashlib.md5(('%s %s' % (fields, condition)).encode('utf-8')).hexdigest()[:6]
+        return models.Index(fields=fields, name='%s_%s_idx' % (base.name[:-11], digest), condition=condition)
+
+    def write_migrations(self, proposals, write):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        by_app = OrderedDict()
+        for (model, index) in proposals:
+            by_app.setdefault(model._meta.app_label, []).append(AddIndex(model_name=model._meta.model_name, index=index))
+
+        for app_label, operations in by_app.items():
+            leaves = loader.graph.leaf_nodes(app_label)
+            number = (MigrationAutodetector.parse_number(leaves[0][1]) or 0) + 1 if leaves else 1
+            migration = Migration('%04i_recommended_indexes' % number, app_label)
+            migration.dependencies = leaves
+            migration.operations = operations
+            writer = MigrationWriter(migration)
+            if write:
+                with open(writer.path, 'w', encoding='utf-8') as migration_file:
+                    migration_file.write(writer.as_string())
+                self.stdout.write('Wrote %s' % writer.path)
+            else:
+                self.stdout.write('# %s' % writer.path)
+                self.stdout.write(writer.as_string())
+        if by_app:
+            self.stdout.write('Add the proposed indexes to the Meta.indexes of the models as well.')
+
+    def handle(self, *args, **options):
+        tables = {model._meta.db_table: model for model in apps.get_models()}
+        statements = CapturedQuery.objects \
+            .filter(calls__gte=options['min_calls']) \
+            .order_by('-total_time')[:options['top']]
+
+        proposals = OrderedDict()
+        for captured in statements:
+            plan = self.explain(captured)
+            if plan is None:
+                continue
+            for table, filter_text, sort_keys in self.iter_seq_scans(plan):
+                model = tables.get(table)
+                index = self.propose_index(model, filter_text, sort_keys) if model is not None else None
+                if index is None:
+                    continue
+                key = (model, index.name)
+                if key not in proposals:
+                    proposals[key] = (index, [])
+                proposals[key][1].append(captured)
+
+        for (model, name), (index, captured_list) in proposals.items():
+            self.stdout.write('%s %s%s' % (
+                model._meta.label, index.fields, ' WHERE %s' % (index.condition,) if index.condition else ''))
+            for captured in captured_list:
+                self.stdout.write('    %s calls, %.3fs total, %.3fs max: %s' % (
+                    captured.calls, captured.total_time, captured.max_time, captured.statement[:200]))
+        if not proposals:
+            self.stdout.write('No index to propose')
+
+        self.write_migrations([(model, index) for (model, name), (index, _) in proposals.items()], options['write'])
+
+        if options['reset']:
+            CapturedQuery.objects.all().delete()
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.10 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0044_auto_20200318_0643'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregateRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_type', models.CharField(max_length=16)),
+                ('unit', models.CharField(max_length=5)),
+                ('bucket', models.DateTimeField()),
+                ('grouping', models.CharField(max_length=7)),
+                ('country', models.IntegerField(default=0)),
+                ('region', models.IntegerField(default=0)),
+                ('dtype', models.IntegerField(default=0)),
+                ('measure', models.CharField(max_length=50)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('nonnull', models.IntegerField(default=0, help_text='Number of records with a value for the measure')),
+            ],
+            options={
+                'unique_together': {('model_type', 'unit', 'bucket', 'grouping', 'country', 'region', 'dtype', 'measure')},
+                'index_together': {('model_type', 'unit', 'grouping', 'country', 'region', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.10 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0045_aggregaterollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperationalSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=7)),
+                ('scope_id', models.IntegerField(default=0)),
+                ('appeal_count', models.IntegerField(default=0)),
+                ('num_beneficiaries', models.BigIntegerField(default=0)),
+                ('amount_requested', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('amount_funded', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('active_drefs', models.IntegerField(default=0)),
+                ('active_appeals', models.IntegerField(default=0)),
+                ('active_intl_appeals', models.IntegerField(default=0)),
+                ('active_num_beneficiaries', models.BigIntegerField(default=0)),
+                ('active_amount_requested', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('active_amount_funded', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('active_appeal_amount_requested', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('active_appeal_amount_funded', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('eru_units', models.IntegerField(default=0)),
+                ('personnel_deployments', models.IntegerField(default=0)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('is_stale', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('scope', 'scope_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.10 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0046_operationalsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapturedQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=32, unique=True)),
+                ('statement', models.TextField()),
+                ('sample_sql', models.TextField()),
+                ('sample_params', models.TextField(default='[]')),
+                ('path', models.CharField(blank=True, max_length=255)),
+                ('calls', models.IntegerField(default=0)),
+                ('total_time', models.FloatField(default=0, help_text='Seconds')),
+                ('max_time', models.FloatField(default=0, help_text='Seconds')),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Captured queries',
+            },
+        ),
+    ]
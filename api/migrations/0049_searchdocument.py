@@ -0,0 +1,46 @@
+# Generated by Django 2.2.10 on 2026-10-18 12:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0048_changeevent_changewatermark'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_id', models.CharField(max_length=64, unique=True)),
+                ('type', models.CharField(max_length=16)),
+                ('record_id', models.IntegerField()),
+                ('event_id', models.IntegerField(null=True)),
+                ('name', models.TextField(blank=True)),
+                ('keyword', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('date', models.DateTimeField(null=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('indexed_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='api_searchdoc_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='api_searchdoc_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['body'], name='api_searchdoc_body_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
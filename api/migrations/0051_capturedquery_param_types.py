@@ -0,0 +1,19 @@
+# Generated by Django 2.2.10 on 2026-10-18 15:00
+
+from django.db import migrations
+
+
+def forget_captured_queries(apps, schema_editor):
+    # Recorded with their parameter values, which are no longer kept
+    apps.get_model('api', 'CapturedQuery').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0050_scheduledjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_captured_queries, migrations.RunPython.noop),
+    ]
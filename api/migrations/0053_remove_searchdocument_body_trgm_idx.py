@@ -0,0 +1,17 @@
+# Generated by Django 2.2.10 on 2026-10-18 15:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0052_changeevent_changed_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='searchdocument',
+            name='api_searchdoc_body_trgm_idx',
+        ),
+    ]
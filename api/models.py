@@ -6,6 +6,8 @@ from .storage import AzureStorage
 from tinymce import HTMLField
 from django.core.validators import FileExtensionValidator, validate_slug
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from datetime import datetime, timedelta
 import pytz
 from .utils import validate_slug_number
@@ -1345,6 +1347,173 @@ class CronJob(models.Model):
 
         return errors, new
 
+class AggregateRollup(models.Model):
+    """
+    Pre-aggregated totals behind AggregateByTime, maintained by api.rollups.
+    One row holds a measure (`count` or a summed field) of the records of
+    `model_type` starting in `bucket`, for all records (grouping `all`) or for
+    those of one country or region. 0 stands for no country/region/dtype.
+    """
+    model_type = models.CharField(max_length=16)
+    unit = models.CharField(max_length=5)
+    bucket = models.DateTimeField()
+    grouping = models.CharField(max_length=7)
+    country = models.IntegerField(default=0)
+    region = models.IntegerField(default=0)
+    dtype = models.IntegerField(default=0)
+    measure = models.CharField(max_length=50)
+    value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    nonnull = models.IntegerField(default=0, help_text='Number of records with a value for the measure')
+
+    class Meta:
+        unique_together = ('model_type', 'unit', 'bucket', 'grouping', 'country', 'region', 'dtype', 'measure')
+        index_together = ('model_type', 'unit', 'grouping', 'country', 'region', 'bucket')
+
+    def __str__(self):
+        return '%s %s %s %s' % (self.model_type, self.unit, self.bucket, self.measure)
+
+
+class OperationalSummary(models.Model):
+    """
+    Appeal, ERU and personnel deployment totals of the whole operation (scope
+    `global`) or of one country, region or event, maintained by api.summaries.
+    Active appeals are those not ended yet; `expires_at` is when the next one
+    ends, after which the row is recomputed.
+    """
+    scope = models.CharField(max_length=7)
+    scope_id = models.IntegerField(default=0)
+
+    appeal_count = models.IntegerField(default=0)
+    num_beneficiaries = models.BigIntegerField(default=0)
+    amount_requested = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    amount_funded = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    active_drefs = models.IntegerField(default=0)
+    active_appeals = models.IntegerField(default=0)
+    active_intl_appeals = models.IntegerField(default=0)
+    active_num_beneficiaries = models.BigIntegerField(default=0)
+    active_amount_requested = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    active_amount_funded = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # Emergency and international appeals only, DREFs left out
+    active_appeal_amount_requested = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    active_appeal_amount_funded = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    eru_units = models.IntegerField(default=0)
+    personnel_deployments = models.IntegerField(default=0)
+
+    expires_at = models.DateTimeField(null=True, blank=True)
+    is_stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('scope', 'scope_id')
+
+    def __str__(self):
+        return '%s %s' % (self.scope, self.scope_id)
+
+
+class CapturedQuery(models.Model):
+    """
+    SQL statements recorded by api.query_capture.QueryCaptureMiddleware,
+    aggregated by normalized statement (literals and IN lists collapsed).
+    Read by the recommend_indexes command.
+    """
+    fingerprint = models.CharField(max_length=32, unique=True)
+    statement = models.TextField()
+    sample_sql = models.TextField()
+    # The types of the parameters only, their values are not kept
+    sample_params = models.TextField(default='[]')
+    path = models.CharField(max_length=255, blank=True)
+    calls = models.IntegerField(default=0)
+    total_time = models.FloatField(default=0, help_text='Seconds')
+    max_time = models.FloatField(default=0, help_text='Seconds')
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Captured queries'
+
+    def __str__(self):
+        return self.statement[:100]
+
+
+class ChangeOperation(IntEnum):
+    CREATE = 0
+    UPDATE = 1
+    DELETE = 2
+
+
+class ChangeEvent(models.Model):
+    """
+    Outbox row written by api.outbox when a record of an indexed or notified
+    model is created, updated (including its countries) or deleted. Consumed
+    in id order by index_and_notify.
+    """
+    model = models.CharField(max_length=64)
+    record_id = models.IntegerField()
+    op = EnumIntegerField(ChangeOperation)
+    # Set by the database clock when the row is inserted, see api.outbox
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ('id',)
+
+    def __str__(self):
+        return '%s %s %s' % (self.model, self.record_id, self.op.name)
+
+
+class ChangeWatermark(models.Model):
+    """ Last ChangeEvent processed by a consumer of the outbox """
+    consumer = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s %s' % (self.consumer, self.last_id)
+
+
+class SearchDocument(models.Model):
+    """
+    A page of the search index kept in Postgres by api.search.PostgresSearchBackend,
+    built from the same indexing() dict as the Elasticsearch documents
+    """
+    doc_id = models.CharField(max_length=64, unique=True)
+    type = models.CharField(max_length=16)
+    record_id = models.IntegerField()
+    event_id = models.IntegerField(null=True)
+    name = models.TextField(blank=True)
+    keyword = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    date = models.DateTimeField(null=True)
+    search_vector = SearchVectorField(null=True)
+    indexed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='api_searchdoc_vector_idx'),
+            # Similar names (the `%` operator), like the edge n-grams of the `autocomplete` analyzer
+            GinIndex(fields=['name'], name='api_searchdoc_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return self.doc_id
+
+
+class ScheduledJob(models.Model):
+    """
+    A periodic job of a command, run through api.scheduler: when it is next
+    due, the end of its last successful run and the lease of the run in progress
+    """
+    name = models.CharField(max_length=64, unique=True)
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    next_due_at = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.name
+
+
 # To find related scripts from go-api root dir: grep -rl CronJob --exclude-dir=__pycache__ --exclude-dir=main --exclude-dir=migrations --exclude=CHANGELOG.md *
 
 from .triggers import *
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import lru_cache
+from itertools import takewhile
+
+from django.apps import apps
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .logger import logger
+from .models import ChangeEvent, ChangeOperation, ChangeWatermark
+
+# Models whose changes are written to the outbox, and their many-to-many fields read by indexing()
+OUTBOX_MODELS = OrderedDict((
+    ('api.Appeal', ()),
+    ('api.Event', ('countries',)),
+    ('api.FieldReport', ('countries',)),
+    ('notifications.SurgeAlert', ()),
+    ('deployments.PersonnelDeployment', ()),
+))
+
+# Rows are only read once this old, and older than every open transaction (see get_settled_before)
+SETTLE_TIME = timedelta(seconds=30)
+# Ids and insert times of concurrent transactions may be out of order by this much
+CLOCK_MARGIN = timedelta(seconds=1)
+# An open transaction holding the rows back for longer than this is logged
+HOLD_WARNING_TIME = timedelta(minutes=10)
+BATCH_SIZE = 5000
+RETENTION = timedelta(days=7)
+
+
+class ClockTimestamp(models.Func):
+    function = 'clock_timestamp'
+    template = '%(function)s()'
+    output_field = models.DateTimeField()
+
+
+def record_changes(model, record_ids, op):
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(model=model._meta.label, record_id=record_id, op=op, changed_at=ClockTimestamp())
+        for record_id in record_ids
+    ])
+
+
+# Signal handlers, connected in api.triggers
+def outbox_post_save(sender, instance, created, **kwargs):
+    record_changes(sender, [instance.pk], ChangeOperation.CREATE if created else ChangeOperation.UPDATE)
+
+
+def outbox_post_delete(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], ChangeOperation.DELETE)
+
+
+@lru_cache(maxsize=None)
+def get_through_models():
+    """{through model of an indexed many-to-many field: (model, field name)}"""
+    through_models = {}
+    for label, field_names in OUTBOX_MODELS.items():
+        model = apps.get_model(label)
+        for name in field_names:
+            through_models[model._meta.get_field(name).remote_field.through] = (model, name)
+    return through_models
+
+
+def outbox_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    model, field_name = get_through_models().get(sender, (None, None))
+    if model is None or action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear' and (pk_set is None or pk_set):
+            record_changes(model, [instance.pk], ChangeOperation.UPDATE)
+    elif action in ('post_add', 'post_remove'):
+        record_changes(model, pk_set, ChangeOperation.UPDATE)
+    elif action == 'pre_clear':
+        # The records losing `instance` are only known before the clear
+        record_ids = model.objects.filter(**{field_name: instance}).values_list('pk', flat=True)
+        record_changes(model, list(record_ids), ChangeOperation.UPDATE)
+
+
+class ChangeSet():
+    """The net change of each record in a batch of outbox rows"""
+
+    def __init__(self, events):
+        self.events = events
+        self.changes = {}
+        for event in events:
+            changes = self.changes.setdefault(event.model, OrderedDict())
+            # A record created in the batch stays new, whatever the updates
+            if changes.get(event.record_id) == ChangeOperation.CREATE and event.op == ChangeOperation.UPDATE:
+                continue
+            changes[event.record_id] = event.op
+
+    def __len__(self):
+        return len(self.events)
+
+    def get_ids(self, model, *ops):
+        changes = self.changes.get(model._meta.label, {})
+        return [record_id for record_id, op in changes.items() if op in ops]
+
+
+def get_settled_before():
+    """
+    The time before which no row can still be written: SETTLE_TIME ago, and
+    before the start of the oldest other open transaction of the database
+    (whose rows, not visible yet, may have lower ids), by the database clock.
+    Such a transaction holds the rows back for as long as it stays open, which
+    is logged past HOLD_WARNING_TIME.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT clock_timestamp(), oldest.pid, oldest.state, oldest.xact_start '
+            'FROM (SELECT 1) AS one LEFT JOIN ('
+            '  SELECT pid, state, xact_start FROM pg_stat_activity '
+            '  WHERE datname = current_database() AND pid <> pg_backend_pid() '
+            "  AND state <> 'idle' AND xact_start IS NOT NULL "
+            '  ORDER BY xact_start LIMIT 1'
+            ') AS oldest ON true'
+        )
+        now, pid, state, oldest_transaction = cursor.fetchone()
+    settled_before = now - SETTLE_TIME
+    if oldest_transaction is not None:
+        settled_before = min(settled_before, oldest_transaction - CLOCK_MARGIN)
+        if now - oldest_transaction > HOLD_WARNING_TIME:
+            logger.warning('Outbox rows held back since %s by the transaction of backend %s (%s)' % (
+                oldest_transaction.isoformat(), pid, state))
+    return settled_before
+
+
+@contextmanager
+def consume_changes(consumer, batch_size=BATCH_SIZE):
+    """
+    Yields the ChangeSet of the outbox rows after the watermark of `consumer`,
+    in id order up to the first one not settled, and moves the watermark past
+    them if the block completes. The watermark stays locked meanwhile: a
+    concurrent run gets None instead, and a block raising an error leaves the
+    rows to the next run.
+    """
+    ChangeWatermark.objects.get_or_create(consumer=consumer)
+    with transaction.atomic():
+        watermark = ChangeWatermark.objects.select_for_update(skip_locked=True).filter(consumer=consumer).first()
+        if watermark is None:
+            yield None
+            return
+        settled_before = get_settled_before()
+        # The watermark never passes a row which is not settled, whatever the rows after it
+        events = list(takewhile(
+            lambda event: event.changed_at < settled_before,
+            ChangeEvent.objects.filter(id__gt=watermark.last_id).order_by('id')[:batch_size],
+        ))
+        yield ChangeSet(events)
+        if events:
+            watermark.last_id = events[-1].id
+            watermark.save()
+
+
+def prune_changes():
+    """Deletes the outbox rows older than RETENTION which every consumer has processed"""
+    watermarks = ChangeWatermark.objects.values_list('last_id', flat=True)
+    if watermarks:
+        ChangeEvent.objects.filter(
+            id__lte=min(watermarks),
+            changed_at__lt=timezone.now() - RETENTION,
+        ).delete()
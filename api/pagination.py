@@ -0,0 +1,138 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .exceptions import BadRequest
+
+
+class KeysetLimitOffsetPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination with an opt-in keyset mode.
+
+    Passing `?cursor=` (empty for the first page) switches to keyset pagination on
+    the requested `ordering` plus `id` as a tiebreaker, so every page costs the same
+    as the first one. The view lists the orderings it supports in
+    `cursor_ordering_fields` and the fallback in `cursor_default_ordering`.
+    The response envelope (count, next, previous, results) is unchanged, except
+    that `count` is null: counting the rows would cost a scan on every page.
+    NULLs are always placed after the non-NULL values in keyset mode.
+    """
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = 0
+        self.display_page_controls = False
+        self.field, self.descending = self.get_cursor_ordering(request, view)
+        self.nullable = self.field != 'id' and queryset.model._meta.get_field(self.field).null
+        cursor = self.decode_cursor(request.query_params[self.cursor_query_param], queryset.model)
+
+        self.count = None
+        reverse = bool(cursor and cursor.get('r'))
+        queryset = queryset.order_by(*self.get_order_by(reverse))
+        if cursor:
+            queryset = queryset.filter(self.get_keyset_filter(cursor, reverse))
+
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if reverse:
+            results.reverse()
+
+        self.next_item = results[-1] if results and (has_more or reverse) else None
+        self.previous_item = results[0] if results and cursor and (has_more or not reverse) else None
+        return results
+
+    def get_cursor_ordering(self, request, view):
+        allowed = tuple(getattr(view, 'cursor_ordering_fields', ())) + ('id',)
+        ordering = request.query_params.get(api_settings.ORDERING_PARAM)
+        if not ordering:
+            ordering = getattr(view, 'cursor_default_ordering', '-id')
+        if ',' in ordering or ordering.lstrip('-') not in allowed:
+            raise BadRequest('Cursor pagination supports ordering by one of: %s' % ', '.join(allowed))
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def get_order_by(self, reverse):
+        descending = self.descending != reverse
+        nulls_last = not reverse
+        keys = [self.field, 'id'] if self.field != 'id' else ['id']
+        order_by = []
+        for key in keys:
+            expression = F(key).desc if descending else F(key).asc
+            if key == self.field and self.nullable:
+                order_by.append(expression(nulls_last=True) if nulls_last else expression(nulls_first=True))
+            else:
+                order_by.append(expression())
+        return order_by
+
+    def get_keyset_filter(self, cursor, reverse):
+        descending = self.descending != reverse
+        beyond = 'lt' if descending else 'gt'
+        after_id = Q(**{'id__%s' % beyond: cursor['id']})
+        if self.field == 'id':
+            return after_id
+
+        value = cursor['v']
+        if value is None:
+            # Already within the trailing NULLs (or, going back, leaving them)
+            null_rows = Q(**{'%s__isnull' % self.field: True}) & after_id
+            return null_rows if not reverse else null_rows | Q(**{'%s__isnull' % self.field: False})
+
+        condition = (
+            Q(**{'%s__%s' % (self.field, beyond): value}) |
+            Q(**{self.field: value}) & after_id
+        )
+        if self.nullable and not reverse:
+            condition |= Q(**{'%s__isnull' % self.field: True})
+        return condition
+
+    def get_item_value(self, item, key):
+        value = item[key] if isinstance(item, dict) else getattr(item, key)
+        return value.isoformat() if hasattr(value, 'isoformat') else value
+
+    def encode_cursor(self, item, reverse):
+        cursor = {'id': self.get_item_value(item, 'id'), 'r': reverse}
+        if self.field != 'id':
+            cursor['v'] = self.get_item_value(item, self.field)
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, encoded, model):
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            int(cursor['id'])
+            if self.field != 'id':
+                # A value the field can't parse would only fail once the query is built
+                model._meta.get_field(self.field).to_python(cursor['v'])
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise BadRequest('Invalid cursor')
+        return cursor
+
+    def get_cursor_link(self, item, reverse):
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(item, reverse))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_item is None:
+            return None
+        return self.get_cursor_link(self.next_item, False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if self.previous_item is None:
+            return None
+        return self.get_cursor_link(self.previous_item, True)
@@ -0,0 +1,84 @@
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Permissions of a user, computed once from get_all_permissions() and cached.
+# Permission changes drop the cached scopes (see api.triggers), but only for the
+# processes sharing the cache: with a process-local one the others keep a revoked
+# permission for up to USER_SCOPE_CACHE_TIMEOUT seconds.
+# countries/regions come from api.country_admin_<id>/api.region_admin_<id>,
+# per_countries/per_regions from api.per_country_admin_<id>/api.per_region_admin_<id>.
+UserScope = namedtuple('UserScope', (
+    'is_ifrc',
+    'is_superuser',
+    'per_core_admin',
+    'countries',
+    'regions',
+    'per_countries',
+    'per_regions',
+))
+ANONYMOUS_SCOPE = UserScope(False, False, False, (), (), (), ())
+
+GENERATION_KEY = 'user-scope-generation'
+SCOPE_KEY = 'user-scope:%s:%s'
+
+PREFIXES = (
+    ('countries', 'api.country_admin_'),
+    ('regions', 'api.region_admin_'),
+    ('per_countries', 'api.per_country_admin_'),
+    ('per_regions', 'api.per_region_admin_'),
+)
+
+
+def compute_user_scope(user):
+    permissions = user.get_all_permissions()
+    ids = {name: [] for name, prefix in PREFIXES}
+    for permission in permissions:
+        for name, prefix in PREFIXES:
+            if permission.startswith(prefix) and permission[len(prefix):].isdigit():
+                ids[name].append(int(permission[len(prefix):]))
+    return UserScope(
+        is_ifrc=user.is_superuser or 'api.ifrc_admin' in permissions,
+        is_superuser=user.is_superuser,
+        per_core_admin='api.per_core_admin' in permissions,
+        **{name: tuple(sorted(values)) for name, values in ids.items()}
+    )
+
+
+def get_scope_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Seeded from the clock so an evicted generation is never reused
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def get_user_scope(user):
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS_SCOPE
+    # Keep the scope on the user object for the rest of the request
+    scope = getattr(user, '_permission_scope', None)
+    if scope is not None:
+        return scope
+
+    key = SCOPE_KEY % (get_scope_generation(), user.pk)
+    scope = cache.get(key)
+    if scope is None:
+        scope = compute_user_scope(user)
+        cache.set(key, scope, settings.USER_SCOPE_CACHE_TIMEOUT)
+    user._permission_scope = scope
+    return scope
+
+
+def invalidate_user_scope(user_id):
+    cache.delete(SCOPE_KEY % (get_scope_generation(), user_id))
+
+
+def invalidate_all_user_scopes():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, int(time.time() * 1000), None)
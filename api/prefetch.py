@@ -0,0 +1,227 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.db.models.query import ModelIterable
+from rest_framework import serializers
+
+from .logger import logger
+
+# Nested serializers deeper than this are left to lazy loading
+MAX_PLAN_DEPTH = 4
+
+# select_related: tuple of join paths
+# prefetch_related: tuple of (path, related model, PrefetchPlan or None)
+PrefetchPlan = namedtuple('PrefetchPlan', ('select_related', 'prefetch_related'))
+EMPTY_PLAN = PrefetchPlan((), ())
+
+
+def resolve_relation(model, name):
+    """Returns (related_model, is_many) for a relation attribute of model, None otherwise."""
+    for field in model._meta.get_fields():
+        if not field.is_relation or field.related_model is None:
+            continue
+        if field.auto_created and not field.concrete:
+            # Reverse relation, addressed by its accessor name (`appeals`, `fieldreport_set`)
+            if field.get_accessor_name() != name:
+                continue
+        elif field.name != name:
+            continue
+        return field.related_model, field.many_to_many or field.one_to_many
+    return None
+
+
+def _join(prefix, name):
+    return '%s__%s' % (prefix, name) if prefix else name
+
+
+def _walk_source(model, source_attrs):
+    """
+    Follows a dotted serializer source (`country.name`, `deployment.event_deployed_to`)
+    through the model relations. The walk ends at the first many relation.
+    Returns (related_model, path, is_many, complete) for the last relation followed, or None.
+    """
+    path = ''
+    resolved = None
+    for index, attr in enumerate(source_attrs):
+        relation = resolve_relation(model, attr)
+        if relation is None:
+            break
+        model, is_many = relation
+        path = _join(path, attr)
+        resolved = (model, path, is_many, index == len(source_attrs) - 1)
+        if is_many:
+            break
+    return resolved
+
+
+def _add_relation(relation, select, prefetch):
+    related_model, path, is_many, _ = relation
+    if is_many:
+        prefetch.append((path, related_model, None))
+    else:
+        select.append(path)
+
+
+def _plan_serializer(serializer, model, depth):
+    select = []
+    prefetch = []
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+
+        if isinstance(field, (serializers.ListSerializer, serializers.ModelSerializer)):
+            child = getattr(field, 'child', field)
+            relation = _walk_source(model, field.source_attrs)
+            if relation is None:
+                continue
+            related_model, path, is_many, complete = relation
+            if not complete or depth >= MAX_PLAN_DEPTH or not isinstance(child, serializers.ModelSerializer):
+                _add_relation(relation, select, prefetch)
+                continue
+            child_plan = _plan_serializer(child, related_model, depth + 1)
+            if is_many:
+                prefetch.append((path, related_model, child_plan))
+            else:
+                select.append(path)
+                select.extend(_join(path, p) for p in child_plan.select_related)
+                prefetch.extend((_join(path, p), m, c) for (p, m, c) in child_plan.prefetch_related)
+
+        elif isinstance(field, serializers.ManyRelatedField):
+            relation = _walk_source(model, field.source_attrs)
+            if relation is not None:
+                _add_relation(relation, select, prefetch)
+
+        elif isinstance(field, serializers.RelatedField):
+            # Primary key fields read `<relation>_id` and need no join
+            if field.use_pk_only_optimization() and len(field.source_attrs) == 1:
+                continue
+            relation = _walk_source(model, field.source_attrs)
+            if relation is not None:
+                _add_relation(relation, select, prefetch)
+
+        elif len(field.source_attrs) > 1:
+            # Plain fields reaching through relations, e.g. source='country.name'
+            relation = _walk_source(model, field.source_attrs[:-1])
+            if relation is not None:
+                _add_relation(relation, select, prefetch)
+
+    # Longer paths already imply their prefixes
+    select = set(select)
+    select = tuple(sorted(p for p in select if not any(o.startswith(p + '__') for o in select)))
+    seen = set()
+    unique_prefetch = []
+    for item in prefetch:
+        if item[0] not in seen:
+            seen.add(item[0])
+            unique_prefetch.append(item)
+    return PrefetchPlan(select, tuple(unique_prefetch))
+
+
+@lru_cache(maxsize=1024)
+def get_prefetch_plan(serializer_class, fields=None, expand=None):
+    """
+    Walks the serializer field tree once and memoizes the resulting plan.
+    `fields`/`expand` are the sparse fieldset parameters of dynamic serializers,
+    so relations left out of the response are left out of the plan too.
+    """
+    meta = getattr(serializer_class, 'Meta', None)
+    model = getattr(meta, 'model', None)
+    if model is None or not issubclass(serializer_class, serializers.ModelSerializer):
+        return EMPTY_PLAN
+    serializer = serializer_class(context={'dynamic_fields': (fields, expand)})
+    return _plan_serializer(serializer, model, 0)
+
+
+def build_lookups(plan, existing=()):
+    """Turns a plan into select_related paths and prefetch_related lookups."""
+    lookups = []
+    for path, model, child_plan in plan.prefetch_related:
+        # A lookup the view already prefetches itself wins over the planned one
+        if any(path == e or path.startswith(e + '__') or e.startswith(path + '__') for e in existing):
+            continue
+        if child_plan is None or child_plan == EMPTY_PLAN:
+            lookups.append(path)
+            continue
+        selects, child_lookups = build_lookups(child_plan)
+        queryset = model._default_manager.all()
+        if selects:
+            queryset = queryset.select_related(*selects)
+        if child_lookups:
+            queryset = queryset.prefetch_related(*child_lookups)
+        lookups.append(Prefetch(path, queryset=queryset))
+    return plan.select_related, lookups
+
+
+def describe_plan(plan):
+    _, lookups = build_lookups(plan)
+    return 'select_related=%s prefetch_related=%s' % (
+        list(plan.select_related),
+        [getattr(lookup, 'prefetch_through', lookup) for lookup in lookups],
+    )
+
+
+class PrefetchPlannerMixin():
+    """
+    Applies the select_related/prefetch_related plan derived from the view's
+    serializer to the queryset. Hooks into filter_queryset so it also covers
+    views that override get_queryset. values() querysets are left alone.
+    """
+    _logged_plans = set()
+
+    def get_prefetch_plan(self):
+        serializer_class = self.get_serializer_class()
+        if serializer_class is None:
+            return EMPTY_PLAN
+        if self.request is not None and self.request.method == 'GET':
+            params = self.request.query_params
+            return get_prefetch_plan(serializer_class, params.get('fields'), params.get('expand'))
+        return get_prefetch_plan(serializer_class)
+
+    def apply_prefetch_plan(self, queryset):
+        if getattr(queryset, '_iterable_class', None) is not ModelIterable:
+            return queryset
+        serializer_class = self.get_serializer_class()
+        meta = getattr(serializer_class, 'Meta', None)
+        if serializer_class is None or getattr(meta, 'model', None) is not queryset.model:
+            return queryset
+
+        plan = self.get_prefetch_plan()
+        if plan == EMPTY_PLAN:
+            return queryset
+        existing = [getattr(l, 'prefetch_to', l) for l in queryset._prefetch_related_lookups]
+        selects, lookups = build_lookups(plan, existing)
+
+        if settings.DEBUG:
+            key = (self.__class__, serializer_class, plan)
+            if key not in self._logged_plans:
+                self._logged_plans.add(key)
+                logger.debug('Prefetch plan for %s (%s): %s' % (
+                    self.__class__.__name__, serializer_class.__name__, describe_plan(plan)))
+
+        if selects:
+            queryset = queryset.select_related(*selects)
+        if lookups:
+            queryset = queryset.prefetch_related(*lookups)
+        return queryset
+
+    def filter_queryset(self, queryset):
+        return self.apply_prefetch_plan(super().filter_queryset(queryset))
+
+
+def get_plan_models(model, plan):
+    """All models read when serializing `model` with the given plan."""
+    models = {model}
+    for path in plan.select_related:
+        current = model
+        for name in path.split('__'):
+            relation = resolve_relation(current, name)
+            if relation is None:
+                break
+            current = relation[0]
+            models.add(current)
+    for path, related_model, child_plan in plan.prefetch_related:
+        models |= get_plan_models(related_model, child_plan or EMPTY_PLAN)
+    return models
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import random
+import re
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
+
+from .logger import logger
+from .models import CapturedQuery
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER = re.compile(r'\b\d+\b')
+# Never recorded, their statements hold credentials
+SENSITIVE_TABLES = ('"authtoken_token"', '"auth_user"')
+# Stored instead of the parameter values, in this order (bool is an int)
+PARAM_TYPES = (
+    ('bool', bool), ('int', int), ('float', float), ('numeric', Decimal),
+    ('datetime', datetime), ('date', date), ('list', (list, tuple)), ('null', type(None)),
+)
+
+
+def normalize_statement(sql):
+    """The statement with IN lists and inlined numbers (LIMIT, OFFSET...) collapsed"""
+    return NUMBER.sub('?', IN_LIST.sub('IN (...)', sql))
+
+
+def get_param_type(value):
+    for name, types in PARAM_TYPES:
+        if isinstance(value, types):
+            return name
+    return 'str'
+
+
+def get_fingerprint(statement):
+    return hashlib.md5(statement.encode('utf-8')).hexdigest()
+
+
+class QueryRecorder():
+    """connection.execute_wrapper collecting the statements of a request"""
+
+    def __init__(self):
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.monotonic() - start
+            statement = normalize_statement(sql)
+            calls, total, longest, sample = self.statements.get(statement, (0, 0, 0, None))
+            if sample is None or duration > longest:
+                sample = (sql, params if not many else None)
+            self.statements[statement] = (calls + 1, total + duration, max(longest, duration), sample)
+
+
+def store_statements(statements, path):
+    for statement, (calls, total, longest, (sql, params)) in statements.items():
+        # Statements run with executemany have no single sample to EXPLAIN
+        if not sql.lstrip().upper().startswith('SELECT') or params is None:
+            continue
+        if any(table in sql for table in SENSITIVE_TABLES):
+            continue
+        fingerprint = get_fingerprint(statement)
+        update = dict(
+            calls=F('calls') + calls,
+            total_time=F('total_time') + total,
+            max_time=Greatest('max_time', Value(longest, output_field=FloatField())),
+        )
+        if CapturedQuery.objects.filter(fingerprint=fingerprint).update(**update):
+            continue
+        try:
+            with transaction.atomic():
+                CapturedQuery.objects.create(
+                    fingerprint=fingerprint,
+                    statement=statement,
+                    sample_sql=sql,
+                    sample_params=json.dumps([get_param_type(param) for param in params]),
+                    path=path[:255],
+                    calls=calls,
+                    total_time=total,
+                    max_time=longest,
+                )
+        except IntegrityError:
+            CapturedQuery.objects.filter(fingerprint=fingerprint).update(**update)
+
+
+class QueryCaptureMiddleware():
+    """
+    Records the SELECT statements and timings of a sample of the requests
+    (`QUERY_CAPTURE_SAMPLE_RATE`, between 0 and 1, off by default) into
+    CapturedQuery, for the recommend_indexes command.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.QUERY_CAPTURE_SAMPLE_RATE
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        try:
+            store_statements(recorder.statements, request.path)
+        except Exception as e:
+            logger.error('Could not store captured queries: %s' % e)
+        return response
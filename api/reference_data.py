@@ -0,0 +1,142 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import get_model_versions, is_shared_cache
+from .models import Country, DisasterType, District, Region
+
+
+def _lower(value):
+    return value.strip().lower() if value else None
+
+
+class ReferenceTable():
+    """
+    All rows of a small, rarely changing model, loaded once per process and
+    indexed in memory.
+
+    `indexes` maps an index name to a function returning the key of a row (None
+    to leave the row out of it). Keys of string indexes are lowercased, so
+    lookups are case insensitive. The table reloads lazily after a row changes:
+    right away when the change happened in this process (see api.triggers),
+    and within `REFERENCE_DATA_CHECK_INTERVAL` seconds otherwise: through the
+    model version counters of api.cache when the cache is shared, by reloading
+    unconditionally when it is not. Returned instances are shared, treat them
+    as read-only.
+    """
+
+    def __init__(self, model, indexes, select_related=(), depends_on=()):
+        self.model = model
+        self.index_keys = indexes
+        self.select_related = select_related
+        self.models = (model,) + tuple(depends_on)
+        self.lock = threading.Lock()
+        self.indexes = None
+        self.versions = None
+        self.checked_at = 0
+
+    def invalidate(self):
+        self.indexes = None
+
+    def is_stale(self):
+        if self.indexes is None:
+            return True
+        now = time.monotonic()
+        if now - self.checked_at < settings.REFERENCE_DATA_CHECK_INTERVAL:
+            return False
+        self.checked_at = now
+        if not is_shared_cache():
+            # Other processes can't bump the counters of a process-local cache
+            return True
+        return get_model_versions(self.models) != self.versions
+
+    def load(self):
+        # Read the versions first, a change during the load triggers another one
+        versions = get_model_versions(self.models)
+        indexes = {name: {} for name in self.index_keys}
+        indexes['id'] = {}
+        for obj in self.model.objects.select_related(*self.select_related).order_by(*self.model._meta.ordering, 'id'):
+            indexes['id'][obj.pk] = [obj]
+            for name, get_key in self.index_keys.items():
+                key = get_key(obj)
+                if key is not None:
+                    indexes[name].setdefault(key, []).append(obj)
+        self.indexes, self.versions, self.checked_at = indexes, versions, time.monotonic()
+
+    def get_indexes(self):
+        if self.is_stale():
+            with self.lock:
+                if self.is_stale():
+                    self.load()
+        return self.indexes
+
+    def normalize(self, value):
+        if isinstance(value, str):
+            return value.strip().lower()
+        return value
+
+    def filter(self, index, value):
+        """All rows with `value` in `index`, in the model ordering."""
+        return list(self.get_indexes()[index].get(self.normalize(value), ()))
+
+    def lookup(self, index, value):
+        """First row with `value` in `index`, or None."""
+        rows = self.get_indexes()[index].get(self.normalize(value))
+        return rows[0] if rows else None
+
+    def get(self, pk):
+        """Row with the primary key `pk`, or None. `pk` may be a numeric string."""
+        try:
+            return self.lookup('id', int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def all(self):
+        return [rows[0] for rows in self.get_indexes()['id'].values()]
+
+
+countries = ReferenceTable(
+    Country,
+    indexes={
+        'iso': lambda country: _lower(country.iso),
+        'iso3': lambda country: _lower(country.iso3),
+        'name': lambda country: _lower(country.name),
+        'region': lambda country: country.region_id,
+    },
+    select_related=('region',),
+    depends_on=(Region,),
+)
+
+regions = ReferenceTable(
+    Region,
+    indexes={
+        'name': lambda region: int(region.name),
+    },
+)
+
+districts = ReferenceTable(
+    District,
+    indexes={
+        'code': lambda district: _lower(district.code),
+        'name': lambda district: _lower(district.name),
+        'country': lambda district: district.country_id,
+    },
+    select_related=('country',),
+    depends_on=(Country,),
+)
+
+disaster_types = ReferenceTable(
+    DisasterType,
+    indexes={
+        'name': lambda dtype: _lower(dtype.name),
+    },
+)
+
+TABLES = {table.model: table for table in (countries, regions, districts, disaster_types)}
+
+
+def invalidate_reference_data(model):
+    for table in TABLES.values():
+        if model in table.models:
+            table.invalidate()
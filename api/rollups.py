@@ -0,0 +1,266 @@
+from collections import namedtuple
+from datetime import timezone
+from decimal import Decimal
+from functools import lru_cache
+
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth, TruncYear
+
+from .models import AggregateRollup
+
+# A model served by AggregateByTime: its date field and the fields summed in the rollups
+RollupSource = namedtuple('RollupSource', ('model_label', 'date_field', 'measures'))
+
+ROLLUP_SOURCES = {
+    'appeal': RollupSource('api.Appeal', 'start_date', ('num_beneficiaries', 'amount_requested', 'amount_funded')),
+    'event': RollupSource('api.Event', 'disaster_start_date', ('num_affected',)),
+    'fieldreport': RollupSource('api.FieldReport', 'created_at', ('num_affected',)),
+    'heop': RollupSource('deployments.Heop', 'start_date', ()),
+}
+
+UNITS = {
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+def get_source_model(source):
+    return apps.get_model(source.model_label)
+
+
+def get_location_fields(model):
+    """(country field, region field, many to many) of the model"""
+    if model._meta.get_field('countries' if hasattr(model, 'countries') else 'country').many_to_many:
+        return 'countries', 'regions', True
+    return 'country', 'region', False
+
+
+def truncate(value, unit):
+    value = value.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(month=1) if unit == 'year' else value
+
+
+def get_contributions(source, record):
+    """Rollup rows the record counts in, as {(unit, bucket, grouping, country, region, dtype): {measure: (value, nonnull)}}"""
+    date = getattr(record, source.date_field)
+    if date is None:
+        return {}
+    country_field, region_field, many_to_many = get_location_fields(record.__class__)
+    if many_to_many:
+        countries = set(getattr(record, country_field).values_list('id', flat=True))
+        regions = set(getattr(record, region_field).values_list('id', flat=True))
+    else:
+        countries = {getattr(record, country_field + '_id')} - {None}
+        regions = {getattr(record, region_field + '_id')} - {None}
+    dtype = record.dtype_id or 0
+
+    values = {'count': (1, 1)}
+    for measure in source.measures:
+        value = getattr(record, measure)
+        values[measure] = (Decimal(str(value or 0)), int(value is not None))
+
+    contributions = {}
+    for unit in UNITS:
+        bucket = truncate(date, unit)
+        contributions[(unit, bucket, 'all', 0, 0, dtype)] = values
+        for country in countries:
+            contributions[(unit, bucket, 'country', country, 0, dtype)] = values
+        for region in regions:
+            contributions[(unit, bucket, 'region', 0, region, dtype)] = values
+    return contributions
+
+
+def apply_contributions(model_type, old, new):
+    """Moves the rollups from the `old` contributions of a record to the `new` ones"""
+    deltas = {}
+    for sign, contributions in ((-1, old), (1, new)):
+        for key, values in contributions.items():
+            for measure, (value, nonnull) in values.items():
+                delta = deltas.setdefault(key + (measure,), [0, 0])
+                delta[0] += sign * value
+                delta[1] += sign * nonnull
+
+    for (unit, bucket, grouping, country, region, dtype, measure), (value, nonnull) in deltas.items():
+        if not value and not nonnull:
+            continue
+        lookup = dict(
+            model_type=model_type, unit=unit, bucket=bucket, grouping=grouping,
+            country=country, region=region, dtype=dtype, measure=measure,
+        )
+        update = dict(value=F('value') + value, nonnull=F('nonnull') + nonnull)
+        if AggregateRollup.objects.filter(**lookup).update(**update):
+            continue
+        try:
+            with transaction.atomic():
+                AggregateRollup.objects.create(value=value, nonnull=nonnull, **lookup)
+        except IntegrityError:
+            # Created concurrently
+            AggregateRollup.objects.filter(**lookup).update(**update)
+
+
+def get_model_type(model):
+    for model_type, source in ROLLUP_SOURCES.items():
+        if get_source_model(source) is model:
+            return model_type
+    return None
+
+
+# Signal handlers, connected in api.triggers
+def rollup_pre_save(sender, instance, **kwargs):
+    source = ROLLUP_SOURCES[get_model_type(sender)]
+    old = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._rollup_contributions = get_contributions(source, old) if old is not None else {}
+
+
+def rollup_post_save(sender, instance, **kwargs):
+    model_type = get_model_type(sender)
+    old = getattr(instance, '_rollup_contributions', {})
+    instance._rollup_contributions = get_contributions(ROLLUP_SOURCES[model_type], instance)
+    apply_contributions(model_type, old, instance._rollup_contributions)
+
+
+def rollup_pre_delete(sender, instance, **kwargs):
+    model_type = get_model_type(sender)
+    apply_contributions(model_type, get_contributions(ROLLUP_SOURCES[model_type], instance), {})
+
+
+@lru_cache(maxsize=None)
+def get_through_models():
+    """{through model of a location m2m: source model}"""
+    through_models = {}
+    for source in ROLLUP_SOURCES.values():
+        model = get_source_model(source)
+        country_field, region_field, many_to_many = get_location_fields(model)
+        if many_to_many:
+            for name in (country_field, region_field):
+                through_models[model._meta.get_field(name).remote_field.through] = model
+    return through_models
+
+
+def rollup_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    model = get_through_models().get(sender)
+    if model is None or action not in ('pre_add', 'pre_remove', 'pre_clear', 'post_add', 'post_remove', 'post_clear'):
+        return
+    model_type = get_model_type(model)
+    source = ROLLUP_SOURCES[model_type]
+
+    if action.startswith('pre_'):
+        # The records whose countries/regions are about to change
+        if not reverse:
+            records = [instance]
+        elif pk_set is not None:
+            records = list(model.objects.filter(pk__in=pk_set))
+        else:
+            field_name = next(
+                field.name for field in model._meta.many_to_many if field.remote_field.through is sender
+            )
+            records = list(model.objects.filter(**{field_name: instance}))
+        instance._rollup_m2m = [(record, get_contributions(source, record)) for record in records]
+        return
+
+    for record, old in getattr(instance, '_rollup_m2m', ()):
+        apply_contributions(model_type, old, get_contributions(source, record))
+    instance._rollup_m2m = ()
+
+
+def rebuild_rollups(model_type):
+    """Recomputes all rollups of `model_type` from the records"""
+    source = ROLLUP_SOURCES[model_type]
+    model = get_source_model(source)
+    country_field, region_field, many_to_many = get_location_fields(model)
+    rows = []
+    for unit, trunc in UNITS.items():
+        for grouping, field in (('all', None), ('country', country_field), ('region', region_field)):
+            queryset = model.objects.filter(**{'%s__isnull' % source.date_field: False})
+            group_by = ['bucket', 'dtype']
+            if field is not None:
+                queryset = queryset.filter(**{'%s__isnull' % field: False})
+                group_by.append(field)
+            annotations = {'count': Count('id')}
+            for measure in source.measures:
+                annotations['sum_%s' % measure] = Sum(measure)
+                annotations['nonnull_%s' % measure] = Count(measure)
+            queryset = queryset \
+                .annotate(bucket=trunc(source.date_field, tzinfo=timezone.utc)) \
+                .values(*group_by) \
+                .annotate(**annotations) \
+                .order_by()
+            for group in queryset:
+                key = dict(
+                    model_type=model_type, unit=unit, bucket=group['bucket'], grouping=grouping,
+                    country=group[country_field] if grouping == 'country' else 0,
+                    region=group[region_field] if grouping == 'region' else 0,
+                    dtype=group['dtype'] or 0,
+                )
+                rows.append(AggregateRollup(measure='count', value=group['count'], nonnull=group['count'], **key))
+                for measure in source.measures:
+                    rows.append(AggregateRollup(
+                        measure=measure,
+                        value=group['sum_%s' % measure] or 0,
+                        nonnull=group['nonnull_%s' % measure],
+                        **key
+                    ))
+    with transaction.atomic():
+        AggregateRollup.objects.filter(model_type=model_type).delete()
+        AggregateRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def aggregate_from_rollups(model_type, unit, start_date, country=None, region=None, filters=None, sums=None):
+    """
+    The AggregateByTime result ([{'timespan', 'count', <sum names>}...]) read from
+    the rollups, or None when the request can not be answered from them: a start
+    date within a bucket, a filter other than `dtype` or a sum of a field which
+    is not rolled up.
+    """
+    source = ROLLUP_SOURCES[model_type]
+    filters = filters or {}
+    sums = sums or {}
+    if truncate(start_date, unit) != start_date:
+        return None
+    if set(filters) - {'dtype'} or set(sums.values()) - set(source.measures):
+        return None
+
+    lookup = dict(model_type=model_type, unit=unit, bucket__gte=start_date)
+    try:
+        if country is not None:
+            lookup.update(grouping='country', country=int(country))
+        elif region is not None:
+            lookup.update(grouping='region', region=int(region))
+        else:
+            lookup.update(grouping='all')
+        if 'dtype' in filters:
+            lookup['dtype'] = int(filters['dtype'])
+    except ValueError:
+        return None
+
+    measures = {'count'} | set(sums.values())
+    rows = AggregateRollup.objects \
+        .filter(measure__in=measures, **lookup) \
+        .values('bucket', 'measure') \
+        .annotate(total=Sum('value'), total_nonnull=Sum('nonnull')) \
+        .order_by('bucket')
+    buckets = {}
+    for row in rows:
+        buckets.setdefault(row['bucket'], {})[row['measure']] = (row['total'], row['total_nonnull'])
+
+    model = get_source_model(source)
+    aggregate = []
+    for bucket, totals in sorted(buckets.items()):
+        count = int(totals.get('count', (0, 0))[0])
+        # Rows emptied by deletions
+        if not count:
+            continue
+        item = {'timespan': bucket, 'count': count}
+        for name, field in sums.items():
+            total, nonnull = totals.get(field, (0, 0))
+            if not nonnull:
+                item[name] = None
+            elif model._meta.get_field(field).get_internal_type() == 'DecimalField':
+                item[name] = total
+            else:
+                item[name] = int(total)
+        aggregate.append(item)
+    return aggregate
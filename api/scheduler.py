@@ -0,0 +1,61 @@
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ScheduledJob
+
+# Due every `period`, `offset` after the start of a period; periods count from EPOCH, a Monday
+Schedule = namedtuple('Schedule', ('period', 'offset'))
+# The interval a run processes: since the previous successful run, at most `max_window`
+JobWindow = namedtuple('JobWindow', ('start', 'end'))
+
+EPOCH = datetime(1970, 1, 5, tzinfo=timezone.utc)
+# A run still going after this long is considered dead, and the job is run again
+LEASE_TIME = timedelta(minutes=30)
+
+
+def get_next_due(schedule, after):
+    """The first due time after `after`, or `after` itself for a job run every time"""
+    if schedule is None:
+        return after
+    periods = (after - EPOCH - schedule.offset) // schedule.period + 1
+    return EPOCH + schedule.offset + periods * schedule.period
+
+
+@contextmanager
+def run_job(name, schedule=None, max_window=None, lease=LEASE_TIME):
+    """
+    Yields the JobWindow of the job if it is due and no other run holds its
+    lease, None otherwise. Once the block completes the window end becomes the
+    last success, and the job is next due at the following scheduled time,
+    however many were missed: a late run catches up once, over at most
+    `max_window`. A block raising an error releases the lease and leaves the
+    job due, so the next run retries the same interval.
+    """
+    now = timezone.now()
+    ScheduledJob.objects.get_or_create(name=name, defaults={'next_due_at': get_next_due(schedule, now)})
+    claimed = ScheduledJob.objects \
+        .filter(name=name, next_due_at__lte=now) \
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now)) \
+        .update(locked_until=now + lease)
+    if not claimed:
+        yield None
+        return
+
+    start = ScheduledJob.objects.values_list('last_success_at', flat=True).get(name=name)
+    if max_window is not None and (start is None or start < now - max_window):
+        start = now - max_window
+    try:
+        yield JobWindow(start, now)
+    except Exception as e:
+        ScheduledJob.objects.filter(name=name).update(locked_until=None, last_error=str(e))
+        raise
+    ScheduledJob.objects.filter(name=name).update(
+        last_success_at=now,
+        next_due_at=get_next_due(schedule, now),
+        locked_until=None,
+        last_error='',
+    )
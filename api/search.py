@@ -0,0 +1,366 @@
+import abc
+import copy
+import hashlib
+import json
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Func, Q, TextField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from elasticsearch.client import IndicesClient
+from elasticsearch.helpers import bulk, parallel_bulk, streaming_bulk
+
+from .cache import bump_version, get_version, is_shared_cache
+from .esconnection import ES_BULK_TIMEOUT, ES_CLIENT
+from .indexes import GenericMapping, GenericSetting, ES_PAGE_NAME
+from .logger import logger
+from .models import Appeal, ChangeOperation, Event, FieldReport, SearchDocument
+
+INDEX_VERSION_KEY = 'search-index-version'
+MAX_LIMIT = 50
+HIGHLIGHT_SIZE = 150
+
+
+def invalidate_search_cache():
+    """Called by the indexing commands after the index changed"""
+    bump_version(INDEX_VERSION_KEY)
+
+
+def iter_chunks(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SearchBackend(abc.ABC):
+    """
+    Where the pages found by /api/v1/es_search/ are indexed. A page is the
+    indexing() dict of a record, identified by its es_id(). `target` is where
+    a full rebuild writes, as returned by begin_rebuild(); None is the index
+    being searched.
+    """
+
+    @abc.abstractmethod
+    def health(self):
+        pass
+
+    @abc.abstractmethod
+    def search(self, phrase, page_type, offset, limit):
+        """The `hits` of the search, with a `facets` count of the matches of each type"""
+
+    @abc.abstractmethod
+    def index_records(self, records, target=None, chunk_size=500, threads=1):
+        """Indexes the records, yielding (ok, document id or error) for each"""
+
+    @abc.abstractmethod
+    def delete_records(self, model, record_ids, target=None):
+        """Removes the pages of the records, returns the errors"""
+
+    @abc.abstractmethod
+    def begin_rebuild(self):
+        pass
+
+    @abc.abstractmethod
+    def finish_rebuild(self, target, keep=1):
+        pass
+
+    @abc.abstractmethod
+    def abort_rebuild(self, target):
+        pass
+
+
+class ElasticsearchBackend(SearchBackend):
+    """
+    The page_all alias. Rebuilds load a new page_all_<timestamp> index with
+    refresh disabled and no replicas, then move the alias to it.
+    """
+
+    def health(self):
+        return ES_CLIENT.cluster.health()
+
+    def build_query(self, phrase, page_type, offset, limit):
+        return {
+            'query': {
+                'multi_match': {
+                    'query': phrase,
+                    'fields': ['keyword^3', 'body']
+                }
+            },
+            # Applied after the aggregation, so the facets count every type
+            'post_filter': {'term': {'type': page_type}} if page_type is not None else {'match_all': {}},
+            'sort': [
+                '_score',
+                {'date': {'order': 'desc', 'missing': '_last'}},
+            ],
+            'aggs': {
+                'types': {'terms': {'field': 'type'}},
+            },
+            'highlight': {
+                'fields': {'body': {'fragment_size': HIGHLIGHT_SIZE, 'number_of_fragments': 1}},
+            },
+            'from': offset,
+            'size': limit,
+        }
+
+    def search(self, phrase, page_type, offset, limit):
+        results = ES_CLIENT.search(
+            index=ES_PAGE_NAME,
+            doc_type='page',
+            body=json.dumps(self.build_query(phrase, page_type, offset, limit)),
+        )
+        hits = results['hits']
+        hits['facets'] = {
+            bucket['key']: bucket['doc_count'] for bucket in results['aggregations']['types']['buckets']
+        }
+        return hits
+
+    def convert_for_bulk(self, record, index_name, op_type):
+        data = record.indexing()
+        metadata = {
+            '_op_type': op_type,
+            '_index': index_name,
+            '_type': 'page',
+            '_id': record.es_id(),
+        }
+        data.update(**metadata)
+        return data
+
+    def index_records(self, records, target=None, chunk_size=500, threads=1):
+        # Overwrites: the changes replayed at the end of a rebuild update pages it already wrote
+        index_name = target if target is not None else ES_PAGE_NAME
+        actions = (self.convert_for_bulk(record, index_name, 'index') for record in records)
+        if threads > 1:
+            return parallel_bulk(
+                ES_CLIENT, actions, thread_count=threads, chunk_size=chunk_size, raise_on_error=False,
+                request_timeout=ES_BULK_TIMEOUT)
+        return streaming_bulk(
+            ES_CLIENT, actions, chunk_size=chunk_size, raise_on_error=False, request_timeout=ES_BULK_TIMEOUT)
+
+    def delete_records(self, model, record_ids, target=None):
+        actions = [{
+            '_op_type': 'delete',
+            '_index': target if target is not None else ES_PAGE_NAME,
+            '_type': 'page',
+            '_id': model(pk=record_id).es_id(),
+        } for record_id in record_ids]
+        if not actions:
+            return []
+        deleted, errors = bulk(ES_CLIENT, actions, raise_on_error=False, request_timeout=ES_BULK_TIMEOUT)
+        # Deleting a record which was never indexed
+        return [error for error in errors if error.get('delete', {}).get('status') != 404]
+
+    def begin_rebuild(self):
+        index_name = '%s_%s' % (ES_PAGE_NAME, timezone.now().strftime('%Y%m%d%H%M%S'))
+        body = copy.deepcopy(GenericSetting)
+        # No refresh and no replica to copy to while loading, restored by finish_rebuild
+        body['settings'].update(refresh_interval='-1', number_of_replicas=0)
+        indices_client = IndicesClient(client=ES_CLIENT)
+        indices_client.create(index=index_name, body=body)
+        indices_client.put_mapping(doc_type='page', index=index_name, body=GenericMapping)
+        return index_name
+
+    def finish_rebuild(self, target, keep=1):
+        indices_client = IndicesClient(client=ES_CLIENT)
+        index_settings = GenericSetting['settings']
+        indices_client.put_settings(index=target, body={'index': {
+            # None resets a setting to the cluster default
+            'refresh_interval': index_settings.get('refresh_interval'),
+            'number_of_replicas': index_settings.get('number_of_replicas'),
+        }})
+        indices_client.refresh(index=target)
+        ES_CLIENT.cluster.health(index=target, wait_for_status='yellow', request_timeout=120)
+        self.swap_alias(indices_client, ES_PAGE_NAME, target)
+        self.delete_old_indices(indices_client, ES_PAGE_NAME, target, keep)
+
+    def abort_rebuild(self, target):
+        IndicesClient(client=ES_CLIENT).delete(index=target)
+
+    def swap_alias(self, indices_client, alias, index_name):
+        actions = []
+        if indices_client.exists_alias(name=alias):
+            for old_index in indices_client.get_alias(name=alias):
+                actions.append({'remove': {'index': old_index, 'alias': alias}})
+        elif indices_client.exists(index=alias):
+            # An index built before the alias was introduced, replaced in the same request
+            actions.append({'remove_index': {'index': alias}})
+        actions.append({'add': {'index': index_name, 'alias': alias}})
+        indices_client.update_aliases(body={'actions': actions})
+        logger.info('Moved alias %s to %s' % (alias, index_name))
+
+    def delete_old_indices(self, indices_client, alias, index_name, keep):
+        """Deletes the previous versions of the index but the `keep` most recent ones"""
+        old_indices = sorted(
+            (name for name in indices_client.get(index='%s_*' % alias) if name != index_name),
+            reverse=True,
+        )
+        for old_index in old_indices[keep:]:
+            logger.info('Deleting old index %s' % old_index)
+            indices_client.delete(index=old_index)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    The SearchDocument table, matched by prefix on its search vector (like the
+    `autocomplete` edge n-grams) or by trigram similarity of the name (the `%`
+    operator, above pg_trgm.similarity_threshold, 0.3 by default).
+    Rebuilds rewrite the pages in place, then delete those not rewritten.
+    """
+    config = 'simple'
+
+    def health(self):
+        return {'status': 'green', 'backend': 'postgres', 'number_of_documents': SearchDocument.objects.count()}
+
+    def get_query(self, phrase):
+        terms = re.findall(r'\w+', phrase.lower())
+        if not terms:
+            return None
+        return SearchQuery(' & '.join('%s:*' % term for term in terms), config=self.config, search_type='raw')
+
+    def search(self, phrase, page_type, offset, limit):
+        query = self.get_query(phrase)
+        if query is None:
+            return {'total': 0, 'max_score': None, 'hits': [], 'facets': {}}
+        # `%` rather than a filter on the similarity, which the trigram index can not serve
+        matches = SearchDocument.objects \
+            .filter(Q(search_vector=query) | Q(name__trigram_similar=phrase)) \
+            .annotate(similarity=TrigramSimilarity('name', phrase))
+        facets = {
+            row['type']: row['count'] for row in matches.values('type').annotate(count=Count('id')).order_by()
+        }
+        if page_type is not None:
+            matches = matches.filter(type=page_type)
+
+        page = matches.annotate(
+            score=Coalesce(SearchRank(F('search_vector'), query), 0, output_field=FloatField()) + F('similarity'),
+            headline=Func(
+                Value(self.config), F('body'), query,
+                Value('StartSel=<em>, StopSel=</em>, MaxWords=25, MinWords=10'),
+                function='ts_headline', output_field=TextField(),
+            ),
+        ).order_by('-score', F('date').desc(nulls_last=True))[offset:offset + limit]
+
+        hits = [{
+            '_index': 'postgres',
+            '_type': 'page',
+            '_id': document.doc_id,
+            '_score': document.score,
+            '_source': {
+                'id': document.record_id,
+                'event_id': document.event_id,
+                'type': document.type,
+                'name': document.name,
+                'keyword': document.keyword or None,
+                'body': document.body,
+                'date': document.date,
+            },
+            'highlight': {'body': [document.headline]},
+        } for document in page]
+        return {
+            'total': sum(facets.values()) if page_type is None else facets.get(page_type, 0),
+            'max_score': hits[0]['_score'] if hits else None,
+            'hits': hits,
+            'facets': facets,
+        }
+
+    def convert_to_document(self, record, indexed_at):
+        data = record.indexing()
+        return SearchDocument(
+            doc_id=record.es_id(),
+            type=data['type'],
+            record_id=data['id'],
+            event_id=data['event_id'],
+            name=data['name'] or '',
+            keyword=data['keyword'] or '',
+            body=data['body'] or '',
+            date=data['date'],
+            indexed_at=indexed_at,
+        )
+
+    def index_records(self, records, target=None, chunk_size=500, threads=1):
+        for chunk in iter_chunks(records, chunk_size):
+            documents = [self.convert_to_document(record, timezone.now()) for record in chunk]
+            doc_ids = [document.doc_id for document in documents]
+            with transaction.atomic():
+                SearchDocument.objects.filter(doc_id__in=doc_ids).delete()
+                SearchDocument.objects.bulk_create(documents)
+                SearchDocument.objects.filter(doc_id__in=doc_ids).update(search_vector=(
+                    SearchVector('keyword', weight='A', config=self.config) +
+                    SearchVector('name', weight='B', config=self.config) +
+                    SearchVector('body', weight='C', config=self.config)
+                ))
+            for doc_id in doc_ids:
+                yield True, doc_id
+
+    def delete_records(self, model, record_ids, target=None):
+        SearchDocument.objects.filter(doc_id__in=[model(pk=record_id).es_id() for record_id in record_ids]).delete()
+        return []
+
+    def begin_rebuild(self):
+        return timezone.now()
+
+    def finish_rebuild(self, target, keep=1):
+        deleted, _ = SearchDocument.objects.filter(indexed_at__lt=target).delete()
+        logger.info('Deleted %s pages of removed records' % deleted)
+
+    def abort_rebuild(self, target):
+        pass
+
+
+BACKENDS = {
+    'elasticsearch': ElasticsearchBackend,
+    'postgres': PostgresSearchBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """The backend chosen by SEARCH_BACKEND"""
+    return BACKENDS[settings.SEARCH_BACKEND]()
+
+
+def index_changes(changes, target=None):
+    """
+    Applies a ChangeSet of the outbox to the index being searched, or to the
+    `target` of a rebuild. Returns the errors; connection errors are raised.
+    """
+    backend = get_search_backend()
+    errors = []
+    for model in (FieldReport, Appeal, Event):
+        changed_ids = changes.get_ids(model, ChangeOperation.CREATE, ChangeOperation.UPDATE)
+        records = list(model.objects.filter(pk__in=changed_ids).prefetch_related(
+            *(['countries'] if model is not Appeal else [])
+        ))
+        deleted_ids = set(changes.get_ids(model, ChangeOperation.DELETE))
+        # Changed, then deleted after the outbox row was written
+        deleted_ids.update(set(changed_ids) - set(record.pk for record in records))
+        logger.info('Indexing %s changed and %s deleted %s' % (
+            len(records), len(deleted_ids), model._meta.verbose_name_plural))
+        errors += [item for ok, item in backend.index_records(records, target) if not ok]
+        errors += backend.delete_records(model, deleted_ids, target)
+    return errors
+
+
+def search_pages(phrase, page_type=None, offset=0, limit=10):
+    # The index version is bumped by the indexing commands, web workers only see it through a shared cache
+    if not is_shared_cache():
+        return get_search_backend().search(phrase, page_type, offset, limit)
+    key = 'search:%s' % hashlib.md5(json.dumps(
+        [get_version(INDEX_VERSION_KEY), settings.SEARCH_BACKEND, phrase.strip().lower(), page_type, offset, limit]
+    ).encode('utf-8')).hexdigest()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    hits = get_search_backend().search(phrase, page_type, offset, limit)
+    cache.set(key, hits, settings.SEARCH_CACHE_TIMEOUT)
+    return hits
@@ -35,130 +35,207 @@ from .models import (
     FieldReport,
 )
 from notifications.models import Subscription
-
-class DisasterTypeSerializer(serializers.ModelSerializer):
+from .permission_scope import get_user_scope
+
+
+def _parse_field_paths(value):
+    # 'id,country.name' -> {'id': {}, 'country': {'name': {}}}
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def _get_subtree(tree, path):
+    for part in path:
+        tree = tree.get(part)
+        if tree is None:
+            return None
+    return tree
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer honouring `?fields=` and `?expand=` on GET requests.
+
+    `fields` is a comma separated list of (dotted) field paths to keep, e.g.
+    `?fields=id,name,country.name`. When `expand` is given, nested relations
+    not listed in it (or reached through `fields`) are rendered as primary keys.
+    Outside of a request the same values can be passed in the `dynamic_fields`
+    context entry as a (fields, expand) tuple.
+    """
+
+    def get_dynamic_params(self):
+        request = self.context.get('request')
+        if request is not None:
+            if request.method != 'GET':
+                return None, None
+            return request.query_params.get('fields'), request.query_params.get('expand')
+        return self.context.get('dynamic_fields', (None, None))
+
+    def get_field_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            # Children of list serializers are bound with an empty field name
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return path[::-1]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.get_dynamic_params()
+        if requested is None and expand is None:
+            return fields
+
+        path = self.get_field_path()
+        requested_node = _get_subtree(_parse_field_paths(requested), path) if requested else None
+        if requested_node:
+            for name in list(fields):
+                if name not in requested_node:
+                    fields.pop(name)
+
+        if expand is not None:
+            expand_node = _get_subtree(_parse_field_paths(expand), path) or {}
+            for name, field in list(fields.items()):
+                nested = getattr(field, 'child', field)
+                if field.source == '*' or not isinstance(nested, serializers.ModelSerializer):
+                    continue
+                if name in expand_node or (requested_node and requested_node.get(name)):
+                    continue
+                kwargs = {'read_only': True, 'many': isinstance(field, serializers.ListSerializer)}
+                if field.source and field.source != name:
+                    kwargs['source'] = field.source
+                fields[name] = serializers.PrimaryKeyRelatedField(**kwargs)
+        return fields
+
+class DisasterTypeSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = DisasterType
         fields = ('name', 'summary', 'id',)
 
-class RegionSerializer(serializers.ModelSerializer):
+class RegionSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Region
         fields = ('name', 'id', 'region_name')
 
 
-class CountrySerializer(serializers.ModelSerializer):
+class CountrySerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Country
         fields = ('name', 'iso', 'society_name', 'society_url', 'region', 'overview', 'key_priorities', 'inform_score', 'id',)
 
-class MiniCountrySerializer(serializers.ModelSerializer):
+class MiniCountrySerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Country
         fields = ('name', 'iso', 'society_name', 'id', 'record_type',)
 
-class RegoCountrySerializer(serializers.ModelSerializer):
+class RegoCountrySerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Country
         fields = ('name', 'society_name', 'region', 'id',)
 
-class NotCountrySerializer(serializers.ModelSerializer): # fake serializer for a short data response for PER
+class NotCountrySerializer(DynamicFieldsModelSerializer): # fake serializer for a short data response for PER
     class Meta:
         model = Country
         fields = ('id',)
 
-class DistrictSerializer(serializers.ModelSerializer):
+class DistrictSerializer(DynamicFieldsModelSerializer):
     country = MiniCountrySerializer()
     class Meta:
         model = District
         fields = ('name', 'code', 'country', 'country_iso', 'country_name', 'id',)
 
-class MiniDistrictSerializer(serializers.ModelSerializer):
+class MiniDistrictSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = District
         fields = ('name', 'code', 'country_iso', 'country_name', 'id', 'is_enclave',)
 
 
-class RegionKeyFigureSerializer(serializers.ModelSerializer):
+class RegionKeyFigureSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = RegionKeyFigure
         fields = ('region', 'figure', 'deck', 'source', 'visibility', 'id',)
 
-class CountryKeyFigureSerializer(serializers.ModelSerializer):
+class CountryKeyFigureSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = CountryKeyFigure
         fields = ('country', 'figure', 'deck', 'source', 'visibility', 'id',)
 
-class RegionSnippetSerializer(serializers.ModelSerializer):
+class RegionSnippetSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = RegionSnippet
         fields = ('region', 'snippet', 'image', 'visibility', 'id',)
 
-class CountrySnippetSerializer(serializers.ModelSerializer):
+class CountrySnippetSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = CountrySnippet
         fields = ('country', 'snippet', 'image', 'visibility', 'id',)
 
-class RegionLinkSerializer(serializers.ModelSerializer):
+class RegionLinkSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = RegionLink
         fields = ('title', 'url', 'id',)
 
-class CountryLinkSerializer(serializers.ModelSerializer):
+class CountryLinkSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = CountryLink
         fields = ('title', 'url', 'id',)
 
-class RegionContactSerializer(serializers.ModelSerializer):
+class RegionContactSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = RegionContact
         fields = ('ctype', 'name', 'title', 'email', 'id',)
 
-class CountryContactSerializer(serializers.ModelSerializer):
+class CountryContactSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = CountryContact
         fields = ('ctype', 'name', 'title', 'email', 'id',)
 
-class RegionRelationSerializer(serializers.ModelSerializer):
+class RegionRelationSerializer(DynamicFieldsModelSerializer):
     links = RegionLinkSerializer(many=True, read_only=True)
     contacts = RegionContactSerializer(many=True, read_only=True)
     class Meta:
         model = Region
         fields = ('links', 'contacts', 'name', 'id',)
 
-class CountryRelationSerializer(serializers.ModelSerializer):
+class CountryRelationSerializer(DynamicFieldsModelSerializer):
     links = CountryLinkSerializer(many=True, read_only=True)
     contacts = CountryContactSerializer(many=True, read_only=True)
     class Meta:
         model = Country
         fields = ('links', 'contacts', 'name', 'iso', 'society_name', 'society_url', 'region', 'overview', 'key_priorities', 'inform_score', 'id',)
 
-class RelatedAppealSerializer(serializers.ModelSerializer):
+class RelatedAppealSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Appeal
         fields = ('aid', 'num_beneficiaries', 'amount_requested', 'amount_funded', 'status', 'start_date', 'id',)
 
-class KeyFigureSerializer(serializers.ModelSerializer):
+class KeyFigureSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = KeyFigure
         fields = ('number', 'deck', 'source', 'id',)
 
-class SnippetSerializer(serializers.ModelSerializer):
+class SnippetSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Snippet
         fields = ('event', 'snippet', 'image', 'visibility', 'position', 'id',)
 
-class EventContactSerializer(serializers.ModelSerializer):
+class EventContactSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = EventContact
         fields = ('ctype', 'name', 'title', 'email', 'phone', 'event', 'id',)
 
-class FieldReportContactSerializer(serializers.ModelSerializer):
+class FieldReportContactSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = FieldReportContact
         fields = ('ctype', 'name', 'title', 'email', 'phone', 'id',)
 
-class MiniFieldReportSerializer(serializers.ModelSerializer):
+class MiniFieldReportSerializer(DynamicFieldsModelSerializer):
     contacts = FieldReportContactSerializer(many=True)
     class Meta:
         model = FieldReport
@@ -172,12 +249,12 @@ class MiniFieldReportSerializer(serializers.ModelSerializer):
 
 # The list serializer can include a smaller subset of the to-many fields.
 # Also include a very minimal one for linking, and no other related fields.
-class MiniEventSerializer(serializers.ModelSerializer):
+class MiniEventSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Event
         fields = ('name', 'dtype', 'id', 'slug',)
 
-class ListEventSerializer(serializers.ModelSerializer):
+class ListEventSerializer(DynamicFieldsModelSerializer):
     appeals = RelatedAppealSerializer(many=True, read_only=True)
     countries = MiniCountrySerializer(many=True)
     field_reports = MiniFieldReportSerializer(many=True, read_only=True)
@@ -192,7 +269,7 @@ class ListEventDeploymentsSerializer(serializers.Serializer):
     deployments = serializers.IntegerField()
 
 
-class DetailEventSerializer(serializers.ModelSerializer):
+class DetailEventSerializer(DynamicFieldsModelSerializer):
     appeals = RelatedAppealSerializer(many=True, read_only=True)
     contacts = EventContactSerializer(many=True, read_only=True)
     key_figures = KeyFigureSerializer(many=True, read_only=True)
@@ -204,18 +281,18 @@ class DetailEventSerializer(serializers.ModelSerializer):
         fields = ('name', 'dtype', 'countries', 'districts', 'summary', 'num_affected', 'ifrc_severity_level', 'glide', 'disaster_start_date', 'created_at', 'auto_generated', 'appeals', 'contacts', 'key_figures', 'is_featured', 'is_featured_region', 'field_reports', 'hide_attached_field_reports', 'updated_at', 'id', 'slug',)
         lookup_field = 'slug'
 
-class SituationReportTypeSerializer(serializers.ModelSerializer):
+class SituationReportTypeSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = SituationReportType
         fields = ('type', 'id', )
 
-class SituationReportSerializer(serializers.ModelSerializer):
+class SituationReportSerializer(DynamicFieldsModelSerializer):
     type = SituationReportTypeSerializer()
     class Meta:
         model = SituationReport
         fields = ('created_at', 'name', 'document', 'document_url', 'event', 'type', 'id', )
 
-class AppealSerializer(serializers.ModelSerializer):
+class AppealSerializer(DynamicFieldsModelSerializer):
     country = MiniCountrySerializer()
     dtype = DisasterTypeSerializer()
     region = RegionSerializer()
@@ -223,23 +300,30 @@ class AppealSerializer(serializers.ModelSerializer):
         model = Appeal
         fields = ('aid', 'name', 'dtype', 'atype', 'status', 'code', 'sector', 'num_beneficiaries', 'amount_requested', 'amount_funded', 'start_date', 'end_date', 'created_at', 'modified_at', 'event', 'needs_confirmation', 'country', 'region', 'id',)
 
-class AppealDocumentSerializer(serializers.ModelSerializer):
+    # Exclude the event if it requires confirmation
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.needs_confirmation and 'event' in data:
+            data['event'] = None
+        return data
+
+class AppealDocumentSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = AppealDocument
         fields = ('created_at', 'name', 'document', 'document_url', 'appeal', 'id',)
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(DynamicFieldsModelSerializer):
     country = MiniCountrySerializer()
     class Meta:
         model = Profile
         fields = ('country', 'org', 'org_type', 'city', 'department', 'position', 'phone_number')
 
-class MiniSubscriptionSerializer(serializers.ModelSerializer):
+class MiniSubscriptionSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Subscription
         fields = ('stype', 'rtype', 'country', 'region', 'event', 'dtype', 'lookup_id',)
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsModelSerializer):
     profile = ProfileSerializer()
     subscription = MiniSubscriptionSerializer(many=True)
     class Meta:
@@ -273,36 +357,30 @@ class UserMeSerializer(UserSerializer):
         fields = UserSerializer.Meta.fields + ('is_admin_for_countries', 'is_admin_for_regions')
 
     def get_is_admin_for_countries(self, user):
-        return set([
-            int(permission[18:]) for permission in user.get_all_permissions()
-            if ('api.country_admin_' in permission and permission[18:].isdigit())
-        ])
+        return set(get_user_scope(user).countries)
 
     def get_is_admin_for_regions(self, user):
-        return set([
-            int(permission[17:]) for permission in user.get_all_permissions()
-            if ('api.region_admin_' in permission and permission[17:].isdigit())
-        ])
+        return set(get_user_scope(user).regions)
 
 
-class ActionSerializer(serializers.ModelSerializer):
+class ActionSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Action
         fields = ('name', 'id', 'organizations', 'field_report_types',)
 
-class ActionsTakenSerializer(serializers.ModelSerializer):
+class ActionsTakenSerializer(DynamicFieldsModelSerializer):
     actions = ActionSerializer(many=True)
     class Meta:
         model = ActionsTaken
         fields = ('organization', 'actions', 'summary', 'id',)
 
-class SourceSerializer(serializers.ModelSerializer):
+class SourceSerializer(DynamicFieldsModelSerializer):
     stype = serializers.SlugRelatedField(slug_field='name', read_only=True)
     class Meta:
         model = Source
         fields = ('stype', 'spec', 'id',)
 
-class ListFieldReportSerializer(serializers.ModelSerializer):
+class ListFieldReportSerializer(DynamicFieldsModelSerializer):
     countries = MiniCountrySerializer(many=True)
     dtype = DisasterTypeSerializer()
     event = MiniEventSerializer()
@@ -310,7 +388,7 @@ class ListFieldReportSerializer(serializers.ModelSerializer):
         model = FieldReport
         fields = ('created_at', 'updated_at', 'report_date', 'summary', 'event', 'dtype', 'countries', 'visibility', 'id',)
 
-class DetailFieldReportSerializer(serializers.ModelSerializer):
+class DetailFieldReportSerializer(DynamicFieldsModelSerializer):
     user = UserSerializer()
     dtype = DisasterTypeSerializer()
     contacts = FieldReportContactSerializer(many=True)
@@ -323,7 +401,7 @@ class DetailFieldReportSerializer(serializers.ModelSerializer):
         model = FieldReport
         fields = '__all__'
 
-class CreateFieldReportSerializer(serializers.ModelSerializer):
+class CreateFieldReportSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = FieldReport
         fields = '__all__'
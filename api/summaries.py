@@ -0,0 +1,176 @@
+from django.apps import apps
+from django.db.models import Count, Min, Q, Sum
+from django.utils import timezone
+
+from . import reference_data
+from .models import Appeal, AppealType, Event, OperationalSummary
+
+SCOPES = ('global', 'country', 'region', 'event')
+
+# Lookup of the rows of each model counted in a scope
+APPEAL_SCOPE_FIELDS = {'country': 'country_id', 'region': 'region_id', 'event': 'event_id'}
+ERU_SCOPE_FIELDS = {'country': 'deployed_to_id', 'region': 'deployed_to__region_id', 'event': 'event_id'}
+PERSONNEL_SCOPE_FIELDS = {
+    'country': 'country_deployed_to_id',
+    'region': 'region_deployed_to_id',
+    'event': 'event_deployed_to_id',
+}
+
+# Largest value of an integer column
+MAX_ID = 2 ** 31 - 1
+
+SUMMARY_FIELDS = (
+    'appeal_count', 'num_beneficiaries', 'amount_requested', 'amount_funded',
+    'active_drefs', 'active_appeals', 'active_intl_appeals',
+    'active_num_beneficiaries', 'active_amount_requested', 'active_amount_funded',
+    'active_appeal_amount_requested', 'active_appeal_amount_funded',
+    'eru_units', 'personnel_deployments',
+)
+
+
+def scope_filter(fields, scope, scope_id):
+    return {fields[scope]: scope_id} if scope != 'global' else {}
+
+
+def compute_summary(scope, scope_id):
+    now = timezone.now()
+    active = Q(end_date__gt=now)
+    active_appeal = active & Q(atype__in=[AppealType.APPEAL, AppealType.INTL])
+    values = Appeal.objects.filter(**scope_filter(APPEAL_SCOPE_FIELDS, scope, scope_id)).aggregate(
+        appeal_count=Count('id'),
+        num_beneficiaries=Sum('num_beneficiaries'),
+        amount_requested=Sum('amount_requested'),
+        amount_funded=Sum('amount_funded'),
+        active_drefs=Count('id', filter=active & Q(atype=AppealType.DREF)),
+        active_appeals=Count('id', filter=active & Q(atype=AppealType.APPEAL)),
+        active_intl_appeals=Count('id', filter=active & Q(atype=AppealType.INTL)),
+        active_num_beneficiaries=Sum('num_beneficiaries', filter=active),
+        active_amount_requested=Sum('amount_requested', filter=active),
+        active_amount_funded=Sum('amount_funded', filter=active),
+        active_appeal_amount_requested=Sum('amount_requested', filter=active_appeal),
+        active_appeal_amount_funded=Sum('amount_funded', filter=active_appeal),
+        expires_at=Min('end_date', filter=active),
+    )
+    values['eru_units'] = apps.get_model('deployments.ERU').objects \
+        .filter(**scope_filter(ERU_SCOPE_FIELDS, scope, scope_id)) \
+        .aggregate(units=Sum('units'))['units']
+    values['personnel_deployments'] = apps.get_model('deployments.PersonnelDeployment').objects \
+        .filter(**scope_filter(PERSONNEL_SCOPE_FIELDS, scope, scope_id)) \
+        .count()
+    for field in SUMMARY_FIELDS:
+        values[field] = values[field] or 0
+    return values
+
+
+def compute_totals(scope, scope_ids):
+    """
+    {scope id: totals} of the appeals, ERUs and personnel deployments of many
+    countries, regions or events, with one grouped query per model and without
+    the cached rows
+    """
+    totals = {scope_id: {
+        'num_beneficiaries': 0, 'amount_requested': 0, 'amount_funded': 0, 'eru_units': 0, 'personnel_deployments': 0,
+    } for scope_id in scope_ids}
+    field = APPEAL_SCOPE_FIELDS[scope]
+    for row in Appeal.objects.filter(**{'%s__in' % field: scope_ids}).values(field).order_by().annotate(
+            num_beneficiaries=Sum('num_beneficiaries'),
+            amount_requested=Sum('amount_requested'),
+            amount_funded=Sum('amount_funded')):
+        totals[row.pop(field)].update((key, value or 0) for key, value in row.items())
+    field = ERU_SCOPE_FIELDS[scope]
+    for row in apps.get_model('deployments.ERU').objects.filter(**{'%s__in' % field: scope_ids}) \
+            .values(field).order_by().annotate(units=Sum('units')):
+        totals[row[field]]['eru_units'] = row['units'] or 0
+    field = PERSONNEL_SCOPE_FIELDS[scope]
+    for row in apps.get_model('deployments.PersonnelDeployment').objects.filter(**{'%s__in' % field: scope_ids}) \
+            .values(field).order_by().annotate(count=Count('id')):
+        totals[row[field]]['personnel_deployments'] = row['count']
+    return totals
+
+
+def refresh_summary(scope, scope_id):
+    # Cleared before computing, so a change made meanwhile leaves the row stale
+    OperationalSummary.objects.update_or_create(scope=scope, scope_id=scope_id, defaults={'is_stale': False})
+    values = compute_summary(scope, scope_id)
+    OperationalSummary.objects.filter(scope=scope, scope_id=scope_id).update(updated_at=timezone.now(), **values)
+    return OperationalSummary.objects.get(scope=scope, scope_id=scope_id)
+
+
+def needs_refresh(summary, now):
+    return summary.is_stale or (summary.expires_at is not None and summary.expires_at <= now)
+
+
+def get_summaries(scope, scope_ids):
+    """{scope id: OperationalSummary}, recomputing the missing, stale and expired ones"""
+    now = timezone.now()
+    summaries = {
+        summary.scope_id: summary
+        for summary in OperationalSummary.objects.filter(scope=scope, scope_id__in=scope_ids)
+    }
+    for scope_id in scope_ids:
+        if scope_id not in summaries or needs_refresh(summaries[scope_id], now):
+            summaries[scope_id] = refresh_summary(scope, scope_id)
+    return summaries
+
+
+def scope_exists(scope, scope_id):
+    """Checked before get_summary() for a requested id, which would store a summary of any id"""
+    if scope == 'global':
+        return True
+    if not 0 < scope_id <= MAX_ID:
+        return False
+    if scope == 'country':
+        return reference_data.countries.get(scope_id) is not None
+    if scope == 'region':
+        return reference_data.regions.get(scope_id) is not None
+    return Event.objects.filter(pk=scope_id).exists()
+
+
+def get_summary(scope, scope_id=0):
+    if scope == 'global':
+        scope_id = 0
+    return get_summaries(scope, [scope_id])[scope_id]
+
+
+def mark_stale(scopes):
+    """Flags the summaries of the given (scope, scope id) pairs, and the global one, for recomputation"""
+    condition = Q(scope='global')
+    for scope, scope_id in scopes:
+        if scope_id is not None:
+            condition |= Q(scope=scope, scope_id=scope_id)
+    OperationalSummary.objects.filter(condition).update(is_stale=True)
+
+
+def get_country_region(country_id):
+    country = reference_data.countries.get(country_id) if country_id is not None else None
+    return country.region_id if country is not None else None
+
+
+def get_record_scopes(instance):
+    if isinstance(instance, Appeal):
+        return [('country', instance.country_id), ('region', instance.region_id), ('event', instance.event_id)]
+    if instance._meta.label == 'deployments.ERU':
+        return [
+            ('country', instance.deployed_to_id),
+            ('region', get_country_region(instance.deployed_to_id)),
+            ('event', instance.event_id),
+        ]
+    return [
+        ('country', instance.country_deployed_to_id),
+        ('region', instance.region_deployed_to_id),
+        ('event', instance.event_deployed_to_id),
+    ]
+
+
+# Signal handlers, connected in api.triggers
+def summary_pre_save(sender, instance, **kwargs):
+    old = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._summary_scopes = get_record_scopes(old) if old is not None else []
+
+
+def summary_post_save(sender, instance, **kwargs):
+    mark_stale(getattr(instance, '_summary_scopes', []) + get_record_scopes(instance))
+
+
+def summary_post_delete(sender, instance, **kwargs):
+    mark_stale(get_record_scopes(instance))
@@ -1,6 +1,7 @@
 import time
 from datetime import timedelta
 from django.test import TestCase
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.utils.crypto import get_random_string
 from notifications.models import Country, Region, DisasterType, RecordType, SubscriptionType, Subscription
@@ -13,6 +14,9 @@ def get_user():
     email = '%s@email.com' % username
     return User.objects.create(username=username, password='12345678', email=email)
 
+def get_time_threshold():
+    return timezone.now() - timedelta(minutes=5)
+
 class FieldReportNotificationTest(TestCase):
     def setUp(self):
         region = Region.objects.create(name=1)
@@ -36,7 +40,7 @@ class FieldReportNotificationTest(TestCase):
         )
         notify = Notify()
         emails = notify.gather_subscribers(
-            FieldReport.objects.filter(created_at__gte=notify.get_time_threshold()),
+            FieldReport.objects.filter(created_at__gte=get_time_threshold()),
             RecordType.NEW_EMERGENCIES, #FIELD_REPORT,
             SubscriptionType.NEW,
         )
@@ -54,7 +58,7 @@ class FieldReportNotificationTest(TestCase):
         )
         notify = Notify()
         emails = notify.gather_subscribers(
-            FieldReport.objects.filter(created_at__gte=notify.get_time_threshold()),
+            FieldReport.objects.filter(created_at__gte=get_time_threshold()),
             RecordType.FIELD_REPORT,
             SubscriptionType.NEW,
         )
@@ -72,7 +76,7 @@ class FieldReportNotificationTest(TestCase):
         )
         notify = Notify()
         emails = notify.gather_subscribers(
-            FieldReport.objects.filter(created_at__gte=notify.get_time_threshold()),
+            FieldReport.objects.filter(created_at__gte=get_time_threshold()),
             RecordType.FIELD_REPORT,
             SubscriptionType.NEW,
         )
@@ -90,7 +94,7 @@ class FieldReportNotificationTest(TestCase):
         )
         notify = Notify()
         emails = notify.gather_subscribers(
-            FieldReport.objects.filter(created_at__gte=notify.get_time_threshold()),
+            FieldReport.objects.filter(created_at__gte=get_time_threshold()),
             RecordType.FIELD_REPORT,
             SubscriptionType.NEW,
         )
@@ -127,7 +131,7 @@ class FieldReportNotificationTest(TestCase):
 
         notify = Notify()
         emails = notify.gather_subscribers(
-            FieldReport.objects.filter(created_at__gte=notify.get_time_threshold()),
+            FieldReport.objects.filter(created_at__gte=get_time_threshold()),
             RecordType.FIELD_REPORT,
             SubscriptionType.NEW,
         )
@@ -172,7 +176,7 @@ class AppealNotificationTest(TestCase):
         )
         notify = Notify()
         emails = notify.gather_subscribers(
-            Appeal.objects.filter(created_at__gte=notify.get_time_threshold()),
+            Appeal.objects.filter(created_at__gte=get_time_threshold()),
             RecordType.APPEAL,
             SubscriptionType.NEW,
         )
@@ -196,7 +200,7 @@ class AppealNotificationTest(TestCase):
         )
         notify = Notify()
         emails = notify.gather_subscribers(
-            Appeal.objects.filter(created_at__gte=notify.get_time_threshold()),
+            Appeal.objects.filter(created_at__gte=get_time_threshold()),
             RecordType.APPEAL,
             SubscriptionType.NEW,
         )
@@ -215,6 +219,6 @@ class FilterJustCreatedTest(TestCase):
 
     def test_filter_just_created(self):
         notify = Notify()
-        filtered = notify.filter_just_created(Appeal.objects.filter(created_at__gte=notify.get_time_threshold()))
+        filtered = notify.filter_just_created(Appeal.objects.filter(created_at__gte=get_time_threshold()))
         self.assertEqual(len(filtered), 1)
         self.assertEqual(filtered[0].aid, 'test2')
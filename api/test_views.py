@@ -1,10 +1,37 @@
+import base64
+import csv
 import json
-from django.test import TestCase
-from rest_framework.test import APITestCase
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth.models import User, Permission
+from deployments.models import Personnel, PersonnelDeployment
 import api.models as models
 import api.drf_views as views
+from api import reference_data
+from api.authentication import token_cache
+from api.cache import CachedResponseMixin, ConditionalGetMixin
+from api.management.commands.index_and_notify import Command
+from api.management.commands.index_elasticsearch import Command as IndexCommand
+from api.models import ChangeEvent, ChangeOperation
+from api.outbox import consume_changes
+from api.permission_scope import get_user_scope
+from api.prefetch import get_plan_models, get_prefetch_plan
+from api.rollups import rebuild_rollups
+from api.scheduler import EPOCH, Schedule, get_next_due, run_job
+from api.search import PostgresSearchBackend, SearchBackend
+from api.serializers import AppealSerializer, ListEventSerializer
+from api.streaming import StreamingCSVMixin
+from api.typeahead import typeahead_index
 
 
 class AuthTokenTest(APITestCase):
@@ -212,3 +239,787 @@ class ActionTestCase(APITestCase):
         res2 = response['results'][1]
         self.assertEqual(res2['organizations'], [])
         self.assertEqual(res2['field_report_types'], [EARLY_WARNING])
+
+
+class PrefetchPlanTest(APITestCase):
+
+    fixtures = ['DisasterTypes']
+
+    def test_event_list_plan(self):
+        plan = get_prefetch_plan(ListEventSerializer)
+        self.assertIn('dtype', plan.select_related)
+        prefetched = {path: child_plan for (path, model, child_plan) in plan.prefetch_related}
+        self.assertIn('appeals', prefetched)
+        self.assertIn('countries', prefetched)
+        self.assertIn('field_reports', prefetched)
+        self.assertIn('contacts', [path for (path, model, child) in prefetched['field_reports'].prefetch_related])
+
+    def test_event_list_query_count_is_constant(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        country = models.Country.objects.create(name='country')
+
+        def create_event(name):
+            event = models.Event.objects.create(name=name, dtype=dtype)
+            event.countries.add(country)
+            models.Appeal.objects.create(aid=name, name=name, event=event, country=country, dtype=dtype)
+            report = models.FieldReport.objects.create(rid=name, summary=name, event=event, dtype=dtype)
+            models.FieldReportContact.objects.create(field_report=report, ctype='Test', name=name)
+
+        create_event('one')
+        with CaptureQueriesContext(connection) as single:
+            response = self.client.get('/api/v2/event/')
+        self.assertEqual(response.status_code, 200)
+
+        for name in ('two', 'three', 'four'):
+            create_event(name)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/api/v2/event/')
+        self.assertEqual(json.loads(response.content)['count'], 4)
+        self.assertEqual(len(single), len(many))
+
+
+class KeysetPaginationTest(APITestCase):
+
+    def test_appeal_cursor_pages(self):
+        base = timezone.now()
+        days = [3, 1, 1, None, 2]
+        for index, day in enumerate(days):
+            models.Appeal.objects.create(
+                aid=str(index),
+                name='appeal %s' % index,
+                start_date=base - timedelta(days=day) if day is not None else None,
+            )
+        expected = [
+            appeal.id for appeal in sorted(
+                models.Appeal.objects.all(),
+                key=lambda a: (a.start_date is None, -(a.start_date.timestamp() if a.start_date else 0), -a.id),
+            )
+        ]
+
+        seen = []
+        pages = []
+        url = '/api/v2/appeal/?limit=2&cursor=&ordering=-start_date'
+        while url:
+            response = json.loads(self.client.get(url).content)
+            self.assertIsNone(response['count'])
+            seen.extend(appeal['id'] for appeal in response['results'])
+            pages.append(response)
+            url = response['next']
+        self.assertEqual(seen, expected)
+        self.assertIsNone(pages[0]['previous'])
+
+        # Walking back from the last page returns the middle page again
+        response = json.loads(self.client.get(pages[-1]['previous']).content)
+        self.assertEqual(
+            [appeal['id'] for appeal in response['results']],
+            [appeal['id'] for appeal in pages[1]['results']],
+        )
+
+    def test_unsupported_cursor_ordering(self):
+        response = self.client.get('/api/v2/appeal/?cursor=&ordering=name')
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_cursor_value(self):
+        cursor = {'id': 1, 'r': False, 'v': 'not a date'}
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii')
+        response = self.client.get('/api/v2/appeal/?cursor=%s&ordering=-start_date' % encoded)
+        self.assertEqual(response.status_code, 400)
+
+
+class ResponseCacheTest(APITestCase):
+
+    fixtures = ['DisasterTypes']
+
+    def test_cached_until_model_changes(self):
+        response = self.client.get('/api/v2/disaster_type/?limit=100')
+        count = json.loads(response.content)['count']
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/v2/disaster_type/?limit=100')
+        self.assertEqual(cached.content, response.content)
+
+        models.DisasterType.objects.create(name='new type', summary='')
+        response = self.client.get('/api/v2/disaster_type/?limit=100')
+        self.assertEqual(json.loads(response.content)['count'], count + 1)
+
+    def test_cache_models_cover_serializers(self):
+        for viewset in set(CachedResponseMixin.__subclasses__()) | set(ConditionalGetMixin.__subclasses__()):
+            declared = set(viewset.cache_models)
+            for action in ('list', 'retrieve') + tuple(getattr(viewset, 'cached_actions', ())):
+                serializer_class = viewset(action=action).get_serializer_class()
+                plan_models = get_plan_models(serializer_class.Meta.model, get_prefetch_plan(serializer_class))
+                self.assertEqual(set(model._meta.label for model in plan_models) - declared, set(), viewset)
+
+
+class ConditionalGetTest(APITestCase):
+
+    fixtures = ['DisasterTypes']
+
+    def test_event_list_not_modified(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        event = models.Event.objects.create(name='disaster1', summary='test disaster1', dtype=dtype)
+        response = self.client.get('/api/v2/event/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get('/api/v2/event/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        event.name = 'disaster2'
+        event.save()
+        response = self.client.get('/api/v2/event/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_event_list_validators(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        events = [
+            models.Event.objects.create(name='disaster%s' % i, summary='test disaster', dtype=dtype) for i in range(2)
+        ]
+        response = self.client.get('/api/v2/event/')
+        csv_response = self.client.get('/api/v2/event/', HTTP_ACCEPT='text/csv')
+        self.assertNotEqual(csv_response['ETag'], response['ETag'])
+        self.assertIn('Accept', response['Vary'])
+
+        # A date can't tell a deletion apart, If-Modified-Since is ignored
+        events[0].delete()
+        response = self.client.get('/api/v2/event/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_unconfirmed_appeal_event_hidden(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        event = models.Event.objects.create(name='disaster1', summary='test disaster1', dtype=dtype)
+        appeal = models.Appeal.objects.create(aid='1', name='appeal', event=event, needs_confirmation=True)
+        response = json.loads(self.client.get('/api/v2/appeal/%s/' % appeal.id).content)
+        self.assertIsNone(response['event'])
+        response = json.loads(self.client.get('/api/v2/appeal/').content)
+        self.assertIsNone(response['results'][0]['event'])
+
+
+class SparseFieldsTest(APITestCase):
+
+    fixtures = ['DisasterTypes']
+
+    def test_appeal_fields_and_expand(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        country = models.Country.objects.create(name='country', iso='CC')
+        models.Appeal.objects.create(aid='1', name='appeal', dtype=dtype, country=country)
+
+        response = json.loads(self.client.get('/api/v2/appeal/?fields=id,name,country.name').content)
+        self.assertEqual(set(response['results'][0].keys()), {'id', 'name', 'country'})
+        self.assertEqual(response['results'][0]['country'], {'name': 'country'})
+
+        response = json.loads(self.client.get('/api/v2/appeal/?expand=country').content)
+        result = response['results'][0]
+        self.assertEqual(result['dtype'], dtype.id)
+        self.assertEqual(result['country']['iso'], 'CC')
+
+    def test_plan_follows_fields(self):
+        plan = get_prefetch_plan(ListEventSerializer, 'id,name,countries.name', None)
+        self.assertEqual(plan.select_related, ())
+        self.assertEqual([path for (path, model, child) in plan.prefetch_related], ['countries'])
+
+
+class StreamingCSVTest(APITestCase):
+
+    fixtures = ['DisasterTypes']
+
+    def test_field_report_stream_respects_visibility(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        models.FieldReport.objects.create(
+            rid='public', summary='public report', dtype=dtype, visibility=models.VisibilityChoices.PUBLIC)
+        models.FieldReport.objects.create(
+            rid='ifrc', summary='ifrc report', dtype=dtype, visibility=models.VisibilityChoices.IFRC)
+        response = self.client.get('/api/v2/field_report/?format=csv&stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual([row['summary'] for row in rows], ['public report'])
+
+    def test_rows_are_read_once(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        for index in range(3):
+            models.FieldReport.objects.create(
+                rid=str(index), summary=str(index), dtype=dtype, visibility=models.VisibilityChoices.PUBLIC)
+        iter_chunks = mock.Mock(side_effect=StreamingCSVMixin.iter_chunks)
+        with mock.patch.object(StreamingCSVMixin, 'csv_chunk_size', 2), \
+                mock.patch.object(StreamingCSVMixin, 'iter_chunks', lambda view, queryset: iter_chunks(view, queryset)):
+            response = self.client.get('/api/v2/field_report/?format=csv&stream=1')
+            content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(iter_chunks.call_count, 1)
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(sorted(row['summary'] for row in rows), ['0', '1', '2'])
+
+
+class ValuesProjectionTest(APITestCase):
+
+    fixtures = ['DisasterTypes']
+
+    def test_appeal_list_matches_serializer(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        region = models.Region.objects.create(name=1)
+        country = models.Country.objects.create(name='country', iso='CC', region=region)
+        event = models.Event.objects.create(name='disaster1', summary='test disaster1', dtype=dtype)
+        models.Appeal.objects.create(
+            aid='1', name='confirmed', dtype=dtype, event=event, country=country, region=region,
+            amount_requested=1234.5, start_date=timezone.now(),
+        )
+        models.Appeal.objects.create(aid='2', name='unconfirmed', event=event, needs_confirmation=True)
+
+        response = json.loads(self.client.get('/api/v2/appeal/?ordering=id').content)
+        request = Request(APIRequestFactory().get('/api/v2/appeal/'))
+        expected = AppealSerializer(
+            models.Appeal.objects.order_by('id'), many=True, context={'request': request}).data
+        self.assertEqual(json.dumps(response['results']), json.dumps(json.loads(json.dumps(expected))))
+        self.assertIsNone(response['results'][1]['event'])
+
+
+class PermissionScopeTest(APITestCase):
+
+    def test_scope_follows_permission_changes(self):
+        country = models.Country.objects.create(name='country')
+        user = User.objects.create(username='scoped')
+        self.assertEqual(get_user_scope(User.objects.get(pk=user.pk)).countries, ())
+
+        permission = Permission.objects.create(
+            codename='country_admin_%s' % country.id,
+            name='Country admin',
+            content_type=ContentType.objects.get_for_model(models.Country),
+        )
+        user.user_permissions.add(permission)
+        scope = get_user_scope(User.objects.get(pk=user.pk))
+        self.assertEqual(scope.countries, (country.id,))
+        self.assertFalse(scope.is_ifrc)
+
+        self.client.force_authenticate(user=User.objects.get(pk=user.pk))
+        response = json.loads(self.client.get('/api/v2/user/me/').content)
+        self.assertEqual(response['is_admin_for_countries'], [country.id])
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+
+    def test_token_lookup_is_cached_and_invalidated(self):
+        token_cache.clear()
+        user = User.objects.create(username='tokenuser')
+        token = Token.objects.create(user=user)
+        auth = 'Token %s' % token.key
+
+        self.assertEqual(self.client.get('/api/v2/user/me/', HTTP_AUTHORIZATION=auth).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v2/user/me/', HTTP_AUTHORIZATION=auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['username'], 'tokenuser')
+        self.assertFalse([query for query in queries if 'authtoken_token' in query['sql']])
+
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get('/api/v2/user/me/', HTTP_AUTHORIZATION=auth).status_code, 401)
+
+        token.delete()
+        self.assertEqual(self.client.get('/api/v2/user/me/', HTTP_AUTHORIZATION=auth).status_code, 401)
+
+
+class ReferenceDataTest(APITestCase):
+
+    def test_country_lookups_follow_changes(self):
+        region = models.Region.objects.create(name=2)
+        country = models.Country.objects.create(name='Nepal', iso='NP', iso3='NPL', region=region)
+
+        self.assertEqual(reference_data.countries.lookup('iso', 'np').pk, country.pk)
+        self.assertEqual(reference_data.countries.lookup('iso3', 'npl').pk, country.pk)
+        self.assertEqual(reference_data.countries.filter('region', region.pk)[0].pk, country.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(reference_data.countries.lookup('name', ' nepal ').region.pk, region.pk)
+
+        country.name = 'Federal Democratic Republic of Nepal'
+        country.save()
+        self.assertIsNone(reference_data.countries.lookup('name', 'nepal'))
+        self.assertEqual(reference_data.countries.get(str(country.pk)).name, country.name)
+
+        response = self.client.get('/api/v2/country/np/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['id'], country.pk)
+
+    def test_changes_from_other_processes(self):
+        country = models.Country.objects.create(name='Nepal', iso='NP')
+        reference_data.countries.all()
+        # update() skips the signals, like a change made by another process
+        models.Country.objects.filter(pk=country.pk).update(iso='NQ')
+        with self.settings(REFERENCE_DATA_CHECK_INTERVAL=0):
+            self.assertEqual(reference_data.countries.lookup('iso', 'nq').pk, country.pk)
+
+
+class AggregateRollupTest(APITestCase):
+
+    fixtures = ['DisasterTypes']
+
+    def get_aggregate(self, query, live=False):
+        # A filter which is not a rollup dimension forces the live query
+        url = '/api/v1/aggregate/?%s%s' % (query, '&filter_id__gte=0' if live else '')
+        return json.loads(self.client.get(url).content)['aggregate']
+
+    def assertMatchesLive(self, query):
+        served = self.get_aggregate(query)
+        self.assertEqual(served, self.get_aggregate(query, live=True))
+        return served
+
+    def test_rollups_follow_changes(self):
+        region = models.Region.objects.create(name=1)
+        country1 = models.Country.objects.create(name='abc', region=region)
+        country2 = models.Country.objects.create(name='xyz')
+        dtype = models.DisasterType.objects.get(pk=7)
+
+        event1 = models.Event.objects.create(name='e1', dtype=dtype, disaster_start_date=datetime(2019, 1, 5, tzinfo=timezone.utc), num_affected=10)
+        event1.countries.add(country1)
+        event1.regions.add(region)
+        event2 = models.Event.objects.create(name='e2', disaster_start_date=datetime(2019, 3, 5, tzinfo=timezone.utc))
+        event2.countries.add(country1, country2)
+        models.Appeal.objects.create(aid='1', name='a1', dtype=dtype, country=country1, region=region, amount_requested=100.5,
+                                     start_date=datetime(2019, 1, 6, tzinfo=timezone.utc))
+        models.Appeal.objects.create(aid='2', name='a2', country=country2, amount_requested=20, amount_funded=5,
+                                     start_date=datetime(2018, 12, 6, tzinfo=timezone.utc))
+
+        queries = [
+            'model_type=event&unit=month',
+            'model_type=event&unit=year&sum_affected=num_affected',
+            'model_type=event&unit=month&country=%s' % country1.id,
+            'model_type=event&unit=month&region=%s&filter_dtype=7' % region.id,
+            'model_type=appeal&unit=month&sum_amount_requested=amount_requested&sum_amount_funded=amount_funded',
+            'model_type=appeal&unit=year&country=%s&sum_beneficiaries=num_beneficiaries' % country2.id,
+        ]
+        self.assertEqual(len(self.assertMatchesLive(queries[0])), 2)
+
+        event2.countries.remove(country1)
+        event1.num_affected = 5
+        event1.disaster_start_date = datetime(2019, 2, 5, tzinfo=timezone.utc)
+        event1.save()
+        country2.event_set.clear()
+        event2.delete()
+        for query in queries:
+            self.assertMatchesLive(query)
+
+        incremental = self.get_aggregate(queries[2])
+        rebuild_rollups('event')
+        self.assertEqual(self.get_aggregate(queries[2]), incremental)
+
+
+class AggregateBatchTest(APITestCase):
+
+    fixtures = ['DisasterTypes']
+
+    def test_batch_matches_single_aggregates(self):
+        region = models.Region.objects.create(name=1)
+        country = models.Country.objects.create(name='abc', region=region)
+        for aid, dtype, month in (('1', 7, 1), ('2', 7, 3), ('3', None, 3)):
+            models.Appeal.objects.create(aid=aid, name=aid, dtype_id=dtype, country=country, region=region,
+                                         amount_requested=10, start_date=datetime(2019, month, 2, tzinfo=timezone.utc))
+        event = models.Event.objects.create(name='e', disaster_start_date=datetime(2019, 1, 5, tzinfo=timezone.utc))
+        event.countries.add(country)
+
+        specs = [
+            {'id': 'by_month', 'model_type': 'appeal', 'unit': 'month', 'sums': {'requested': 'amount_requested'}},
+            {'id': 'by_dtype', 'model_type': 'appeal', 'group_by': ['dtype']},
+            {'id': 'total', 'model_type': 'appeal', 'sums': {'requested': 'amount_requested'}},
+            {'id': 'events', 'model_type': 'event', 'unit': 'month', 'group_by': ['country']},
+        ]
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/v1/aggregate_batch/', {'specs': specs}, format='json')
+        results = json.loads(response.content)['results']
+
+        by_month = json.loads(self.client.get(
+            '/api/v1/aggregate/?model_type=appeal&unit=month&sum_requested=amount_requested').content)['aggregate']
+        self.assertEqual(results['by_month'], by_month)
+        by_dtype = json.loads(self.client.get('/api/v1/aggregate_dtype/?model_type=appeal').content)['aggregate']
+        self.assertEqual(
+            sorted(results['by_dtype'], key=lambda row: row['dtype'] or 0),
+            sorted(by_dtype, key=lambda row: row['dtype'] or 0),
+        )
+        self.assertEqual(results['total'], [{'count': 3, 'requested': '30.00'}])
+        self.assertEqual(results['events'], [{'timespan': '2019-01-01T00:00:00Z', 'country': country.id, 'count': 1}])
+
+        response = self.client.post('/api/v1/aggregate_batch/', {'specs': [{'id': 'x', 'model_type': 'appeal', 'sums': {'a': 'name'}}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # Only local fields and the dimensions can be filtered by, with values they accept
+        for filters in (
+            {'user__password__startswith': 'a'}, {'event__name': 'e'}, {'summary__name': 'e'}, {'created_at__gte': 'x'},
+        ):
+            response = self.client.post('/api/v1/aggregate_batch/', {'specs': [
+                {'id': 'x', 'model_type': 'fieldreport', 'filters': filters}]}, format='json')
+            self.assertEqual(response.status_code, 400)
+        filters = {'country': country.id, 'amount_requested__gte': 10}
+        response = self.client.post('/api/v1/aggregate_batch/', {'specs': [
+            {'id': 'x', 'model_type': 'appeal', 'filters': filters}]}, format='json')
+        self.assertEqual(json.loads(response.content)['results']['x'], [{'count': 3}])
+
+
+class OperationalSummaryTest(APITestCase):
+
+    def test_area_aggregate_follows_appeals(self):
+        region = models.Region.objects.create(name=1)
+        country = models.Country.objects.create(name='abc', region=region)
+        now = timezone.now()
+
+        response = json.loads(self.client.get('/api/v1/aggregate_area/?type=country&id=%s' % country.id).content)
+        self.assertIsNone(response['count__sum'])
+
+        appeal = models.Appeal.objects.create(aid='1', name='a', atype=1, country=country, region=region, num_beneficiaries=10,
+                                              amount_requested=100, amount_funded=50, end_date=now + timedelta(days=1))
+        models.Appeal.objects.create(aid='2', name='b', atype=0, country=country, region=region, num_beneficiaries=5,
+                                     end_date=now - timedelta(days=1))
+        response = json.loads(self.client.get('/api/v1/aggregate_area/?type=region&id=%s' % region.id).content)
+        self.assertEqual(response, {
+            'num_beneficiaries__sum': 15,
+            'amount_requested__sum': '100.00',
+            'amount_funded__sum': '50.00',
+            'count__sum': 2,
+        })
+
+        summary = json.loads(self.client.get('/api/v2/operational_summary/?type=country&id=%s' % country.id).content)
+        self.assertEqual(summary['active_appeals'], 1)
+        self.assertEqual(summary['active_drefs'], 0)
+        self.assertNotIn('personnel_deployments', summary)
+
+        # Ending the appeal expires the summary
+        models.Appeal.objects.filter(pk=appeal.pk).update(end_date=now - timedelta(seconds=1))
+        models.OperationalSummary.objects.filter(scope='country').update(expires_at=now - timedelta(seconds=1))
+        summary = json.loads(self.client.get('/api/v2/operational_summary/?type=country&id=%s' % country.id).content)
+        self.assertEqual(summary['active_appeals'], 0)
+        self.assertEqual(self.client.get('/api/v2/operational_summary/?type=planet').status_code, 400)
+
+        # No summary is stored for an unknown id
+        count = models.OperationalSummary.objects.count()
+        for url in (
+            '/api/v2/operational_summary/?type=event&id=12345',
+            '/api/v2/operational_summary/?type=country&id=%s' % 2 ** 40,
+            '/api/v1/aggregate_area/?type=region&id=12345',
+        ):
+            self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(models.OperationalSummary.objects.count(), count)
+
+
+class QueryCaptureTest(APITestCase):
+
+    def test_capture_and_recommend(self):
+        models.Appeal.objects.create(aid='1', name='a', atype=1)
+
+        with override_settings(QUERY_CAPTURE_SAMPLE_RATE=1):
+            self.client.get('/api/v2/appeal/?atype=1&status=0')
+            self.client.get('/api/v2/appeal/?atype=2&status=0')
+        captured = models.CapturedQuery.objects.filter(statement__contains='"api_appeal"."atype"')
+        self.assertTrue(captured.exists())
+        self.assertEqual(max(query.calls for query in captured), 2)
+        # Only the types of the values are kept
+        self.assertLessEqual(set(json.loads(captured.first().sample_params)), {'int', 'bool'})
+
+        out = StringIO()
+        call_command('recommend_indexes', '--reset', stdout=out)
+        self.assertIn('AddIndex', out.getvalue())
+        self.assertIn("'atype'", out.getvalue())
+        self.assertFalse(models.CapturedQuery.objects.exists())
+
+
+class ChangeOutboxTest(APITestCase):
+    fixtures = ['DisasterTypes']
+
+    def test_changes_are_consumed_once(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        event = models.Event.objects.create(name='disaster1', summary='test disaster1', dtype=dtype)
+        country = models.Country.objects.create(name='abc')
+        event.countries.add(country)
+        event.name = 'Renamed'
+        event.save()
+        appeal = models.Appeal.objects.create(aid='1', name='a', atype=1)
+        appeal.delete()
+        models.ChangeEvent.objects.update(changed_at=models.ChangeEvent.objects.first().changed_at - timedelta(minutes=1))
+
+        with consume_changes('test') as changes:
+            self.assertEqual(changes.get_ids(models.Event, models.ChangeOperation.CREATE), [event.id])
+            self.assertEqual(changes.get_ids(models.Event, models.ChangeOperation.UPDATE), [])
+            self.assertEqual(changes.get_ids(models.Appeal, models.ChangeOperation.DELETE), [appeal.id])
+
+        # A second run finds nothing, a failed run leaves its changes to the next one
+        with consume_changes('test') as changes:
+            self.assertEqual(len(changes), 0)
+        event.countries.remove(country)
+        models.ChangeEvent.objects.update(changed_at=models.ChangeEvent.objects.first().changed_at)
+        with self.assertRaises(RuntimeError):
+            with consume_changes('test') as changes:
+                raise RuntimeError
+        with consume_changes('test') as changes:
+            self.assertEqual(changes.get_ids(models.Event, models.ChangeOperation.UPDATE), [event.id])
+
+        # A row not settled yet holds back the settled ones after it
+        old = models.ChangeEvent.objects.first().changed_at
+        recent = models.ChangeEvent.objects.create(
+            model='api.Event', record_id=event.id, op=models.ChangeOperation.UPDATE)
+        models.ChangeEvent.objects.create(
+            model='api.Appeal', record_id=appeal.id, op=models.ChangeOperation.DELETE, changed_at=old)
+        with consume_changes('test') as changes:
+            self.assertEqual(len(changes), 0)
+        models.ChangeEvent.objects.filter(pk=recent.pk).update(changed_at=old)
+        with consume_changes('test') as changes:
+            self.assertEqual(len(changes), 2)
+
+
+class EsPageSearchTest(APITestCase):
+
+    def test_paging_is_validated(self):
+        self.assertEqual(self.client.get('/api/v1/es_search/').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/es_search/?keyword=flood&limit=500').status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/es_search/?keyword=flood&offset=-1').status_code, 400)
+
+
+class PostgresSearchBackendTest(APITestCase):
+
+    def test_incomplete_backend_fails(self):
+        class IncompleteBackend(SearchBackend):
+            def health(self):
+                return {}
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+    def test_index_and_search(self):
+        backend = PostgresSearchBackend()
+        region = models.Region.objects.create(name=1)
+        first = models.Country.objects.create(name='Madagascar', society_name='Malagasy Red Cross', region=region)
+        second = models.Country.objects.create(name='Malawi', society_name='Malawi Red Cross', region=region)
+        target = backend.begin_rebuild()
+        list(backend.index_records([region, first, second], target))
+        backend.finish_rebuild(target)
+
+        hits = backend.search('mala', None, 0, 10)
+        self.assertEqual(hits['total'], 2)
+        self.assertEqual(hits['facets'], {'country': 2})
+        self.assertEqual(len(backend.search('mala', 'country', 1, 10)['hits']), 1)
+        self.assertIn('<em>', backend.search('malawi', None, 0, 10)['hits'][0]['highlight']['body'][0])
+
+        backend.delete_records(models.Country, [second.id])
+        self.assertEqual(backend.search('mala', None, 0, 10)['total'], 1)
+
+        # Without ES_HOST, the endpoint searches Postgres
+        response = json.loads(self.client.get('/api/v1/es_search/?keyword=madagascar').content)
+        self.assertEqual(response['hits'][0]['_source']['name'], 'Madagascar')
+
+
+class TypeaheadTest(APITestCase):
+    fixtures = ['DisasterTypes']
+
+    def setUp(self):
+        # Built from the records of this test on first use
+        typeahead_index.snapshot = None
+
+    def test_prefix_search(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        region = models.Region.objects.create(name=0)
+        models.Country.objects.create(name='Kenya', iso='KE', iso3='KEN', region=region)
+        models.Event.objects.create(name='Kenya floods 2019', dtype=dtype, disaster_start_date='2019-05-01T00:00:00Z')
+        models.Event.objects.create(name='Kenya floods 2020', dtype=dtype, disaster_start_date='2020-05-01T00:00:00Z')
+
+        response = json.loads(self.client.get('/api/v2/typeahead/?q=ken').content)
+        self.assertEqual([(item['type'], item['name']) for item in response['results']], [
+            ('country', 'Kenya'),
+            ('event', 'Kenya floods 2020'),
+            ('event', 'Kenya floods 2019'),
+        ])
+        response = json.loads(self.client.get('/api/v2/typeahead/?q=flood&type=event&limit=1').content)
+        self.assertEqual([item['name'] for item in response['results']], ['Kenya floods 2020'])
+
+        # Changes made by this process apply right away
+        appeal = models.Appeal.objects.create(aid='1', name='Kenya appeal', code='MDRKE001', atype=1)
+        response = json.loads(self.client.get('/api/v2/typeahead/?q=mdrke').content)
+        self.assertEqual([item['id'] for item in response['results']], [appeal.id])
+        appeal.delete()
+        response = json.loads(self.client.get('/api/v2/typeahead/?q=mdrke').content)
+        self.assertEqual(response['results'], [])
+        self.assertEqual(self.client.get('/api/v2/typeahead/?q=k&type=planet').status_code, 400)
+
+    def test_sync_stops_at_unsettled_change(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        typeahead_index.get_snapshot()
+        # bulk_create skips the signals, like a change made by another process
+        first, second = models.Event.objects.bulk_create([
+            models.Event(name='Kenya floods', dtype=dtype), models.Event(name='Kenya drought', dtype=dtype),
+        ])
+        past = timezone.now() - timedelta(hours=1)
+        unsettled = ChangeEvent.objects.create(model='api.Event', record_id=first.id, op=ChangeOperation.CREATE)
+        ChangeEvent.objects.create(model='api.Event', record_id=second.id, op=ChangeOperation.CREATE, changed_at=past)
+
+        # The settled change after one not settled yet waits for it
+        with typeahead_index.lock:
+            typeahead_index.sync()
+        self.assertEqual(typeahead_index.search('kenya'), [])
+
+        ChangeEvent.objects.filter(pk=unsettled.pk).update(changed_at=past)
+        with typeahead_index.lock:
+            typeahead_index.sync()
+        self.assertEqual(sorted(entry.id for entry in typeahead_index.search('kenya')), [first.id, second.id])
+
+
+class WeeklyDigestTest(APITestCase):
+    fixtures = ['DisasterTypes']
+
+    def test_constant_queries(self):
+        region = models.Region.objects.create(name=1)
+        country = models.Country.objects.create(name='abc', region=region, society_name='abc society')
+        dtype = models.DisasterType.objects.get(pk=1)
+        action = models.Action.objects.create(name='action')
+
+        def create_records(name):
+            event = models.Event.objects.create(name=name, summary=name, dtype=dtype, is_featured=True)
+            models.Appeal.objects.create(
+                aid=name, name=name, event=event, country=country, dtype=dtype, amount_requested=100, amount_funded=50)
+            deployment = PersonnelDeployment.objects.create(
+                country_deployed_to=country, region_deployed_to=region, event_deployed_to=event)
+            Personnel.objects.create(
+                type='fact', name=name, deployment=deployment, country_from=country, start_date=timezone.now())
+            report = models.FieldReport.objects.create(rid=name, summary=name, event=event, dtype=dtype)
+            report.countries.add(country)
+            models.ActionsTaken.objects.create(
+                field_report=report, organization='NTLS', summary=name).actions.add(action)
+
+        reference_data.countries.all()
+        command = Command()
+        create_records('one')
+        command.build_weekly_digest()
+        with CaptureQueriesContext(connection) as one_record:
+            command.build_weekly_digest()
+
+        create_records('two')
+        create_records('three')
+        command.build_weekly_digest()
+        with CaptureQueriesContext(connection) as three_records:
+            digest = command.build_weekly_digest()
+        self.assertEqual(len(three_records), len(one_record))
+        self.assertEqual(len(digest['latest_deployments']), 3)
+        self.assertEqual(digest['latest_deployments'][0]['society_from'], 'abc society')
+        self.assertEqual([op['hl_funding'] for op in digest['highlighted_ops']], [100, 100, 100])
+        self.assertEqual(digest['latest_field_reports'][0]['country'], 'abc')
+
+        reports = models.FieldReport.objects.prefetch_related('actions_taken__actions')
+        with self.assertNumQueries(3):
+            actions_taken = [command.get_actions_taken(report) for report in reports]
+        self.assertEqual(actions_taken[0]['NTLS'][0]['actions'], [action])
+
+        # Built once per run
+        with self.assertNumQueries(len(one_record)):
+            command.get_weekly_digest()
+        with self.assertNumQueries(0):
+            command.get_weekly_digest()
+
+
+class SchedulerTest(APITestCase):
+
+    def test_run_job(self):
+        daily = Schedule(timedelta(days=1), timedelta(hours=6))
+        self.assertEqual(get_next_due(daily, EPOCH + timedelta(days=3, hours=7)), EPOCH + timedelta(days=4, hours=6))
+        self.assertEqual(get_next_due(daily, EPOCH + timedelta(days=3, hours=6)), EPOCH + timedelta(days=4, hours=6))
+
+        # Not due before its first scheduled time
+        with run_job('job', daily, timedelta(days=1)) as window:
+            self.assertIsNone(window)
+
+        # Missed for a week: a single run over the last day
+        now = timezone.now()
+        models.ScheduledJob.objects.filter(name='job').update(
+            next_due_at=now - timedelta(days=7), last_success_at=now - timedelta(days=8))
+        with run_job('job', daily, timedelta(days=1)) as window:
+            self.assertAlmostEqual(window.start, window.end - timedelta(days=1), delta=timedelta(seconds=1))
+            # Leased meanwhile
+            with run_job('job', daily, timedelta(days=1)) as other:
+                self.assertIsNone(other)
+        job = models.ScheduledJob.objects.get(name='job')
+        self.assertEqual(job.last_success_at, window.end)
+        self.assertEqual(job.next_due_at, get_next_due(daily, window.end))
+        self.assertIsNone(job.locked_until)
+
+        # An error leaves the job due, over the same interval
+        models.ScheduledJob.objects.filter(name='job').update(next_due_at=now)
+        with self.assertRaises(ValueError):
+            with run_job('job', daily) as window:
+                raise ValueError('failed')
+        with run_job('job', daily) as retried:
+            self.assertEqual(retried.start, window.start)
+        self.assertEqual(models.ScheduledJob.objects.get(name='job').last_error, '')
+
+
+class FakeSearchBackend(SearchBackend):
+    """Records what index_elasticsearch sends to the search backend"""
+
+    def __init__(self, on_index=None):
+        self.calls = []
+        self.on_index = on_index
+
+    def health(self):
+        return {'status': 'green'}
+
+    def search(self, phrase, page_type, offset, limit):
+        return {'hits': [], 'facets': {}}
+
+    def index_records(self, records, target=None, chunk_size=500, threads=1):
+        records = list(records)
+        if records:
+            self.calls.append(('index', target, [(record._meta.model_name, record.pk) for record in records]))
+            if self.on_index is not None:
+                self.on_index(target, records)
+        return [(True, record.pk) for record in records]
+
+    def delete_records(self, model, record_ids, target=None):
+        return []
+
+    def begin_rebuild(self):
+        self.calls.append(('begin',))
+        return 'page_all_new'
+
+    def finish_rebuild(self, target, keep=1):
+        self.calls.append(('finish', target))
+
+    def abort_rebuild(self, target):
+        self.calls.append(('abort', target))
+
+
+class IndexElasticsearchTest(APITestCase):
+    fixtures = ['DisasterTypes']
+
+    def run_command(self, backend, *args, **options):
+        with mock.patch('api.management.commands.index_elasticsearch.get_search_backend', return_value=backend), \
+                mock.patch('api.search.get_search_backend', return_value=backend):
+            call_command('index_elasticsearch', *args, **options)
+
+    def test_records_are_read_by_chunks(self):
+        countries = [models.Country.objects.create(name='country %s' % index) for index in range(5)]
+        backend = FakeSearchBackend()
+        with CaptureQueriesContext(connection) as queries:
+            self.run_command(backend, 'country', chunk_size=2)
+        self.assertEqual(backend.calls, [('index', None, [('country', country.pk) for country in countries])])
+        # Two full chunks, the last one and the empty read ending the loop
+        reads = [query for query in queries if query['sql'].startswith('SELECT') and 'api_country' in query['sql']]
+        self.assertEqual(len(reads), 4)
+
+    def test_rebuild_replays_changes(self):
+        dtype = models.DisasterType.objects.get(pk=1)
+        created = {}
+        replaying = []
+        replay_changes = IndexCommand.replay_changes
+
+        def replay_into(command, target, after_id):
+            replaying[:] = [target is not None]
+            return replay_changes(command, target, after_id)
+
+        def on_index(target, records):
+            # An event created while the tables are pushed, then another one while the changes are replayed
+            if 'push' not in created:
+                created['push'] = models.Event.objects.create(name='pushed', dtype=dtype)
+            elif replaying == [True] and 'replay' not in created:
+                created['replay'] = models.Event.objects.create(name='replayed', dtype=dtype)
+
+        backend = FakeSearchBackend(on_index)
+        models.Region.objects.create(name=0)
+        with mock.patch.object(IndexCommand, 'replay_changes', replay_into):
+            self.run_command(backend)
+
+        self.assertEqual(backend.calls[0], ('begin',))
+        finish = backend.calls.index(('finish', 'page_all_new'))
+        self.assertIn(('index', 'page_all_new', [('event', created['push'].pk)]), backend.calls[:finish])
+        self.assertEqual(backend.calls[finish + 1:], [('index', None, [('event', created['replay'].pk)])])
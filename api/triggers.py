@@ -1,8 +1,18 @@
 import os
 import threading
-from django.db.models.signals import post_save
-from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.contrib.auth.models import User, Group, Permission
 from .models import Profile
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token
+from .cache import VERSIONED_MODELS, bump_model_version
+from .models import Country, DisasterType, District, Region
+from .outbox import OUTBOX_MODELS, outbox_post_save, outbox_post_delete, outbox_m2m_changed
+from .permission_scope import invalidate_user_scope, invalidate_all_user_scopes
+from .reference_data import invalidate_reference_data
+from .rollups import ROLLUP_SOURCES, rollup_pre_save, rollup_post_save, rollup_pre_delete, rollup_m2m_changed
+from .summaries import summary_pre_save, summary_post_save, summary_post_delete
+from .typeahead import typeahead_post_save, typeahead_post_delete
 
 
 # Save a user profile whenever we create a user
@@ -11,3 +21,87 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
     instance.profile.save()
 post_save.connect(create_profile, sender=User)
+
+
+# Invalidate cached responses which read the changed model
+def bump_version_on_change(sender, **kwargs):
+    bump_model_version(sender)
+
+
+def bump_versions_on_m2m_change(sender, instance, action, model, **kwargs):
+    if action.startswith('post_'):
+        bump_model_version(sender)
+        bump_model_version(instance.__class__)
+        bump_model_version(model)
+for _label in VERSIONED_MODELS:
+    post_save.connect(bump_version_on_change, sender=_label)
+    post_delete.connect(bump_version_on_change, sender=_label)
+m2m_changed.connect(bump_versions_on_m2m_change, dispatch_uid='bump_versions_on_m2m_change')
+
+
+# Drop cached permission scopes when permissions or group memberships change
+def invalidate_scopes_on_permission_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_all_user_scopes()
+
+
+def invalidate_scopes_on_delete(sender, **kwargs):
+    invalidate_all_user_scopes()
+
+
+def invalidate_scope_on_user_save(sender, instance, **kwargs):
+    invalidate_user_scope(instance.pk)
+m2m_changed.connect(invalidate_scopes_on_permission_change, sender=User.user_permissions.through)
+m2m_changed.connect(invalidate_scopes_on_permission_change, sender=User.groups.through)
+m2m_changed.connect(invalidate_scopes_on_permission_change, sender=Group.permissions.through)
+post_delete.connect(invalidate_scopes_on_delete, sender=Permission)
+post_delete.connect(invalidate_scopes_on_delete, sender=Group)
+post_save.connect(invalidate_scope_on_user_save, sender=User)
+
+
+# Drop cached token lookups when tokens change
+def invalidate_token_on_change(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+post_save.connect(invalidate_token_on_change, sender=Token)
+post_delete.connect(invalidate_token_on_change, sender=Token)
+
+
+# Reload the in-memory reference data of this process after a change
+def invalidate_reference_data_on_change(sender, **kwargs):
+    invalidate_reference_data(sender)
+post_save.connect(invalidate_reference_data_on_change, sender=Country)
+post_delete.connect(invalidate_reference_data_on_change, sender=Country)
+post_save.connect(invalidate_reference_data_on_change, sender=DisasterType)
+post_delete.connect(invalidate_reference_data_on_change, sender=DisasterType)
+post_save.connect(invalidate_reference_data_on_change, sender=District)
+post_delete.connect(invalidate_reference_data_on_change, sender=District)
+post_save.connect(invalidate_reference_data_on_change, sender=Region)
+post_delete.connect(invalidate_reference_data_on_change, sender=Region)
+
+
+# Keep the AggregateByTime rollups up to date
+for _source in ROLLUP_SOURCES.values():
+    pre_save.connect(rollup_pre_save, sender=_source.model_label)
+    post_save.connect(rollup_post_save, sender=_source.model_label)
+    pre_delete.connect(rollup_pre_delete, sender=_source.model_label)
+m2m_changed.connect(rollup_m2m_changed, dispatch_uid='rollup_m2m_changed')
+
+
+# Flag the operational summaries of changed appeals and deployments
+for _label in ('api.Appeal', 'deployments.ERU', 'deployments.PersonnelDeployment'):
+    pre_save.connect(summary_pre_save, sender=_label)
+    post_save.connect(summary_post_save, sender=_label)
+    post_delete.connect(summary_post_delete, sender=_label)
+
+
+# Write the changes consumed by index_and_notify to the outbox
+for _label in OUTBOX_MODELS:
+    post_save.connect(outbox_post_save, sender=_label)
+    post_delete.connect(outbox_post_delete, sender=_label)
+m2m_changed.connect(outbox_m2m_changed, dispatch_uid='outbox_m2m_changed')
+
+
+# Update the typeahead index of this process
+for _label in ('api.Region', 'api.Country', 'api.Event', 'api.Appeal'):
+    post_save.connect(typeahead_post_save, sender=_label)
+    post_delete.connect(typeahead_post_delete, sender=_label)
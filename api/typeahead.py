@@ -0,0 +1,199 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import takewhile
+
+from django.conf import settings
+from django.db.models import Max
+
+from . import reference_data
+from .cache import get_model_versions, is_shared_cache
+from .models import Appeal, ChangeEvent, Country, Event, Region
+from .outbox import get_settled_before
+
+# A record found by the typeahead; `date` orders the events and appeals, most recent first
+TypeaheadEntry = namedtuple('TypeaheadEntry', ('type', 'id', 'name', 'code', 'date'))
+
+TYPES = ('region', 'country', 'event', 'appeal')
+MAX_LIMIT = 20
+WORD = re.compile(r'\w+')
+
+
+def normalize(value):
+    return value.strip().lower() if value else ''
+
+
+def get_terms(entry):
+    """The strings an entry is found by a prefix of: the whole name, each of its words and the code"""
+    name = normalize(entry.name)
+    terms = {name, normalize(entry.code)} | set(WORD.findall(name))
+    return terms - {''}
+
+
+def region_entry(region):
+    return TypeaheadEntry('region', region.id, str(region), None, None)
+
+
+def country_entry(country):
+    return TypeaheadEntry('country', country.id, country.name, country.iso3 or country.iso, None)
+
+
+def event_entry(event):
+    return TypeaheadEntry('event', event['id'], event['name'], None, event['disaster_start_date'])
+
+
+def appeal_entry(appeal):
+    return TypeaheadEntry('appeal', appeal['id'], appeal['name'], appeal['code'], appeal['start_date'])
+
+
+def load_events(ids=None):
+    queryset = Event.objects.all() if ids is None else Event.objects.filter(pk__in=ids)
+    return [event_entry(event) for event in queryset.values('id', 'name', 'disaster_start_date')]
+
+
+def load_appeals(ids=None):
+    queryset = Appeal.objects.all() if ids is None else Appeal.objects.filter(pk__in=ids)
+    return [appeal_entry(appeal) for appeal in queryset.values('id', 'name', 'code', 'start_date')]
+
+
+def rank(entry):
+    # Regions and countries have no date and come first
+    return (entry.date is None, entry.date.timestamp() if entry.date is not None else 0)
+
+
+class PrefixIndex():
+    """
+    Sorted (term, type, id) tuples of the regions, countries, events and
+    appeals, searched by bisection. Built on first use and updated record by
+    record: right away for changes made in this process (see api.triggers),
+    and within REFERENCE_DATA_CHECK_INTERVAL seconds for the events and
+    appeals changed elsewhere, read from the ChangeEvent outbox up to the
+    first row not settled (see api.outbox.consume_changes). A change of the
+    countries or regions reloads them.
+    `snapshot` holds the ({(type, id): entry}, terms) pair, updates replace it
+    with a single assignment so readers never see it half changed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.last_change_id = 0
+        self.versions = None
+        self.checked_at = 0
+
+    def get_settled_changes(self, after_id):
+        """The outbox rows of the events and appeals after `after_id`, in id order up to the first one not settled"""
+        settled_before = get_settled_before()
+        return list(takewhile(
+            lambda change: change[3] < settled_before,
+            ChangeEvent.objects
+            .filter(id__gt=after_id, model__in=('api.Event', 'api.Appeal'))
+            .order_by('id')
+            .values_list('id', 'model', 'record_id', 'changed_at'),
+        ))
+
+    def build(self):
+        # Rows written before settled_before all have lower ids than those still to come
+        settled = ChangeEvent.objects.filter(changed_at__lt=get_settled_before())
+        last_change_id = settled.aggregate(last=Max('id'))['last'] or 0
+        versions = get_model_versions((Country, Region))
+        entries = [region_entry(region) for region in reference_data.regions.all()] + \
+            [country_entry(country) for country in reference_data.countries.all()] + \
+            load_events() + load_appeals()
+        self.snapshot = (
+            {(entry.type, entry.id): entry for entry in entries},
+            sorted((term, entry.type, entry.id) for entry in entries for term in get_terms(entry)),
+        )
+        self.last_change_id, self.versions, self.checked_at = last_change_id, versions, time.monotonic()
+
+    def replace(self, removed_keys, added):
+        """Swaps the entries of `removed_keys` for the `added` ones, under the lock"""
+        entries, terms = self.snapshot
+        entries = dict(entries)
+        removed = set(removed_keys) | set((entry.type, entry.id) for entry in added)
+        for key in removed:
+            entries.pop(key, None)
+        terms = [term for term in terms if (term[1], term[2]) not in removed]
+        if added:
+            entries.update(((entry.type, entry.id), entry) for entry in added)
+            terms = sorted(terms + [(term, entry.type, entry.id) for entry in added for term in get_terms(entry)])
+        self.snapshot = (entries, terms)
+
+    def sync(self):
+        """Applies the changes made by other processes"""
+        changes = self.get_settled_changes(self.last_change_id)
+        versions = get_model_versions((Country, Region))
+        # Other processes can't bump the counters of a process-local cache
+        if versions != self.versions or not is_shared_cache():
+            reference_data.regions.invalidate()
+            reference_data.countries.invalidate()
+            removed = [key for key in self.snapshot[0] if key[0] in ('region', 'country')]
+            self.replace(removed, [region_entry(region) for region in reference_data.regions.all()] +
+                         [country_entry(country) for country in reference_data.countries.all()])
+            self.versions = versions
+        if changes:
+            event_ids = set(record_id for _, model, record_id, _ in changes if model == 'api.Event')
+            appeal_ids = set(record_id for _, model, record_id, _ in changes if model == 'api.Appeal')
+            self.replace(
+                [('event', event_id) for event_id in event_ids] + [('appeal', appeal_id) for appeal_id in appeal_ids],
+                load_events(event_ids) + load_appeals(appeal_ids),
+            )
+            self.last_change_id = changes[-1][0]
+
+    def get_snapshot(self):
+        if self.snapshot is None or time.monotonic() - self.checked_at >= settings.REFERENCE_DATA_CHECK_INTERVAL:
+            with self.lock:
+                if self.snapshot is None:
+                    self.build()
+                elif time.monotonic() - self.checked_at >= settings.REFERENCE_DATA_CHECK_INTERVAL:
+                    self.checked_at = time.monotonic()
+                    self.sync()
+        return self.snapshot
+
+    def search(self, prefix, types=TYPES, limit=10):
+        """Entries with a term starting with `prefix`, countries and regions first, then the most recent"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        entries, terms = self.get_snapshot()
+        keys = set()
+        for position in range(bisect_left(terms, (prefix,)), len(terms)):
+            term, entry_type, entry_id = terms[position]
+            if not term.startswith(prefix):
+                break
+            if entry_type in types:
+                keys.add((entry_type, entry_id))
+        return heapq.nlargest(limit, (entries[key] for key in keys), key=rank)
+
+    def record_changed(self, instance, deleted=False):
+        """Applies a change made in this process, if the index is built"""
+        if self.snapshot is None:
+            return
+        if deleted:
+            key, added = (instance._meta.model_name, instance.id), []
+        elif isinstance(instance, Region):
+            key, added = ('region', instance.id), [region_entry(instance)]
+        elif isinstance(instance, Country):
+            key, added = ('country', instance.id), [country_entry(instance)]
+        elif isinstance(instance, Event):
+            # Read back, the instance may hold the dates as assigned
+            key, added = ('event', instance.id), load_events([instance.id])
+        else:
+            key, added = ('appeal', instance.id), load_appeals([instance.id])
+        with self.lock:
+            self.replace([key], added)
+
+
+typeahead_index = PrefixIndex()
+
+
+# Signal handlers, connected in api.triggers
+def typeahead_post_save(sender, instance, **kwargs):
+    typeahead_index.record_changed(instance)
+
+
+def typeahead_post_delete(sender, instance, **kwargs):
+    typeahead_index.record_changed(instance, deleted=True)
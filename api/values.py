@@ -0,0 +1,169 @@
+from django.db import models
+from django.db.models.functions import Cast
+from django.utils import timezone
+from enumfields import EnumIntegerField
+from rest_framework.response import Response
+
+
+def format_datetime(value, request):
+    # Same output as the DRF DateTimeField
+    if not value:
+        return None
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def format_date(value, request):
+    return value.isoformat() if value else None
+
+
+def format_enum(value, request):
+    return int(value) if value is not None else None
+
+
+def format_text(value, request):
+    return str(value) if value is not None else None
+
+
+def file_formatter(model_field):
+    # Same output as the DRF FileField: absolute URL of the stored file
+    def format_file(value, request):
+        if not value:
+            return None
+        url = model_field.storage.url(value)
+        return request.build_absolute_uri(url) if request is not None else url
+    return format_file
+
+
+def resolve_field(model, lookup):
+    field = None
+    for name in lookup.split('__'):
+        field = model._meta.get_field(name)
+        if field.is_relation:
+            model = field.related_model
+    return field
+
+
+class ValuesProjection():
+    """
+    Compiled column projection of a view.
+
+    A projection entry is either
+      - 'field': a column (or relation id) rendered under its own name,
+      - ('name', 'lookup'): a column rendered under another name,
+      - ('name', 'lookup', formatter): a column with a custom formatter(value, request),
+      - ('relation', (entries...)): a nested object, None when the relation is empty.
+    Decimal columns are cast to text in SQL, `expressions` replace a column with
+    an annotation (e.g. a Case/When).
+    """
+
+    def __init__(self, model, entries, expressions=None):
+        self.annotations = {}
+        self.expressions = expressions or {}
+        self.layout = self.compile(model, model, entries, '')
+
+    def add_column(self, model, lookup):
+        if lookup in self.expressions:
+            alias = '_%s' % lookup
+            self.annotations[alias] = self.expressions[lookup]
+            return alias, None
+        field = resolve_field(model, lookup)
+        if isinstance(field, models.DecimalField):
+            alias = '_%s' % lookup
+            self.annotations[alias] = Cast(lookup, models.TextField())
+            return alias, None
+        if isinstance(field, models.FileField):
+            return lookup, file_formatter(field)
+        if isinstance(field, models.DateTimeField):
+            return lookup, format_datetime
+        if isinstance(field, models.DateField):
+            return lookup, format_date
+        if isinstance(field, EnumIntegerField):
+            return lookup, format_enum
+        return lookup, None
+
+    def compile(self, root, model, entries, prefix):
+        layout = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = (entry, entry)
+            name, source = entry[0], entry[1]
+            if isinstance(source, (tuple, list)):
+                relation = model._meta.get_field(name)
+                nested_prefix = prefix + name + '__'
+                # The relation id tells an empty relation apart
+                null_check, _ = self.add_column(root, prefix + name)
+                layout.append((name, null_check, self.compile(root, relation.related_model, source, nested_prefix)))
+                continue
+            alias, formatter = self.add_column(root, prefix + source)
+            if len(entry) > 2:
+                formatter = entry[2]
+            layout.append((name, alias, formatter))
+        return layout
+
+    def get_queryset(self, queryset):
+        queryset = queryset.prefetch_related(None)
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset.values(*set(alias for alias in self.iter_aliases(self.layout)))
+
+    def iter_aliases(self, layout):
+        for name, alias, formatter in layout:
+            yield alias
+            if isinstance(formatter, list):
+                yield from self.iter_aliases(formatter)
+
+    def render_row(self, row, layout, request):
+        data = {}
+        for name, alias, formatter in layout:
+            if isinstance(formatter, list):
+                data[name] = self.render_row(row, formatter, request) if row[alias] is not None else None
+            elif formatter is not None:
+                data[name] = formatter(row[alias], request)
+            else:
+                data[name] = row[alias]
+        return data
+
+    def render(self, rows, request):
+        return [self.render_row(row, self.layout, request) for row in rows]
+
+
+class ValuesListMixin():
+    """
+    Serves list requests from a values() projection instead of model instances
+    and serializers. `values_projection` must produce exactly what the list
+    serializer does; sparse fieldsets and streamed exports use the serializer.
+    """
+    values_projection = None
+    values_expressions = None
+
+    _projections = {}
+
+    def get_values_projection(self, model):
+        key = (self.__class__, model)
+        if key not in self._projections:
+            self._projections[key] = ValuesProjection(model, self.values_projection, self.values_expressions)
+        return self._projections[key]
+
+    def use_values_projection(self, request):
+        params = request.query_params
+        return (
+            self.values_projection is not None and
+            'fields' not in params and 'expand' not in params and
+            not (params.get('format') == 'csv' and params.get('stream') in ('1', 'true'))
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_values_projection(request):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        projection = self.get_values_projection(queryset.model)
+        rows = projection.get_queryset(queryset)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(projection.render(page, request))
+        return Response(projection.render(rows, request))
@@ -3,7 +3,7 @@ import pytz
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import authentication, permissions
+from rest_framework import permissions
 
 from datetime import datetime, timedelta
 from django.http import JsonResponse, HttpResponse
@@ -20,10 +20,15 @@ from django.utils.crypto import get_random_string
 from django.template.loader import render_to_string
 
 from rest_framework.authtoken.models import Token
+from .authentication import CachedTokenAuthentication, get_token_user, invalidate_token
+from .aggregates import run_aggregate_specs
+from .exceptions import BadRequest
+from .rollups import aggregate_from_rollups
+from .search import MAX_LIMIT as MAX_SEARCH_LIMIT, get_search_backend, search_pages
+from .summaries import SCOPES as SUMMARY_SCOPES, SUMMARY_FIELDS, get_summary, scope_exists
+from .typeahead import MAX_LIMIT as MAX_TYPEAHEAD_LIMIT, TYPES as TYPEAHEAD_TYPES, typeahead_index
 from .utils import pretty_request
-from .esconnection import ES_CLIENT
 from .models import Appeal, Event, FieldReport, CronJob
-from .indexes import ES_PAGE_NAME
 from deployments.models import Heop
 from notifications.models import Subscription
 from notifications.notification import send_notification
@@ -50,7 +55,7 @@ def unauthorized(message='You must be logged in'):
 
 
 class UpdateSubscriptionPreferences(APIView):
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
     def post(self, request):
         errors, created = Subscription.sync_user_subscriptions(self.request.user, request.data, True) # deletePrevious
@@ -63,7 +68,7 @@ class UpdateSubscriptionPreferences(APIView):
 
 
 class AddSubscription(APIView):
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
     def post(self, request):
         errors, created = Subscription.sync_user_subscriptions(self.request.user, request.data, False) # do not deletePrevious ones, add only 1 subscription
@@ -75,7 +80,7 @@ class AddSubscription(APIView):
         return Response({ 'data': 'Success' })
 
 class DelSubscription(APIView):
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
     def post(self, request):
         errors = Subscription.del_user_subscriptions(self.request.user, request.data)
@@ -97,7 +102,7 @@ class PublicJsonRequestView(View):
 
 class EsPageHealth(PublicJsonRequestView):
     def handle_get(self, request, *args, **kwargs):
-        health = ES_CLIENT.cluster.health()
+        health = get_search_backend().health()
         return JsonResponse(health)
 
 
@@ -107,42 +112,28 @@ class EsPageSearch(PublicJsonRequestView):
         phrase = request.GET.get('keyword', None)
         if phrase is None:
             return bad_request('Must include a `keyword`')
-        index = ES_PAGE_NAME
-        query = {
-            'multi_match': {
-                'query': phrase,
-                'fields': ['keyword^3', 'body']
-            }
-        }
+        offset = request.GET.get('offset', '0')
+        limit = request.GET.get('limit', '10')
+        if not offset.isdigit() or not limit.isdigit() or not 0 < int(limit) <= MAX_SEARCH_LIMIT:
+            return bad_request('`offset` must be a positive number and `limit` at most %s' % MAX_SEARCH_LIMIT)
 
-        sort = [
-            {'date': {'order': 'desc', 'missing': '_first'}},
-            '_score',
-        ]
-
-        if page_type is not None:
-            query = {
-                'bool': {
-                    'filter': {
-                        'term': {'type': page_type}
-                    },
-                    'must': {
-                        'multi_match': query['multi_match']
-                    }
-                }
-            }
-
-        results = ES_CLIENT.search(
-            index=index,
-            doc_type='page',
-            body=json.dumps({
-                'query': query,
-                'sort': sort,
-                'from': 0,
-                'size': 10
-            })
-        )
-        return JsonResponse(results['hits'])
+        # Reads the alias, so a reindex in progress does not affect the results
+        return JsonResponse(search_pages(phrase, page_type, int(offset), int(limit)))
+
+
+class Typeahead(PublicJsonRequestView):
+    def handle_get(self, request, *args, **kwargs):
+        prefix = request.GET.get('q', '')
+        types = request.GET.get('type')
+        types = types.split(',') if types else TYPEAHEAD_TYPES
+        limit = request.GET.get('limit', '10')
+        if set(types) - set(TYPEAHEAD_TYPES):
+            return bad_request('`type` must be a comma separated list of %s' % ', '.join(TYPEAHEAD_TYPES))
+        if not limit.isdigit() or not 0 < int(limit) <= MAX_TYPEAHEAD_LIMIT:
+            return bad_request('`limit` must be a positive number, at most %s' % MAX_TYPEAHEAD_LIMIT)
+
+        results = [entry._asdict() for entry in typeahead_index.search(prefix, types, int(limit))]
+        return JsonResponse({'results': results})
 
 
 class AreaAggregate(PublicJsonRequestView):
@@ -152,14 +143,47 @@ class AreaAggregate(PublicJsonRequestView):
 
         if region_type not in ['country', 'region']:
             return bad_request('`type` must be `country` or `region`')
-        elif not region_id:
+        elif not region_id or not region_id.isdigit():
             return bad_request('`id` must be a region id')
+        elif not scope_exists(region_type, int(region_id)):
+            return bad_request('There is no %s with id %s' % (region_type, region_id))
+
+        summary = get_summary(region_type, int(region_id))
+        has_appeals = summary.appeal_count > 0
+        aggregate = {
+            'num_beneficiaries__sum': summary.num_beneficiaries if has_appeals else None,
+            'amount_requested__sum': summary.amount_requested if has_appeals else None,
+            'amount_funded__sum': summary.amount_funded if has_appeals else None,
+            'count__sum': summary.appeal_count if has_appeals else None,
+        }
+
+        return JsonResponse(aggregate)
 
-        aggregate = Appeal.objects.filter(**{region_type:region_id}) \
-                                  .annotate(count=Count('id')) \
-                                  .aggregate(Sum('num_beneficiaries'), Sum('amount_requested'), Sum('amount_funded'), Sum('count'))
 
-        return JsonResponse(dict(aggregate))
+class OperationalSummaryView(APIView):
+    """
+    Appeal, ERU and deployment totals of the whole operation (`type=global`)
+    or of a country, region or event (`type` and `id`). The personnel
+    deployment count is only given to authenticated users.
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+
+    def get(self, request):
+        scope = request.query_params.get('type', 'global')
+        scope_id = request.query_params.get('id', '0' if scope == 'global' else None)
+        if scope not in SUMMARY_SCOPES:
+            raise BadRequest('`type` must be one of %s' % ', '.join(SUMMARY_SCOPES))
+        if scope_id is None or not scope_id.isdigit():
+            raise BadRequest('`id` must be a %s id' % scope)
+        if not scope_exists(scope, int(scope_id)):
+            raise BadRequest('There is no %s with id %s' % (scope, scope_id))
+
+        summary = get_summary(scope, int(scope_id))
+        data = {field: getattr(summary, field) for field in SUMMARY_FIELDS}
+        if not request.user.is_authenticated:
+            del data['personnel_deployments']
+        data.update(type=scope, id=summary.scope_id, updated_at=summary.updated_at)
+        return Response(data)
 
 
 class AggregateByDtype(PublicJsonRequestView):
@@ -239,19 +263,31 @@ class AggregateByTime(PublicJsonRequestView):
 
         # allow custom filter attributes
         # TODO this should check if the model definition contains this field
+        custom_filters = {}
         for key, value in request.GET.items():
             if key[0:7] == 'filter_':
-                filter_obj[key[7:]] = value
+                custom_filters[key[7:]] = value
+        filter_obj.update(custom_filters)
 
         # allow arbitrary SUM functions
         annotation_funcs = {
             'count': Count('id')
         }
         output_values = ['timespan', 'count']
+        sums = {}
         for key, value in request.GET.items():
             if key[0:4] == 'sum_':
                 annotation_funcs[key[4:]] = Sum(value)
                 output_values.append(key[4:])
+                sums[key[4:]] = value
+
+        # Answer from the pre-aggregated rollups when they cover the request
+        aggregate = aggregate_from_rollups(
+            mtype, 'month' if unit == 'month' else 'year', start_date,
+            country=country, region=region, filters=custom_filters, sums=sums,
+        )
+        if aggregate is not None:
+            return JsonResponse(dict(aggregate=aggregate))
 
         trunc_method = TruncMonth if unit == 'month' else TruncYear
 
@@ -283,16 +319,9 @@ class PublicJsonPostView(View):
         if not username or not key:
             return None
 
-        # Query the user
-        try:
-            user = User.objects.get(username=username)
-        except ObjectDoesNotExist:
-            return None
-
-        # Query the key
-        try:
-            Token.objects.get(user=user, key=key)
-        except ObjectDoesNotExist:
+        # Look up the key and check it belongs to the user
+        user = get_token_user(key)
+        if user is None or user.username != username:
             return None
 
         return user
@@ -307,6 +336,24 @@ class PublicJsonPostView(View):
         return self.handle_post(request, *args, **kwargs)
 
 
+class AggregateBatch(PublicJsonPostView):
+    """
+    Runs several aggregates in one request. The body is
+    {"specs": [{"id", "model_type", "unit", "group_by", "sums", "filters", "start_date"}, ...]}
+    and the response {"results": {<spec id>: [{"timespan", <group_by dimensions>, "count", <sums>}, ...]}}.
+    """
+    def handle_post(self, request, *args, **kwargs):
+        try:
+            body = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            return bad_request('Body must be valid JSON')
+        try:
+            results = run_aggregate_specs(body.get('specs') if isinstance(body, dict) else None)
+        except ValueError as e:
+            return bad_request(str(e))
+        return JsonResponse(dict(results=results))
+
+
 class GetAuthToken(PublicJsonPostView):
     def handle_post(self, request, *args, **kwargs):
         body = json.loads(request.body.decode('utf-8'))
@@ -330,6 +377,8 @@ class GetAuthToken(PublicJsonPostView):
             if not created:
                 api_key.created = datetime.utcnow().replace(tzinfo=pytz.utc)
                 api_key.save()
+            # Drop what other requests of this process cached for the token
+            invalidate_token(api_key.key)
 
             return JsonResponse({
                 'token': api_key.key,
@@ -425,7 +474,7 @@ class ShowUsername(PublicJsonPostView):
 
 
 class AddCronJobLog(APIView):
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permissions_classes = (permissions.IsAuthenticated,)
     def post(self, request):
         errors, created = CronJob.sync_cron(request.data)
@@ -1,13 +1,14 @@
 from rest_framework import viewsets
 from .models import VisibilityChoices
+from .permission_scope import get_user_scope
+from .prefetch import PrefetchPlannerMixin
+from .streaming import StreamingCSVMixin
 
-class ReadOnlyVisibilityViewset(viewsets.ReadOnlyModelViewSet):
+class ReadOnlyVisibilityViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     visibility_model_class = None
 
     def is_ifrc(self, user):
-        if user.has_perm('api.ifrc_admin') or user.is_superuser:
-            return True
-        return False
+        return get_user_scope(user).is_ifrc
 
     def get_queryset(self):
         if self.request.user.is_authenticated:
@@ -1,6 +1,5 @@
 import json, datetime, pytz
 from rest_framework.authentication import (
-    TokenAuthentication,
     BasicAuthentication,
     SessionAuthentication,
 )
@@ -22,8 +21,11 @@ from .models import (
     RegionalProject,
     Project,
 )
+from api.authentication import CachedTokenAuthentication
 from api.models import Country
 from api.view_filters import ListFilter
+from api.prefetch import PrefetchPlannerMixin
+from api.streaming import StreamingCSVMixin
 from .serializers import (
     ERUOwnerSerializer,
     ERUSerializer,
@@ -41,8 +43,8 @@ from api.views import (
 )
 
 
-class ERUOwnerViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+class ERUOwnerViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = ERUOwner.objects.all()
     serializer_class = ERUOwnerSerializer
@@ -58,8 +60,8 @@ class ERUFilter(filters.FilterSet):
         model = ERU
         fields = ('available',)
 
-class ERUViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+class ERUViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
+    authentication_classes = (CachedTokenAuthentication,)
     #permission_classes = (IsAuthenticated,) # Some figures are shown on the home page also, and not only authenticated users should see them.
     queryset = ERU.objects.all()
     serializer_class = ERUSerializer
@@ -74,8 +76,8 @@ class PersonnelDeploymentFilter(filters.FilterSet):
         model = PersonnelDeployment
         fields = ('country_deployed_to', 'region_deployed_to', 'event_deployed_to',)
 
-class PersonnelDeploymentViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+class PersonnelDeploymentViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = PersonnelDeployment.objects.all()
     serializer_class = PersonnelDeploymentSerializer
@@ -93,8 +95,8 @@ class PersonnelFilter(filters.FilterSet):
             'end_date': ('exact', 'gt', 'gte', 'lt', 'lte')
         }
 
-class PersonnelViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+class PersonnelViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Personnel.objects.all()
     serializer_class = PersonnelSerializer
@@ -115,13 +117,13 @@ class PartnerDeploymentFilterset(filters.FilterSet):
             'end_date': ('exact', 'gt', 'gte', 'lt', 'lte'),
         }
 
-class PartnerDeploymentViewset(viewsets.ReadOnlyModelViewSet):
+class PartnerDeploymentViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = PartnerSocietyDeployment.objects.all()
     serializer_class = PartnerDeploymentSerializer
     filter_class = PartnerDeploymentFilterset
 
 
-class RegionalProjectViewset(viewsets.ReadOnlyModelViewSet):
+class RegionalProjectViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = RegionalProject.objects.all()
     serializer_class = RegionalProjectSerializer
     search_fields = ('name',)
@@ -150,13 +152,13 @@ class ProjectFilter(filters.FilterSet):
         ]
 
 
-class ProjectViewset(viewsets.ModelViewSet):
+class ProjectViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ModelViewSet):
     queryset = Project.objects.prefetch_related(
         'user', 'reporting_ns', 'project_district', 'event', 'dtype', 'regional_project',
     ).all()
     # XXX: Use this as default authentication classes
     authentication_classes = (
-        TokenAuthentication,
+        CachedTokenAuthentication,
         BasicAuthentication,
         SessionAuthentication,
     )
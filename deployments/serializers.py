@@ -19,6 +19,7 @@ from .models import (
     Statuses,
 )
 from api.serializers import (
+    DynamicFieldsModelSerializer,
     ListEventSerializer,
     MiniEventSerializer,
     MiniCountrySerializer,
@@ -26,7 +27,7 @@ from api.serializers import (
 )
 
 
-class ERUSetSerializer(serializers.ModelSerializer):
+class ERUSetSerializer(DynamicFieldsModelSerializer):
     deployed_to = MiniCountrySerializer()
 
     class Meta:
@@ -34,7 +35,7 @@ class ERUSetSerializer(serializers.ModelSerializer):
         fields = ('type', 'units', 'equipment_units', 'deployed_to', 'event', 'eru_owner', 'available', 'id',)
 
 
-class ERUOwnerSerializer(serializers.ModelSerializer):
+class ERUOwnerSerializer(DynamicFieldsModelSerializer):
     eru_set = ERUSetSerializer(many=True)
     national_society_country = MiniCountrySerializer()
 
@@ -43,7 +44,7 @@ class ERUOwnerSerializer(serializers.ModelSerializer):
         fields = ('created_at', 'updated_at', 'national_society_country', 'eru_set', 'id',)
 
 
-class ERUSerializer(serializers.ModelSerializer):
+class ERUSerializer(DynamicFieldsModelSerializer):
     deployed_to = MiniCountrySerializer()
     event = ListEventSerializer()
     eru_owner = ERUOwnerSerializer()
@@ -53,7 +54,7 @@ class ERUSerializer(serializers.ModelSerializer):
         fields = ('type', 'units', 'equipment_units', 'deployed_to', 'event', 'eru_owner', 'available', 'id',)
 
 
-class PersonnelDeploymentSerializer(serializers.ModelSerializer):
+class PersonnelDeploymentSerializer(DynamicFieldsModelSerializer):
     country_deployed_to = MiniCountrySerializer()
     event_deployed_to = ListEventSerializer()
 
@@ -62,7 +63,7 @@ class PersonnelDeploymentSerializer(serializers.ModelSerializer):
         fields = ('country_deployed_to', 'region_deployed_to', 'event_deployed_to', 'comments', 'id',)
 
 
-class PersonnelSerializer(serializers.ModelSerializer):
+class PersonnelSerializer(DynamicFieldsModelSerializer):
     country_from = MiniCountrySerializer()
     deployment = PersonnelDeploymentSerializer()
 
@@ -71,14 +72,14 @@ class PersonnelSerializer(serializers.ModelSerializer):
         fields = ('start_date', 'end_date', 'name', 'role', 'type', 'country_from', 'deployment', 'id',)
 
 
-class PartnerDeploymentActivitySerializer(serializers.ModelSerializer):
+class PartnerDeploymentActivitySerializer(DynamicFieldsModelSerializer):
 
     class Meta:
         model = PartnerSocietyActivities
         fields = ('activity', 'id',)
 
 
-class PartnerDeploymentSerializer(serializers.ModelSerializer):
+class PartnerDeploymentSerializer(DynamicFieldsModelSerializer):
     parent_society = MiniCountrySerializer()
     country_deployed_to = MiniCountrySerializer()
     district_deployed_to = MiniDistrictSerializer(many=True)
@@ -92,13 +93,13 @@ class PartnerDeploymentSerializer(serializers.ModelSerializer):
         )
 
 
-class RegionalProjectSerializer(serializers.ModelSerializer):
+class RegionalProjectSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = RegionalProject
         fields = '__all__'
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(DynamicFieldsModelSerializer):
     project_district_detail = MiniDistrictSerializer(source='project_district', read_only=True)
     reporting_ns_detail = MiniCountrySerializer(source='reporting_ns', read_only=True)
     regional_project_detail = RegionalProjectSerializer(source='regional_project', read_only=True)
@@ -7,6 +7,7 @@ python manage.py migrate
 python manage.py collectstatic --noinput --clear
 python manage.py collectstatic --noinput -l
 python manage.py make_permissions
+python manage.py rebuild_aggregate_rollups --if-empty # The full rebuild runs nightly from cron
 
 # Add server name(s) to django settings and nginx - later maybe only nginx would be enough, and ALLOWED_HOSTS could be "*"
 if [ "$API_FQDN"x = prddsgocdnapi.azureedge.netx ]; then
@@ -68,8 +69,10 @@ echo "export TEST_EMAILS=\"$TEST_EMAILS\"" >> $HOME/.env
 (crontab -l 2>/dev/null; echo '*/20 * * * * . /home/ifrc/.env; python /home/ifrc/go-api/manage.py ingest_gdacs >> /home/ifrc/logs/ingest_gdacs.log 2>&1') | crontab -
 #(crontab -l 2>/dev/null; echo '0 2 * * * . /home/ifrc/.env; python /home/ifrc/go-api/manage.py ingest_who >> /home/ifrc/logs/ingest_who.log 2>&1') | crontab -
 (crontab -l 2>/dev/null; echo '*/5 * * * * . /home/ifrc/.env; python /home/ifrc/go-api/manage.py index_and_notify >> /home/ifrc/logs/index_and_notify.log 2>&1') | crontab -
+(crontab -l 2>/dev/null; echo '* * * * * . /home/ifrc/.env; python /home/ifrc/go-api/manage.py send_queued_emails >> /home/ifrc/logs/send_queued_emails.log 2>&1') | crontab -
 (crontab -l 2>/dev/null; echo '10 2 * * * . /home/ifrc/.env; python /home/ifrc/go-api/manage.py scrape_pdfs >> /home/ifrc/logs/scrape_pdfs.log 2>&1') | crontab -
 (crontab -l 2>/dev/null; echo '30 1 * * * . /home/ifrc/.env; python /home/ifrc/go-api/manage.py ingest_databank >> /home/ifrc/logs/ingest_databank.log 2>&1') | crontab -
+(crontab -l 2>/dev/null; echo '40 3 * * * . /home/ifrc/.env; python /home/ifrc/go-api/manage.py rebuild_aggregate_rollups >> /home/ifrc/logs/rebuild_aggregate_rollups.log 2>&1') | crontab -
 service cron start
 
 tail -n 0 -f $HOME/logs/*.log &
@@ -30,6 +30,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_admin_listfilter_dropdown',
     'corsheaders',
     'tastypie',
@@ -86,6 +87,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.query_capture.QueryCaptureMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = (
@@ -197,6 +199,37 @@ EMAIL_PORT = os.environ.get('EMAIL_PORT')
 EMAIL_HOST_USER = os.environ.get('EMAIL_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASS')
 
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION to a shared cache (e.g. memcached) in production
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'go-api'),
+    }
+}
+# Cache backends a process does not share with the others, see api.cache.is_shared_cache
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 60 * 10))
+# How long a revoked permission may still apply: permission changes drop the cached scopes right away in a
+# shared cache, but only in the process making the change in a process-local one
+USER_SCOPE_CACHE_TIMEOUT = int(os.environ.get(
+    'USER_SCOPE_CACHE_TIMEOUT', 10 if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS else 60 * 5))
+# Per-process cache of API tokens (see api.authentication); a deleted token still authenticates in the
+# other processes for up to TOKEN_CACHE_TIMEOUT seconds
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1000))
+TOKEN_CACHE_TIMEOUT = int(os.environ.get('TOKEN_CACHE_TIMEOUT', 60))
+# `elasticsearch` or `postgres` (the SearchDocument table), see api.search
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'elasticsearch' if os.environ.get('ES_HOST') else 'postgres')
+# Results of /api/v1/es_search/, also dropped whenever the search index changes (see api.search).
+# Only cached with a shared CACHE_BACKEND, the indexing commands could not drop them from a local one
+SEARCH_CACHE_TIMEOUT = int(os.environ.get('SEARCH_CACHE_TIMEOUT', 60))
+# How often the in-memory reference data (see api.reference_data) checks for changes made by other processes
+REFERENCE_DATA_CHECK_INTERVAL = int(os.environ.get('REFERENCE_DATA_CHECK_INTERVAL', 30))
+# Share of requests whose queries are recorded for the recommend_indexes command (0 to 1)
+QUERY_CAPTURE_SAMPLE_RATE = float(os.environ.get('QUERY_CAPTURE_SAMPLE_RATE', 0))
+
 DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600 # default 2621440, 2.5MB -> 100MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 2000    # default 1000, was not enough for Mozambique Cyclone Idai data
 
@@ -25,12 +25,15 @@ from api.views import (
     ShowUsername,
     EsPageSearch,
     EsPageHealth,
+    Typeahead,
     AggregateByDtype,
     AggregateByTime,
+    AggregateBatch,
     AddSubscription,
     DelSubscription,
     UpdateSubscriptionPreferences,
     AreaAggregate,
+    OperationalSummaryView,
     AddCronJobLog,
 )
 from registrations.views import (
@@ -115,6 +118,9 @@ urlpatterns = [
     url(r'^api/v1/aggregate/', AggregateByTime.as_view()),
     url(r'^api/v1/aggregate_dtype/', AggregateByDtype.as_view()),
     url(r'^api/v1/aggregate_area/', AreaAggregate.as_view()),
+    url(r'^api/v1/aggregate_batch/', AggregateBatch.as_view()),
+    url(r'^api/v2/operational_summary/', OperationalSummaryView.as_view()),
+    url(r'^api/v2/typeahead/', Typeahead.as_view()),
     url(r'^api/v2/create_field_report/', api_views.CreateFieldReport.as_view()),
     url(r'^api/v2/update_field_report/(?P<pk>\d+)/', api_views.UpdateFieldReport.as_view()),
     url(r'^get_auth_token', GetAuthToken.as_view()),
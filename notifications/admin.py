@@ -16,5 +16,20 @@ class SubscriptionAdmin(admin.ModelAdmin):
     list_filter   = (('rtype', ChoiceDropdownFilter),)
 
 
+class QueuedEmailAdmin(admin.ModelAdmin):
+    search_fields = ('subject', 'recipients', 'response_guid')
+    list_display = ('subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('recipients', 'html', 'response_guid', 'last_error', 'created_at', 'sent_at')
+
+
+class SentNotificationAdmin(admin.ModelAdmin):
+    search_fields = ('recipient',)
+    list_display = ('recipient', 'rtype', 'record_id', 'record_version', 'sent_at')
+    list_filter = ('rtype',)
+
+
 admin.site.register(models.SurgeAlert, SurgeAlertAdmin)
 admin.site.register(models.Subscription, SubscriptionAdmin)
+admin.site.register(models.QueuedEmail, QueuedEmailAdmin)
+admin.site.register(models.SentNotification, SentNotificationAdmin)
@@ -1,7 +1,9 @@
 from django_filters import rest_framework as filters
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets
+from api.authentication import CachedTokenAuthentication
+from api.prefetch import PrefetchPlannerMixin
+from api.streaming import StreamingCSVMixin
 from .models import SurgeAlert, Subscription
 from .serializers import (
     SurgeAlertSerializer,
@@ -19,8 +21,8 @@ class SurgeAlertFilter(filters.FilterSet):
             'created_at': ('exact', 'gt', 'gte', 'lt', 'lte'),
         }
 
-class SurgeAlertViewset(viewsets.ReadOnlyModelViewSet):
-    authentication_classes = (TokenAuthentication,)
+class SurgeAlertViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
+    authentication_classes = (CachedTokenAuthentication,)
     queryset = SurgeAlert.objects.all()
     filter_class = SurgeAlertFilter
     ordering_fields = ('created_at', 'atype', 'category', 'event',)
@@ -29,9 +31,9 @@ class SurgeAlertViewset(viewsets.ReadOnlyModelViewSet):
             return SurgeAlertSerializer
         return UnauthenticatedSurgeAlertSerializer
 
-class SubscriptionViewset(viewsets.ModelViewSet):
+class SubscriptionViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ModelViewSet):
     serializer_class = SubscriptionSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     def get_queryset(self):
         return Subscription.objects.filter(user=self.request.user)
@@ -0,0 +1,50 @@
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import SentNotification
+
+# Longer than the outbox keeps its rows, so a change read again is still known as sent
+RETENTION = timedelta(days=30)
+# Rows per INSERT when recording a notification, it has a row per recipient and record
+BATCH_SIZE = 1000
+
+
+def get_sent_keys(rtype, keys, recipients):
+    """The (recipient, record id, record version) of `keys` already sent to `recipients`, read with one query"""
+    sent = SentNotification.objects.filter(
+        rtype=rtype,
+        record_id__in=set(record_id for record_id, _ in keys),
+        record_version__in=set(version for _, version in keys),
+        recipient__in=recipients,
+    ).values_list('recipient', 'record_id', 'record_version')
+    keys = set(keys)
+    return set(key for key in sent if key[1:] in keys)
+
+
+def group_unsent(rtype, keys, recipients):
+    """
+    The recipients grouped by the keys they were not notified about yet, as
+    (keys, recipients) pairs in the order of `recipients`. Those notified
+    about every key are left out.
+    """
+    sent = get_sent_keys(rtype, keys, recipients)
+    groups = OrderedDict()
+    for recipient in recipients:
+        unsent = tuple(
+            (record_id, version) for record_id, version in keys if (recipient, record_id, version) not in sent)
+        if unsent:
+            groups.setdefault(unsent, []).append(recipient)
+    return list(groups.items())
+
+
+def record_sent(rtype, keys, recipients):
+    SentNotification.objects.bulk_create([
+        SentNotification(recipient=recipient, rtype=rtype, record_id=record_id, record_version=version)
+        for recipient in recipients for record_id, version in keys
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def prune_sent():
+    SentNotification.objects.filter(sent_at__lt=timezone.now() - RETENTION).delete()
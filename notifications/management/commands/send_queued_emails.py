@@ -0,0 +1,99 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.logger import logger
+from notifications.models import EmailStatus, QueuedEmail
+from notifications.notification import EMAIL_API_ENDPOINT, EMAIL_USER, DeliveryError, deliver_email
+
+# Claimed emails are skipped by other workers until then
+LEASE = timedelta(minutes=10)
+FIRST_RETRY = timedelta(minutes=1)
+MAX_RETRY = timedelta(hours=6)
+# Delivered and given up emails are deleted after this long, their bodies may hold account links
+RETENTION = timedelta(days=7)
+
+
+class Command(BaseCommand):
+    help = 'Send the emails queued by send_notification through the e-mail sender API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails claimed at once')
+        parser.add_argument('--threads', type=int, default=4, help='Emails sent in parallel')
+        parser.add_argument('--max-attempts', type=int, default=8, help='Attempts before an email is given up')
+        parser.add_argument('--time-limit', type=int, default=50, help='Seconds after which no new batch is claimed')
+
+    def claim(self, batch_size):
+        now = timezone.now()
+        with transaction.atomic():
+            emails = list(QueuedEmail.objects
+                          .select_for_update(skip_locked=True)
+                          .filter(status=EmailStatus.PENDING, next_attempt_at__lte=now)
+                          .order_by('next_attempt_at')[:batch_size])
+            QueuedEmail.objects.filter(pk__in=[email.pk for email in emails]).update(next_attempt_at=now + LEASE)
+        return emails
+
+    def get_retry_delay(self, attempts):
+        return min(FIRST_RETRY * 2 ** (attempts - 1), MAX_RETRY)
+
+    def send(self, session, email):
+        try:
+            return deliver_email(session, email), None
+        except DeliveryError as e:
+            return None, e
+
+    def record_result(self, email, guid, error, max_attempts):
+        attempts = email.attempts + 1
+        if error is None:
+            QueuedEmail.objects.filter(pk=email.pk).update(
+                status=EmailStatus.SENT, attempts=attempts, sent_at=timezone.now(),
+                response_guid=(guid or '')[:100], last_error='',
+            )
+            return True
+        if not error.retry or attempts >= max_attempts:
+            logger.error('Giving up email %s after %s attempts: %s' % (email.pk, attempts, error))
+            status, next_attempt_at = EmailStatus.FAILED, timezone.now()
+        else:
+            status, next_attempt_at = EmailStatus.PENDING, timezone.now() + self.get_retry_delay(attempts)
+        QueuedEmail.objects.filter(pk=email.pk).update(
+            status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=str(error))
+        return False
+
+    def handle(self, *args, **options):
+        if not EMAIL_USER or not EMAIL_API_ENDPOINT:
+            logger.warn('No username and/or API endpoint set as environment variables, cannot send emails.')
+            return
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=options['threads'])
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        start = time.monotonic()
+        sent, failed = 0, 0
+        # The HTTP requests run in the pool, the database is only used from this thread
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            while time.monotonic() - start < options['time_limit']:
+                emails = self.claim(options['batch_size'])
+                if not emails:
+                    break
+                results = executor.map(lambda email: self.send(session, email), emails)
+                for email, (guid, error) in zip(emails, results):
+                    if self.record_result(email, guid, error, options['max_attempts']):
+                        sent += 1
+                    else:
+                        failed += 1
+        if sent or failed:
+            logger.info('Sent %s emails, %s failed' % (sent, failed))
+        self.prune()
+
+    def prune(self):
+        QueuedEmail.objects \
+            .filter(status__in=[EmailStatus.SENT, EmailStatus.FAILED], created_at__lt=timezone.now() - RETENTION) \
+            .delete()
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.10 on 2026-10-18 13:30
+
+from django.db import migrations, models
+import django.utils.timezone
+import enumfields.fields
+import notifications.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_subscription_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=500)),
+                ('recipients', models.TextField(help_text='Comma separated')),
+                ('html', models.TextField()),
+                ('is_followed_event', models.BooleanField(default=False)),
+                ('status', enumfields.fields.EnumIntegerField(default=0, enum=notifications.models.EmailStatus)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('response_guid', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'index_together': {('status', 'next_attempt_at')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.10 on 2026-10-18 13:50
+
+from django.db import migrations, models
+import enumfields.fields
+import notifications.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_queuedemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.CharField(max_length=254)),
+                ('rtype', enumfields.fields.EnumIntegerField(enum=notifications.models.RecordType)),
+                ('record_id', models.IntegerField()),
+                ('record_version', models.CharField(max_length=40)),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('recipient', 'rtype', 'record_id', 'record_version')},
+            },
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.utils import timezone
 from enumfields import EnumIntegerField
 from enumfields import IntEnum
 from api.models import Country, Region, Event, DisasterType
+from api import reference_data
 
 
 class SurgeAlertType(IntEnum):
@@ -138,23 +139,20 @@ class Subscription(models.Model):
                 fields['stype'] = stype_map.get(req['value'], 0)
 
             elif rtype == RecordType.COUNTRY:
-                try:
-                    fields['country'] = Country.objects.get(pk=req['value'])
-                except Country.DoesNotExist:
+                fields['country'] = reference_data.countries.get(req['value'])
+                if fields['country'] is None:
                     error = 'Could not find country with primary key %s' % req['value']
                 fields['lookup_id'] = 'c%s' % req['value']
 
             elif rtype == RecordType.REGION:
-                try:
-                    fields['region'] = Region.objects.get(pk=req['value'])
-                except Region.DoesNotExist:
+                fields['region'] = reference_data.regions.get(req['value'])
+                if fields['region'] is None:
                     error = 'Could not find region with primary key %s' % req['value']
                 fields['lookup_id'] = 'r%s' % req['value']
 
             elif rtype == RecordType.DTYPE:
-                try:
-                    fields['dtype'] = DisasterType.objects.get(pk=req['value'])
-                except DisasterType.DoesNotExist:
+                fields['dtype'] = reference_data.disaster_types.get(req['value'])
+                if fields['dtype'] is None:
                     error = 'Could not find disaster type with primary key %s' % req['value']
                 fields['lookup_id'] = 'd%s' % req['value']
 
@@ -250,3 +248,54 @@ class Subscription(models.Model):
 
     def __str__(self):
         return '%s %s (%s)' % (self.user.username, self.rtype, self.user.email)
+
+
+class EmailStatus(IntEnum):
+    PENDING = 0
+    SENT = 1
+    FAILED = 2
+
+
+class QueuedEmail(models.Model):
+    """
+    An email waiting for, or done with, delivery through the e-mail sender API
+    by the send_queued_emails command. Recipients are sent as BCC, at most
+    EMAIL_BCC_CHUNK_SIZE per row.
+    """
+    subject = models.CharField(max_length=500)
+    recipients = models.TextField(help_text='Comma separated')
+    html = models.TextField()
+    is_followed_event = models.BooleanField(default=False)
+    status = EnumIntegerField(EmailStatus, default=EmailStatus.PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # Returned by the e-mail sender API, identifies the mail in its logs
+    response_guid = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        index_together = (('status', 'next_attempt_at'),)
+
+    def __str__(self):
+        return '%s (%s)' % (self.subject, self.status.name)
+
+
+class SentNotification(models.Model):
+    """
+    A record version a recipient was notified about by index_and_notify, so
+    that reruns and retro runs do not send it again
+    """
+    recipient = models.CharField(max_length=254)
+    rtype = EnumIntegerField(RecordType)
+    record_id = models.IntegerField()
+    # 'new' for a created record, the updated_at of a followed event, the ISO week of a digest
+    record_version = models.CharField(max_length=40)
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (('recipient', 'rtype', 'record_id', 'record_version'),)
+
+    def __str__(self):
+        return '%s %s %s (%s)' % (self.recipient, self.rtype.name, self.record_id, self.record_version)
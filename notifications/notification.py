@@ -25,11 +25,27 @@ else:
     test_emails = ['gergely.horvath@ifrc.org']
 
 
+# Recipients per queued email, the API sends one message to all of them as BCC
+EMAIL_BCC_CHUNK_SIZE = int(os.environ.get('EMAIL_BCC_CHUNK_SIZE', 50))
+# Seconds to connect to and wait for the e-mail sender API
+EMAIL_API_TIMEOUT = (5, float(os.environ.get('EMAIL_API_TIMEOUT', 30)))
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retry=True):
+        super().__init__(message)
+        self.retry = retry
+
+
 def send_notification(subject, recipients, html, is_followed_event=False):
+    """
+    Queues the email for the send_queued_emails command, in chunks of
+    EMAIL_BCC_CHUNK_SIZE recipients. Returns the queued rows.
+    """
     if not EMAIL_USER or not EMAIL_API_ENDPOINT:
         logger.warn('Cannot send notifications.')
         logger.warn('No username and/or API endpoint set as environment variables.')
-        return
+        return []
 
     # If it's not PROD only able to use test e-mail addresses which are set in the env var
     to_addresses = recipients
@@ -39,34 +55,54 @@ def send_notification(subject, recipients, html, is_followed_event=False):
         for eml in test_emails:
             if eml and (eml in recipients):
                 to_addresses.append(eml)
-
-    recipients_as_string = ','.join(to_addresses)
-
+    if not to_addresses:
+        return []
+
+    from .models import QueuedEmail
+    return QueuedEmail.objects.bulk_create([
+        QueuedEmail(
+            subject=subject[:500],
+            recipients=','.join(to_addresses[start:start + EMAIL_BCC_CHUNK_SIZE]),
+            html=html,
+            is_followed_event=is_followed_event,
+        )
+        for start in range(0, len(to_addresses), EMAIL_BCC_CHUNK_SIZE)
+    ])
+
+
+def deliver_email(session, email):
+    """
+    Posts a QueuedEmail to the e-mail sender API and returns the GUID of the
+    mail. Raises DeliveryError, with `retry` False if sending again would not help.
+    """
     # Encode with base64 into bytes, then converting it back to strings for the JSON
     payload = {
         "FromAsBase64":str(base64.b64encode(EMAIL_USER.encode('utf-8')), 'utf-8'),
         "ToAsBase64":str(base64.b64encode('no-reply@ifrc.org'.encode('utf-8')), 'utf-8'),
         "CcAsBase64":"",
-        "BccAsBase64":str(base64.b64encode(recipients_as_string.encode('utf-8')), 'utf-8'),
-        "SubjectAsBase64":str(base64.b64encode(subject.encode('utf-8')), 'utf-8'),
-        "BodyAsBase64":str(base64.b64encode(html.encode('utf-8')), 'utf-8'),
+        "BccAsBase64":str(base64.b64encode(email.recipients.encode('utf-8')), 'utf-8'),
+        "SubjectAsBase64":str(base64.b64encode(email.subject.encode('utf-8')), 'utf-8'),
+        "BodyAsBase64":str(base64.b64encode(email.html.encode('utf-8')), 'utf-8'),
         "IsBodyHtml":True,
         "TemplateName":"",
         "TemplateLanguage":""
     }
-    
-    # The response contains the GUID (res.text) which could be used for future requests if something is wrong
-    # TODO: It would be best to store the GUIDs and relevant mail parameters in some way, somewhere
-    res = requests.post(EMAIL_API_ENDPOINT, json=payload)
+
+    try:
+        res = session.post(EMAIL_API_ENDPOINT, json=payload, timeout=EMAIL_API_TIMEOUT)
+    except requests.RequestException as e:
+        raise DeliveryError('Could not reach the e-mail sender API: %s' % e)
 
     if res.status_code == 200:
-        logger.info('E-mails were sent successfully.')
+        # The response contains the GUID which can be used for future requests if something is wrong
+        return res.text.strip().strip('"')
     elif res.status_code == 401 or res.status_code == 403:
-        logger.info('Authorization/authentication failed ({}) failed to the e-mail sender API.'.format(res.status_code))
-    elif res.status_code == 500:
-        logger.error('Could not reach the e-mail sender API.')
-
-    return res.text
+        raise DeliveryError(
+            'Authorization/authentication failed ({}) to the e-mail sender API.'.format(res.status_code))
+    elif 400 <= res.status_code < 500 and res.status_code != 429:
+        raise DeliveryError(
+            'The e-mail sender API refused the mail ({}): {}'.format(res.status_code, res.text[:500]), retry=False)
+    raise DeliveryError('The e-mail sender API failed ({}).'.format(res.status_code))
 
 
 # # Old methods for sending email notifications (Leaving this here in case we ever need it for reference)
@@ -0,0 +1,37 @@
+from .models import Subscription
+
+
+class SubscriptionRouter():
+    """
+    Emails of the active users, by the (rtype, stype) and the lookup ids
+    (c<country>, r<region>, d<dtype>, e<event>) of their subscriptions, read
+    with a single query. Routing a batch of records is then a union of sets.
+    Built once per index_and_notify run.
+    """
+
+    def __init__(self):
+        self.by_type = {}
+        self.by_rtype = {}
+        self.by_lookup = {}
+        subscriptions = Subscription.objects \
+            .filter(user__is_active=True) \
+            .values_list('rtype', 'stype', 'lookup_id', 'user__email')
+        for rtype, stype, lookup_id, email in subscriptions:
+            if not email:
+                continue
+            self.by_type.setdefault((rtype, stype), set()).add(email)
+            self.by_rtype.setdefault(rtype, set()).add(email)
+            if lookup_id:
+                self.by_lookup.setdefault(lookup_id, set()).add(email)
+
+    def get_type_emails(self, rtype, stype=None):
+        """Subscribers to `rtype` records, of any subscription type if `stype` is None"""
+        if stype is None:
+            return set(self.by_rtype.get(rtype, ()))
+        return set(self.by_type.get((rtype, stype), ()))
+
+    def get_lookup_emails(self, lookup_ids):
+        emails = set()
+        for lookup_id in lookup_ids:
+            emails |= self.by_lookup.get(lookup_id, set())
+        return emails
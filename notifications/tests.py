@@ -1,3 +1,97 @@
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from api import reference_data
+from api.management.commands.index_and_notify import Command
+import api.models as models
+import notifications.management.commands.send_queued_emails as worker
+from . import notification
+from .ledger import group_unsent, record_sent
+from .models import EmailStatus, QueuedEmail, RecordType, SentNotification, Subscription, SubscriptionType
 
-# Create your tests here.
+
+class SubscriptionRoutingTest(TestCase):
+    fixtures = ['DisasterTypes']
+
+    def test_gather_subscribers(self):
+        region = models.Region.objects.create(name=1)
+        country = models.Country.objects.create(name='abc', region=region)
+        dtype = models.DisasterType.objects.get(pk=1)
+        event = models.Event.objects.create(name='disaster1', summary='test disaster1', dtype=dtype)
+        event.countries.add(country)
+
+        for username, rtype, lookup_id in (
+            ('all', RecordType.NEW_EMERGENCIES, None),
+            ('country', RecordType.COUNTRY, 'c%s' % country.id),
+            ('region', RecordType.REGION, 'r%s' % region.id),
+            ('other', RecordType.COUNTRY, 'c0'),
+        ):
+            user = User.objects.create(username=username, email='%s@example.org' % username)
+            Subscription.objects.create(user=user, rtype=rtype, stype=SubscriptionType.NEW, lookup_id=lookup_id)
+        User.objects.filter(username='region').update(is_active=False)
+
+        reference_data.countries.all()
+        command = Command()
+        records = models.Event.objects.filter(pk=event.pk).prefetch_related('countries')
+        with self.assertNumQueries(3):
+            emails = command.gather_subscribers(records, RecordType.EVENT, SubscriptionType.NEW)
+            # The subscriptions are only read once
+            command.gather_subscribers(records, RecordType.FIELD_REPORT, SubscriptionType.NEW)
+        self.assertEqual(emails, ['all@example.org', 'country@example.org'])
+
+
+class QueuedEmailTest(TestCase):
+
+    def test_queue_and_deliver(self):
+        class Response():
+            def __init__(self, status_code, text):
+                self.status_code, self.text = status_code, text
+
+        class Session():
+            responses = [Response(500, ''), Response(200, '"guid-1"'), Response(200, '"guid-2"')]
+
+            def mount(self, prefix, adapter):
+                pass
+
+            def post(self, url, json, timeout):
+                return self.responses.pop(0)
+
+        settings = dict(EMAIL_USER='go@example.org', EMAIL_API_ENDPOINT='https://mail.example.org')
+        with mock.patch.multiple(notification, EMAIL_BCC_CHUNK_SIZE=2, IS_PROD='1', **settings), \
+                mock.patch.multiple(worker, **settings), \
+                mock.patch.object(worker.requests, 'Session', Session):
+            recipients = ['a@example.org', 'b@example.org', 'c@example.org']
+            queued = notification.send_notification('Subject', recipients, '<p/>')
+            self.assertEqual([email.recipients for email in queued], ['a@example.org,b@example.org', 'c@example.org'])
+
+            call_command('send_queued_emails', threads=1)
+            statuses = list(QueuedEmail.objects.order_by('id').values_list('status', 'attempts', 'response_guid'))
+            self.assertEqual(statuses, [(EmailStatus.PENDING, 1, ''), (EmailStatus.SENT, 1, 'guid-1')])
+
+            # Retried once the backoff is over
+            QueuedEmail.objects.update(next_attempt_at='2000-01-01T00:00:00Z')
+            call_command('send_queued_emails', threads=1)
+            self.assertEqual(QueuedEmail.objects.order_by('id').first().response_guid, 'guid-2')
+
+
+class NotificationLedgerTest(TestCase):
+
+    def test_sent_keys_are_skipped(self):
+        recipients = ['a@example.org', 'b@example.org']
+        new, updated = (1, 'new'), (1, '2020-01-01T00:00:00+00:00')
+        record_sent(RecordType.EVENT, [(1, 'new'), (2, 'new')], ['a@example.org'])
+        # b was not notified yet, a only about part of the records and gets the others alone
+        self.assertEqual(group_unsent(RecordType.EVENT, [new], recipients), [((new,), ['b@example.org'])])
+        self.assertEqual(group_unsent(RecordType.EVENT, [new, (3, 'new')], recipients), [
+            (((3, 'new'),), ['a@example.org']),
+            ((new, (3, 'new')), ['b@example.org']),
+        ])
+        # Another version or record type is another notification
+        self.assertEqual(group_unsent(RecordType.FOLLOWED_EVENT, [new], recipients), [((new,), recipients)])
+        self.assertEqual(group_unsent(RecordType.EVENT, [updated], recipients), [((updated,), recipients)])
+
+        # Recording the same keys again is a no-op
+        record_sent(RecordType.EVENT, [(1, 'new'), (2, 'new')], recipients)
+        self.assertEqual(SentNotification.objects.count(), 4)
+        self.assertEqual(group_unsent(RecordType.EVENT, [(1, 'new'), (2, 'new')], recipients), [])
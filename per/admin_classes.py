@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.db.models import Q
+from api.permission_scope import get_user_scope
 
 # Extend the model admin with methods for determining whether a user has
 # country- and region-specific permissions.
@@ -8,22 +9,12 @@ from django.db.models import Q
 
 class RegionRestrictedAdmin(admin.ModelAdmin):
     def get_request_user_regions(self, request):
-        permissions = request.user.get_all_permissions()
-        regions = []
-        countries = []
-        for permission_name in permissions:
-            if 'api.per_country_admin_' in permission_name:
-                country_id = permission_name[22:]
-                if country_id.isdigit():
-                    countries.append(country_id)
-            elif 'api.per_region_admin_' in permission_name:
-                region_id = permission_name[21:]
-                if region_id.isdigit():
-                    regions.append(region_id)
-        return countries, regions
+        scope = get_user_scope(request.user)
+        return list(scope.per_countries), list(scope.per_regions)
 
     def get_filtered_queryset(self, request, queryset, dispatch):
-        if request.user.is_superuser or request.user.has_perm('api.ifrc_admin') or request.user.has_perm('api.per_core_admin'):
+        scope = get_user_scope(request.user)
+        if scope.is_ifrc or scope.per_core_admin:
             return queryset
         countries, regions = self.get_request_user_regions(request)
 
@@ -2,14 +2,16 @@ from rest_framework.status import HTTP_201_CREATED, HTTP_200_OK
 from rest_framework.generics import GenericAPIView, CreateAPIView, UpdateAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import viewsets
 from django.contrib import admin
 from django.db import models
 from django.utils import timezone
 from django_filters import rest_framework as filters
+from api.authentication import CachedTokenAuthentication
 from api.exceptions import BadRequest
+from api.prefetch import PrefetchPlannerMixin
+from api.streaming import StreamingCSVMixin
 from api.view_filters import ListFilter
 from api.visibility_class import ReadOnlyVisibilityViewset
 from deployments.models import Personnel
@@ -53,9 +55,9 @@ class DraftFilter(filters.FilterSet):
             'code': ('exact',),
         }
 
-class DraftViewset(viewsets.ReadOnlyModelViewSet):
+class DraftViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Draft.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     filter_class = DraftFilter
     # It is not checked whether this user is the same as the saver. Maybe (for helpers) it is not needed really.
@@ -67,9 +69,9 @@ class DraftViewset(viewsets.ReadOnlyModelViewSet):
 #           return DetailDraftSerializer
         ordering_fields = ('name',)
 
-class FormViewset(viewsets.ReadOnlyModelViewSet):
+class FormViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Form.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -95,11 +97,11 @@ class FormDataFilter(filters.FilterSet):
             'form': ('exact', 'gt', 'gte', 'lt', 'lte'),
         }
 
-class FormDataViewset(viewsets.ReadOnlyModelViewSet):
+class FormDataViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """Can use 'new' GET parameter for using data only after the last due_date"""
     # Duplicate of PERDocsViewset
     queryset = FormData.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -132,10 +134,10 @@ class FormDataViewset(viewsets.ReadOnlyModelViewSet):
 #           return DetailFormDataSerializer
         ordering_fields = ('name',)
 
-class FormCountryViewset(viewsets.ReadOnlyModelViewSet):
+class FormCountryViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """shows the (PER editable) countries for a user."""
     queryset = Country.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -153,11 +155,11 @@ class PERDocsFilter(filters.FilterSet):
             'id': ('exact',),
         }
 
-class PERDocsViewset(viewsets.ReadOnlyModelViewSet):
+class PERDocsViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """ To collect PER Documents """
     # Duplicate of FormDataViewset
     queryset = NiceDocument.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -227,10 +229,10 @@ class PERDocsViewset(viewsets.ReadOnlyModelViewSet):
 #                        return queryset
 #        return User.objects.none()
 
-class FormStatViewset(viewsets.ReadOnlyModelViewSet):
+class FormStatViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """Shows name, code, country_id, language of filled forms"""
     queryset = Form.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
 
     def get_queryset(self):
         queryset =  Form.objects.all()
@@ -243,10 +245,10 @@ class FormStatViewset(viewsets.ReadOnlyModelViewSet):
 #           return DetailFormSerializer
         ordering_fields = ('name',)
 
-class FormPermissionViewset(viewsets.ReadOnlyModelViewSet):
+class FormPermissionViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """Shows if a user has permission to PER frontend tab or not"""
     queryset = Country.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     get_request_user_regions = RegionRestrictedAdmin.get_request_user_regions
     get_filtered_queryset = RegionRestrictedAdmin.get_filtered_queryset
@@ -259,7 +261,7 @@ class FormPermissionViewset(viewsets.ReadOnlyModelViewSet):
         else:
             return Country.objects.none()
 
-class CountryDuedateViewset(viewsets.ReadOnlyModelViewSet):
+class CountryDuedateViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """Countries and their forms which were submitted since last due date"""
     queryset = Form.objects.all()
     country = MiniCountrySerializer
@@ -279,7 +281,7 @@ class CountryDuedateViewset(viewsets.ReadOnlyModelViewSet):
         else:
             return Form.objects.none()
 
-class EngagedNSPercentageViewset(viewsets.ReadOnlyModelViewSet):
+class EngagedNSPercentageViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """National Societies engaged in per process"""
     queryset = Region.objects.all()
     # Some parts can be seen by public | NO authentication_classes = (TokenAuthentication,)
@@ -312,10 +314,10 @@ class EngagedNSPercentageViewset(viewsets.ReadOnlyModelViewSet):
         # [{'id': 0, 'country__count': 49, 'forms_sent': 0}, {'id': 1, 'country__count': 35, 'forms_sent': 1}...
         return result
 
-class GlobalPreparednessViewset(viewsets.ReadOnlyModelViewSet):
+class GlobalPreparednessViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """Global Preparedness Highlights"""
     queryset = Form.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = GlobalPreparednessSerializer
 
@@ -347,7 +349,7 @@ class NSPhaseFilter(filters.FilterSet):
             'updated_at': ('exact', 'gt', 'gte', 'lt', 'lte'),
         }
 
-class NSPhaseViewset(viewsets.ReadOnlyModelViewSet):
+class NSPhaseViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """NS PER Process Phase Viewset"""
     queryset = NSPhase.objects.all()
     # Some parts can be seen by public | NO authentication_classes = (TokenAuthentication,)
@@ -380,7 +382,7 @@ class WorkPlanFilter(filters.FilterSet):
             'id': ('exact',),
         }
 
-class WorkPlanViewset(viewsets.ReadOnlyModelViewSet):
+class WorkPlanViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """ PER Work Plan Viewset"""
     queryset = WorkPlan.objects.all()
     # Some parts can be seen by public | NO authentication_classes = (TokenAuthentication,)
@@ -397,7 +399,7 @@ class OverviewFilter(filters.FilterSet):
             'id': ('exact',),
         }
 
-class OverviewViewset(viewsets.ReadOnlyModelViewSet):
+class OverviewViewset(StreamingCSVMixin, PrefetchPlannerMixin, viewsets.ReadOnlyModelViewSet):
     """ PER Overview Viewset"""
     queryset = Overview.objects.all()
     # Some parts can be seen by public | NO authentication_classes = (TokenAuthentication,)
@@ -407,7 +409,7 @@ class OverviewViewset(viewsets.ReadOnlyModelViewSet):
 
 class OverviewStrictViewset(OverviewViewset):
     """ PER Overview Viewset - strict"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     serializer_class = OverviewSerializer
 
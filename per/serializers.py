@@ -5,46 +5,46 @@ from .models import (
     Draft, Form, FormData, NSPhase, WorkPlan, Overview, NiceDocument
 )
 from api.serializers import (
-    RegoCountrySerializer, UserSerializer
+    DynamicFieldsModelSerializer, RegoCountrySerializer, UserSerializer
 )
 
-class ListDraftSerializer(serializers.ModelSerializer):
+class ListDraftSerializer(DynamicFieldsModelSerializer):
     user = UserSerializer()
     country = RegoCountrySerializer()
     class Meta:
         model = Draft
         fields = ('country', 'code', 'user', 'data', 'id',)
 
-class FormStatSerializer(serializers.ModelSerializer):
+class FormStatSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Form
         fields = ('name', 'code', 'country_id', 'language', 'id',)
 
-class ListFormSerializer(serializers.ModelSerializer):
+class ListFormSerializer(DynamicFieldsModelSerializer):
     country = RegoCountrySerializer()
     user = UserSerializer()
     class Meta:
         model = Form
         fields = ('name', 'code', 'updated_at', 'user', 'country', 'language', 'id',)
 
-class ListFormDataSerializer(serializers.ModelSerializer):
+class ListFormDataSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = FormData
         fields = ('form', 'question_id', 'selected_option', 'notes')
 
-class ListNiceDocSerializer(serializers.ModelSerializer):
+class ListNiceDocSerializer(DynamicFieldsModelSerializer):
     country = RegoCountrySerializer()
     class Meta:
         model = NiceDocument
         fields = ('name', 'country', 'document', 'document_url', 'visibility')
 
-class ShortFormSerializer(serializers.ModelSerializer):
+class ShortFormSerializer(DynamicFieldsModelSerializer):
     country = RegoCountrySerializer()
     class Meta:
         model = Form
         fields = ('name', 'code', 'updated_at', 'country', 'language', 'id',)
 
-class EngagedNSPercentageSerializer(serializers.ModelSerializer):
+class EngagedNSPercentageSerializer(DynamicFieldsModelSerializer):
     country__count = serializers.IntegerField()
     forms_sent = serializers.IntegerField()
     class Meta:
@@ -58,23 +58,23 @@ class GlobalPreparednessSerializer(serializers.Serializer):
     class Meta:
         fields = ('id', 'code', 'question_id',)
 
-class NSPhaseSerializer(serializers.ModelSerializer):
+class NSPhaseSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = NSPhase
         fields = ('id', 'country', 'phase', 'updated_at')
 
-class MiniUserSerializer(serializers.ModelSerializer):
+class MiniUserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'first_name', 'last_name', 'email')
 
-class WorkPlanSerializer(serializers.ModelSerializer):
+class WorkPlanSerializer(DynamicFieldsModelSerializer):
     user = MiniUserSerializer()
     class Meta:
         model = WorkPlan
         fields = '__all__'
 
-class OverviewSerializer(serializers.ModelSerializer):
+class OverviewSerializer(DynamicFieldsModelSerializer):
     user = MiniUserSerializer()
     country = RegoCountrySerializer()
     class Meta:
@@ -7,11 +7,10 @@ from api.views import (
     PublicJsonRequestView,
 )
 from rest_framework import viewsets
-from django.contrib.auth.models import User
 from .models import (
     Draft, Form, FormData, WorkPlan, Overview
 )
-from rest_framework.authtoken.models import Token
+from api.authentication import get_token_user
 
 def create_draft(raw):
     Draft.objects.filter(code=raw['code'], country_id=raw['country_id'], user_id=raw['user_id']).delete()  # If exists (a previous draft), delete it.
@@ -170,11 +169,10 @@ class FormEdit(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            token_user = get_token_user(richtokenstring[6:])
+            if token_user is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
+            u = token_user if token_user.is_active else None
         else:
             return bad_request('User token is not given.')
         if not u:
@@ -223,11 +221,10 @@ class DraftSent(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            token_user = get_token_user(richtokenstring[6:])
+            if token_user is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
+            u = token_user if token_user.is_active else None
         else:
             return bad_request('User token is not given.')
         if not u:
@@ -279,11 +276,10 @@ class WorkPlanSent(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            token_user = get_token_user(richtokenstring[6:])
+            if token_user is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
+            u = token_user if token_user.is_active else None
         else:
             return bad_request('User token is not given.')
         if not u:
@@ -339,11 +335,10 @@ class OverviewSent(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            token_user = get_token_user(richtokenstring[6:])
+            if token_user is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
+            u = token_user if token_user.is_active else None
         else:
             return bad_request('User token is not given.')
         if not u:
@@ -375,11 +370,10 @@ class DelWorkPlan(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            token_user = get_token_user(richtokenstring[6:])
+            if token_user is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
+            u = token_user if token_user.is_active else None
             #origtoken = Token.objects.get_or_create(user=u)
         else:
             return bad_request('User token is not given.')
@@ -410,11 +404,10 @@ class DelOverview(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            token_user = get_token_user(richtokenstring[6:])
+            if token_user is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
+            u = token_user if token_user.is_active else None
         else:
             return bad_request('User token is not given.')
         if not u:
@@ -439,11 +432,10 @@ class DelDraft(PublicJsonPostView):
         u = None
         richtokenstring = request.META.get('HTTP_AUTHORIZATION')
         if richtokenstring:
-            try:
-                receivedtoken = Token.objects.get(key=richtokenstring[6:])
-            except:
+            token_user = get_token_user(richtokenstring[6:])
+            if token_user is None:
                 return bad_request('User token is not correct.')
-            u = User.objects.filter(is_active=True, pk=receivedtoken.user_id)
+            u = token_user if token_user.is_active else None
         else:
             return bad_request('User token is not given.')
         if not u: